@@ -0,0 +1,281 @@
+"""Streams device log exports.
+
+Rows are read with QuerySet.iterator(chunk_size), which uses a server-side cursor on
+PostgreSQL, written to a small buffer and sent to the client whenever the buffer is full - so
+memory use depends on the chunk and buffer sizes, not the number of rows exported.
+
+CSV exports hold the raw messages. The other formats hold the messages' ZigbeeLog metadata
+pivoted to one column (or key) per field, oldest message first:
+    ndjson  - a JSON object per line
+    parquet - Parquet file, zstd compressed
+    arrow   - Arrow IPC stream, zstd compressed
+Parquet and Arrow are written with pyarrow, which is optional - they are offered when it is
+installed. The schema is worked out before any row is streamed, from the catalog of the
+devices' fields (ZigbeeDeviceField): booleans, numbers (as float64), text or objects - which
+are written as JSON text. Fields missing from the catalog are text, and values which do not
+match their column's type are written as null."""
+import csv
+import datetime
+import io
+import zlib
+from typing import Dict, Iterable, Iterator, List, Sequence
+
+from django.apps import apps
+from django.db.models import QuerySet
+from django.http import StreamingHttpResponse
+
+from smarthub.settings import DEVICE_LOG_EXPORT_CHUNK_SIZE
+
+from ..mqtt import codec
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# bytes buffered before a chunk is sent to the client
+BUFFER_SIZE = 64 * 1024
+
+# format -> (content type, file extension)
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+}
+# formats written with pyarrow - these are compressed by the format itself
+COLUMNAR_FORMATS = ("parquet", "arrow")
+
+# ZigbeeDeviceField value types (zigbee.models.FieldType)
+FIELD_TYPE_BOOLEAN = "boolean"
+FIELD_TYPE_NUMBER = "number"
+FIELD_TYPE_TEXT = "text"
+
+
+def iter_rows(
+    queryset: QuerySet, fields: Sequence[str], chunk_size: int = None
+) -> Iterator[tuple]:
+    """Yield the values of fields for each object - model instances are not created"""
+    return queryset.values_list(*fields).iterator(
+        chunk_size=chunk_size or DEVICE_LOG_EXPORT_CHUNK_SIZE
+    )
+
+
+def iter_csv(
+    rows: Iterable[Sequence], header: Sequence[str], buffer_size: int = BUFFER_SIZE
+) -> Iterator[bytes]:
+    """Yield rows as CSV (in the format written by django-csv-export-view, which was used
+    previously), buffer_size bytes at a time"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, dialect="excel", quoting=csv.QUOTE_ALL)
+
+    # separator line - read by Excel
+    buffer.write(f"sep={writer.dialect.delimiter}{writer.dialect.lineterminator}")
+    writer.writerow(header)
+
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= buffer_size:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def iter_gzip(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Yield chunks compressed as one gzip file"""
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def get_logs(messages: QuerySet) -> QuerySet:
+    """Return the ZigbeeLogs of messages, ordered by message"""
+    return (
+        apps.get_model("zigbee", "ZigbeeLog")
+        .objects.filter(broker_message__in=messages.order_by().values("pk"))
+        .order_by("broker_message__created_at", "broker_message_id")
+    )
+
+
+def get_field_types(messages: QuerySet, fields: Sequence[str]) -> Dict[str, str]:
+    """Return field -> FieldType for the fields, from the catalog of the messages' zigbee
+    devices - text if a field is not catalogued or the devices do not agree on its type"""
+    field_model = apps.get_model("zigbee", "ZigbeeDeviceField")
+    catalog = field_model.objects.filter(
+        zigbee_device__in=messages.order_by().values("zigbee_device_id"),
+        name__in=fields,
+    ).values_list("name", "value_type")
+
+    field_types = {}
+    for name, value_type in catalog:
+        if field_types.setdefault(name, value_type) != value_type:
+            field_types[name] = FIELD_TYPE_TEXT
+    return {field: field_types.get(field, FIELD_TYPE_TEXT) for field in fields}
+
+
+def get_log_fields(logs: QuerySet) -> List[str]:
+    """Return the metadata fields found in logs, by name"""
+    return list(
+        logs.order_by("metadata_type")
+        .values_list("metadata_type", flat=True)
+        .distinct()
+    )
+
+
+def iter_pivoted(logs: QuerySet, chunk_size: int = None) -> Iterator[dict]:
+    """Yield {"created_at": received at, field: value, ...} for each message in logs"""
+    rows = logs.values_list(
+        "broker_message_id",
+        "broker_message__created_at",
+        "metadata_type",
+        "metadata_value",
+    ).iterator(chunk_size=chunk_size or DEVICE_LOG_EXPORT_CHUNK_SIZE)
+
+    message_id, pivoted = None, None
+    for row_message_id, created_at, field, value in rows:
+        if row_message_id != message_id:
+            if pivoted is not None:
+                yield pivoted
+            message_id, pivoted = row_message_id, {"created_at": created_at}
+        pivoted[field] = value
+
+    if pivoted is not None:
+        yield pivoted
+
+
+def iter_ndjson(
+    rows: Iterable[dict], buffer_size: int = BUFFER_SIZE
+) -> Iterator[bytes]:
+    """Yield rows as newline delimited JSON, buffer_size bytes at a time"""
+    buffer = io.StringIO()
+    for row in rows:
+        row["created_at"] = row["created_at"].isoformat()
+        buffer.write(codec.dumps(row))
+        buffer.write("\n")
+        if buffer.tell() >= buffer_size:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+class ChunkSink(io.RawIOBase):
+    """Write-only file holding what has been written since it was last drained - lets pyarrow
+    writers be streamed"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.chunks = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def drain(self) -> bytes:
+        """Return (and forget) the bytes written since the last drain"""
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+def get_column_type(field_type: str):
+    """Return the arrow type of a column holding values of a FieldType - objects are text"""
+    if field_type == FIELD_TYPE_BOOLEAN:
+        return pyarrow.bool_()
+    if field_type == FIELD_TYPE_NUMBER:
+        return pyarrow.float64()
+    return pyarrow.string()
+
+
+def to_column_value(value, column_type):
+    """Return value as the column's type - None if it does not match"""
+    if value is None:
+        return None
+    if column_type == pyarrow.bool_():
+        return value if isinstance(value, bool) else None
+    if column_type == pyarrow.float64():
+        return float(value) if type(value) in (int, float) else None
+    if isinstance(value, str):
+        return value
+    return codec.dumps(value) if isinstance(value, (dict, list)) else None
+
+
+def iter_columnar(
+    rows: Iterable[dict],
+    field_types: Dict[str, str],
+    export_format: str,
+    batch_size: int = None,
+) -> Iterator[bytes]:
+    """Yield rows as a Parquet file or Arrow IPC stream, a batch of rows at a time - with a
+    column per field of field_types (field -> FieldType, see get_field_types())"""
+    batch_size = batch_size or DEVICE_LOG_EXPORT_CHUNK_SIZE
+    sink = ChunkSink()
+    fields = list(field_types)
+    schema = pyarrow.schema(
+        [("created_at", pyarrow.timestamp("us", tz="UTC"))]
+        + [(field, get_column_type(field_types[field])) for field in fields]
+    )
+    if export_format == "parquet":
+        writer = pyarrow.parquet.ParquetWriter(sink, schema, compression="zstd")
+    else:
+        writer = pyarrow.ipc.new_stream(
+            sink, schema, options=pyarrow.ipc.IpcWriteOptions(compression="zstd")
+        )
+
+    def write(batch: List[dict]) -> None:
+        columns: Dict[str, list] = {
+            "created_at": [
+                row["created_at"].astimezone(datetime.timezone.utc) for row in batch
+            ]
+        }
+        for field in fields:
+            column_type = schema.field(field).type
+            columns[field] = [
+                to_column_value(row.get(field), column_type) for row in batch
+            ]
+        writer.write_table(pyarrow.Table.from_pydict(columns, schema=schema))
+
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            write(batch)
+            batch = []
+            yield sink.drain()
+
+    if batch:
+        write(batch)
+    writer.close()
+    yield sink.drain()
+
+
+def streaming_response(
+    chunks: Iterable[bytes], filename: str, content_type: str, compress: bool = False
+) -> StreamingHttpResponse:
+    """Return response sending chunks as an attachment - gzipped if compress is set"""
+    if compress:
+        chunks = iter_gzip(chunks)
+        content_type = "application/gzip"
+        filename = f"{filename}.gz"
+
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
@@ -1,7 +1,10 @@
 """Custom forms for handling creation of devices and device states"""
 from django import forms
 
-from . import models
+from smarthub.settings import DEVICE_SERIES_MAX_POINTS, DEVICE_SERIES_POINTS
+
+from ..zigbee import downsample
+from . import exports, models
 
 
 class DeviceForm(forms.ModelForm):
@@ -45,3 +48,62 @@ class DeviceStateForm(forms.ModelForm):
         )  # get the actual hardware device and store it (e.g. zigbee/api)
 
         super().save(commit=commit)
+
+
+class DateRangeForm(forms.Form):
+    """Date range filter - read from the query string"""
+
+    start = forms.DateTimeField(required=False)
+    end = forms.DateTimeField(required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start, end = cleaned_data.get("start"), cleaned_data.get("end")
+
+        if start and end and start > end:
+            raise forms.ValidationError("Start must be before end")
+        return cleaned_data
+
+    def filter(self, queryset, field: str = "created_at"):
+        """Return queryset limited to the date range"""
+        if self.cleaned_data.get("start"):
+            queryset = queryset.filter(**{f"{field}__gte": self.cleaned_data["start"]})
+        if self.cleaned_data.get("end"):
+            queryset = queryset.filter(**{f"{field}__lte": self.cleaned_data["end"]})
+        return queryset
+
+
+class DeviceLogExportForm(DateRangeForm):
+    """Filters for device log exports - read from the query string"""
+
+    format = forms.ChoiceField(
+        choices=[(name, name) for name in exports.FORMATS], required=False
+    )
+    gzip = forms.BooleanField(required=False)
+
+    def clean_format(self):
+        export_format = self.cleaned_data["format"] or "csv"
+
+        if export_format in exports.COLUMNAR_FORMATS and exports.pyarrow is None:
+            raise forms.ValidationError(f"{export_format} export is not available")
+        return export_format
+
+
+class DeviceSeriesForm(DateRangeForm):
+    """Options for device time series - read from the query string"""
+
+    field = forms.CharField(max_length=100)
+    points = forms.IntegerField(
+        required=False,
+        min_value=downsample.MIN_THRESHOLD,
+        max_value=DEVICE_SERIES_MAX_POINTS,
+    )
+    method = forms.ChoiceField(
+        choices=[(name, name) for name in downsample.METHODS], required=False
+    )
+
+    def clean_points(self):
+        return self.cleaned_data["points"] or DEVICE_SERIES_POINTS
+
+    def clean_method(self):
+        return self.cleaned_data["method"] or "lttb"
@@ -9,6 +9,7 @@ from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import EmptyResultSet, ObjectDoesNotExist
 from django.db import models
+from django.db.models import Count, Exists, F, Max, OuterRef, Subquery
 from django.db.models.constraints import UniqueConstraint
 from django.db.models.query import QuerySet
 from django.db.models.query_utils import Q
@@ -21,7 +22,12 @@ logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
 if TYPE_CHECKING:
-    from ..zigbee.models import ZigbeeDevice, ZigbeeLog, ZigbeeMessage
+    from ..zigbee.models import (
+        DeviceLatestState,
+        ZigbeeDevice,
+        ZigbeeLog,
+        ZigbeeMessage,
+    )
 
 
 class DeviceProtocol(models.TextChoices):
@@ -56,6 +62,27 @@ class DeviceLocationsQuerySet(models.QuerySet):
             location=location, protocol=DeviceProtocol.API
         ).count()
 
+    def with_device_totals(self):
+        """Annotate the number of devices, linked devices and devices per protocol in each
+        location - counted in the same query as the locations, so lists need no query per row"""
+        # devices are joined to their zigbee devices, so only distinct devices are counted
+        return self.annotate(
+            device_count=Count("device", distinct=True),
+            linked_device_count=Count(
+                "device",
+                filter=Q(device__zigbeedevice__isnull=False),
+                distinct=True,
+            ),
+            zigbee_device_count=Count(
+                "device",
+                filter=Q(device__protocol=DeviceProtocol.ZIGBEE),
+                distinct=True,
+            ),
+            api_device_count=Count(
+                "device", filter=Q(device__protocol=DeviceProtocol.API), distinct=True
+            ),
+        )
+
 
 class DeviceLocationManager(models.Manager.from_queryset(DeviceLocationsQuerySet)):
     """Custom object manager"""
@@ -102,6 +129,10 @@ class DeviceLocation(BaseAbstractModel):
 
     def total_linked_devices(self) -> int:
         """Return number of user's linked devices in specified location"""
+        if hasattr(self, "linked_device_count"):
+            # annotated by DeviceLocationsQuerySet.with_device_totals()
+            return self.linked_device_count
+
         total = 0
 
         try:
@@ -120,6 +151,25 @@ class DeviceQuerySet(models.QuerySet):
         """Return event triggers the object is assocaited with"""
         return self.filter(eventtrigger_set__is_enabled=True)
 
+    def with_linked_status(self):
+        """Annotate whether each device is linked to a zigbee device, whether that device is
+        controllable and when it was last seen - is_linked(), is_controllable() and
+        last_communication() use the annotations, so device lists need no query per row"""
+        zigbee_devices = apps.get_model("zigbee", "ZigbeeDevice").objects.filter(
+            device=OuterRef("pk")
+        )
+        newest_first = F("last_seen_at").desc(nulls_last=True)
+
+        return self.select_related("location").annotate(
+            zigbee_linked=Exists(zigbee_devices),
+            zigbee_controllable=Subquery(
+                zigbee_devices.order_by("created_at").values("is_controllable")[:1]
+            ),
+            zigbee_last_seen_at=Subquery(
+                zigbee_devices.order_by(newest_first).values("last_seen_at")[:1]
+            ),
+        )
+
 
 class DeviceManager(models.Manager.from_queryset(DeviceQuerySet)):
     """Customer object manager"""
@@ -247,6 +297,25 @@ class Device(BaseAbstractModel):
         """Returns the parsed logs eminating from the last ZigbeeMessage received"""
         return self.get_zigbee_logs(latest_only=True)
 
+    def get_latest_state(self) -> Union["DeviceLatestState", None]:
+        """Return the newest value of each field reported by the linked zigbee device - read
+        from the latest state table rather than the message history, by its primary key (the
+        zigbee device id). Zigbee devices already prefetched are reused."""
+        latest_state_model = apps.get_model("zigbee", "DeviceLatestState")
+        zigbee_devices = getattr(self, "_prefetched_objects_cache", {}).get(
+            "zigbeedevice_set"
+        )
+        if zigbee_devices is None:
+            zigbee_device_ids = self.zigbeedevice_set.values("pk")
+        else:
+            zigbee_device_ids = [zigbee_device.pk for zigbee_device in zigbee_devices]
+
+        return (
+            latest_state_model.objects.filter(pk__in=zigbee_device_ids)
+            .order_by("-last_message_at")
+            .first()
+        )
+
     def try_to_link_zigbee_device(self) -> None:
         """Filters ZigbeeDevice objects with device friendly_name and device_identifier to see if
         there are any unlinked matches - which will be then linked to the current device."""
@@ -308,10 +377,15 @@ class Device(BaseAbstractModel):
 
     def is_linked(self) -> bool:
         """Returns true if user device is linked to a hardware device"""
+        if hasattr(self, "zigbee_linked"):
+            # annotated by DeviceQuerySet.with_linked_status()
+            return self.zigbee_linked
         return self.get_linked_device() is not None
 
     def is_controllable(self) -> bool:
         """Returns true if the underlying hardware device can be controlled"""
+        if hasattr(self, "zigbee_controllable"):
+            return bool(self.zigbee_controllable)
         if self.is_linked:
             try:
                 linked_device = self.get_linked_device()
@@ -325,17 +399,16 @@ class Device(BaseAbstractModel):
         return reverse("devices:device:detail", kwargs={"uuid": self.uuid})
 
     def last_communication(self) -> str:
-        """Returns the date and time of the most recent communication from the hardware device"""
-        received_at: str = ""
-        try:
-            last_message = self.get_zigbee_messages(latest_only=True)[0]
-            received_at = last_message.created_at
-
-        except Exception as ex:
-            logger.info(ex)
-            received_at = "-"
-
-        return received_at
+        """Returns the date and time the hardware device was last seen (see zigbee/seen.py)"""
+        if hasattr(self, "zigbee_last_seen_at"):
+            # annotated by DeviceQuerySet.with_linked_status()
+            last_seen_at = self.zigbee_last_seen_at
+        else:
+            last_seen_at = self.zigbeedevice_set.aggregate(
+                last_seen_at=Max("last_seen_at")
+            )["last_seen_at"]
+
+        return last_seen_at or "-"
 
     def get_event_triggers(self) -> "QuerySet":
         """Return all enabled event triggers that object is related to"""
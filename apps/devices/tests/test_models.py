@@ -1,11 +1,13 @@
 from typing import Tuple
 
+from django.db import connection
 from django.db.models.query import QuerySet
 from django.test.testcases import TestCase
+from django.test.utils import CaptureQueriesContext
 
-from ...devices.models import DeviceProtocol
+from ...devices.models import Device, DeviceProtocol
 from ...events.tests.factories import EventTriggerFactory
-from ...zigbee.models import ZigbeeDevice, ZigbeeLog
+from ...zigbee.models import DeviceLatestState, ZigbeeDevice, ZigbeeLog
 from ...zigbee.tests.factories import (ZigbeeDeviceFactory, ZigbeeLogFactory,
                                        ZigbeeMessageFactory)
 from .factories import (DeviceFactory, DeviceLocationFactory, UserFactory,
@@ -192,6 +194,43 @@ class TestDeviceGetZigbeeLogs(DeviceTestMixin):
                 self.assertTrue(device_log in last_msg_logs)
 
 
+class TestDeviceGetLatestState(DeviceTestMixin):
+    def test_returns_none_when_device_has_no_state(self):
+        ZigbeeDeviceFactory(device=self.device)
+
+        self.assertIsNone(self.device.get_latest_state())
+
+    def test_returns_state_of_linked_zigbee_device(self):
+        zb_device = ZigbeeDeviceFactory(device=self.device)
+        message = ZigbeeMessageFactory(zigbee_device=zb_device)
+        DeviceLatestState.objects.upsert(message, {"state": "ON"})
+        DeviceLatestState.objects.upsert(
+            ZigbeeMessageFactory(zigbee_device=ZigbeeDeviceFactory()), {"state": "OFF"}
+        )
+
+        with self.assertNumQueries(1):
+            latest_state = self.device.get_latest_state()
+
+        self.assertEqual(latest_state.zigbee_device, zb_device)
+        self.assertEqual(latest_state.state["state"]["value"], "ON")
+
+    def test_prefetched_zigbee_devices_are_reused(self):
+        zb_device = ZigbeeDeviceFactory(device=self.device)
+        DeviceLatestState.objects.upsert(
+            ZigbeeMessageFactory(zigbee_device=zb_device), {"state": "ON"}
+        )
+        device = Device.objects.prefetch_related("zigbeedevice_set").get(
+            pk=self.device.pk
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            latest_state = device.get_latest_state()
+
+        self.assertEqual(latest_state.zigbee_device_id, zb_device.pk)
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn("zigbee_zigbeedevice", queries[0]["sql"])
+
+
 class TestDeviceGetLatestZigbeeLogs(DeviceTestMixin):
     def test_returns_none_when_device_not_linked(self):
         logs = self.device.get_latest_zigbee_logs()
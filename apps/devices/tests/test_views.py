@@ -1,18 +1,27 @@
+import csv
+import datetime
+import gzip
+import io
 import json
 import math
-from unittest import mock
+from unittest import mock, skipUnless
 from unittest.mock import MagicMock, PropertyMock, patch
 
+from django.db import connection
 from django.db.models.query import QuerySet
 from django.http.response import Http404
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 
 import factory
 
 from ...devices.models import DeviceProtocol, DeviceState
-from ...zigbee.models import ZigbeeDevice, ZigbeeLog, ZigbeeMessage
-from ...zigbee.tests.factories import (ZigbeeDeviceFactory, ZigbeeLogFactory,
-                                       ZigbeeMessageFactory)
+from ...zigbee.models import FieldType, ZigbeeDevice, ZigbeeLog, ZigbeeMessage
+from ...zigbee.tests.factories import (ZigbeeDeviceFactory,
+                                       ZigbeeDeviceFieldFactory,
+                                       ZigbeeLogFactory, ZigbeeMessageFactory)
+from .. import exports
 from .factories import (DeviceFactory, DeviceLocationFactory, UserFactory,
                         ZigbeeDeviceStateFactory)
 from .helpers import TestCaseWithHelpers
@@ -95,6 +104,41 @@ class TestListDevices(TestCaseWithHelpers):
         )
 
 
+    def create_linked_devices(self, amount):
+        for _ in range(amount):
+            device = DeviceFactory(user=self.user)
+            ZigbeeDeviceFactory(
+                device=device, is_controllable=True, last_seen_at=timezone.now()
+            )
+
+    def get_total_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_queries_do_not_grow_with_devices(self):
+        self.create_linked_devices(2)
+        total_queries = self.get_total_queries()
+
+        self.create_linked_devices(10)
+
+        self.assertEqual(self.get_total_queries(), total_queries)
+
+    def test_last_seen_at_is_displayed(self):
+        device = DeviceFactory(user=self.user)
+        ZigbeeDeviceFactory(device=device, last_seen_at=timezone.now())
+        DeviceFactory(user=self.user)
+
+        response = self.client.get(self.url)
+
+        devices = list(response.context["devices"])
+        self.assertEqual(devices[0].last_communication(), device.last_communication())
+        self.assertNotEqual(devices[0].last_communication(), "-")
+        self.assertEqual(devices[1].last_communication(), "-")
+        self.assertContains(response, "Not Linked", count=1)
+
+
 class TestDetailDevice(TestCaseWithHelpers):
     def setUp(self) -> None:
         self.user = UserFactory()
@@ -680,30 +724,11 @@ class TestDeviceMetadata(TestCaseWithHelpers):
 
     def test_metadata_is_returned_ordered_alphabetically_and_unique_values_only(self):
         zb_device = ZigbeeDeviceFactory(device=self.device)
-        zb_message = ZigbeeMessageFactory(
-            zigbee_device=zb_device, raw_message="{'test': '1234'}"
-        )
         # create metadata
-        ZigbeeLogFactory(
-            broker_message=zb_message, metadata_type="state", metadata_value="on"
-        )
-        ZigbeeLogFactory(
-            broker_message=zb_message, metadata_type="state", metadata_value="off"
-        )
-        ZigbeeLogFactory(
-            broker_message=zb_message, metadata_type="occupancy", metadata_value="false"
-        )
-        ZigbeeLogFactory(
-            broker_message=zb_message,
-            metadata_type="temperature",
-            metadata_value="21.2",
-        )
-        ZigbeeLogFactory(
-            broker_message=zb_message, metadata_type="humidity", metadata_value="61.3"
-        )
-        ZigbeeLogFactory(
-            broker_message=zb_message, metadata_type="occupancy", metadata_value="true"
-        )
+        for name in ("state", "occupancy", "temperature", "humidity"):
+            ZigbeeDeviceFieldFactory(zigbee_device=zb_device, name=name)
+        # other devices' fields are not listed
+        ZigbeeDeviceFieldFactory(name="battery")
 
         ordered_values = ["humidity", "occupancy", "state", "temperature"]
         expected_json_response = json.dumps({"data": ordered_values})
@@ -712,6 +737,25 @@ class TestDeviceMetadata(TestCaseWithHelpers):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.content.decode("utf-8"), expected_json_response)
 
+    def test_metadata_can_be_cached_and_revalidated(self):
+        zb_device = ZigbeeDeviceFactory(device=self.device)
+        ZigbeeDeviceFieldFactory(zigbee_device=zb_device, name="state")
+        url = reverse("devices:device:metadata", kwargs={"uuid": self.device.uuid})
+
+        response = self.client.get(url)
+        etag = response["ETag"]
+
+        self.assertIn("private", response["Cache-Control"])
+        self.assertIn("max-age", response["Cache-Control"])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # a new field changes the list
+        ZigbeeDeviceFieldFactory(zigbee_device=zb_device, name="temperature")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
     def test_anonymous_users_are_redirected_to_login_page(self):
         self.client.logout()
 
@@ -857,19 +901,57 @@ class TestLogsForDevice(TestCaseWithHelpers):
             FACTORY_CLASS=ZigbeeMessageFactory,
             zigbee_device=self.zb_device,
         )
+        url = reverse("devices:device:logs:view", kwargs={"uuid": self.device.uuid})
 
-        response = self.get_url_response(uuid=self.device.uuid)
+        response = self.get_url_response(url=url)
+        page = response.context["page_obj"]
 
-        all_msgs = ZigbeeMessage.objects.all()
-        total_msgs = all_msgs.count()
-        expected_pages = math.ceil(total_msgs / 15)
-        expected_html = f"""<span class="page-link">1 of {expected_pages}</span>"""
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(page), 15)
+        self.assertFalse(page.has_previous())
+        self.assertContains(response=response, text="About 61")
+
+        shown = []
+        pages = 1
+        while page.has_next():
+            shown.extend(message.pk for message in page)
+            response = self.get_url_response(url=f"{url}?cursor={page.next_cursor}")
+            page = response.context["page_obj"]
+            pages += 1
+        shown.extend(message.pk for message in page)
+
+        newest_first = ZigbeeMessage.objects.order_by("-created_at", "-pk")
+        self.assertEqual(pages, math.ceil(61 / 15))
+        self.assertEqual(shown, list(newest_first.values_list("pk", flat=True)))
+
+    def test_previous_page_is_the_page_before(self):
+        factory.create_batch(
+            klass=ZigbeeMessage,
+            size=30,
+            FACTORY_CLASS=ZigbeeMessageFactory,
+            zigbee_device=self.zb_device,
+        )
+        url = reverse("devices:device:logs:view", kwargs={"uuid": self.device.uuid})
 
-        self.assertContains(
-            response=response,
-            text=expected_html,
-            status_code=200,
+        first_page = self.get_url_response(url=url).context["page_obj"]
+        second_page = self.get_url_response(
+            url=f"{url}?cursor={first_page.next_cursor}"
+        ).context["page_obj"]
+        response = self.get_url_response(
+            url=f"{url}?cursor={second_page.previous_cursor}"
+        )
+
+        self.assertEqual(
+            list(response.context["page_obj"]), list(first_page.object_list)
         )
+        self.assertFalse(response.context["page_obj"].has_previous())
+
+    def test_invalid_cursor_returns_404(self):
+        url = reverse("devices:device:logs:view", kwargs={"uuid": self.device.uuid})
+
+        response = self.get_url_response(url=f"{url}?cursor=not-a-cursor")
+
+        self.assertEqual(response.status_code, 404)
 
     def test_logs_are_rendered_with_correct_template(self):
         response = self.get_url_response(uuid=self.device.uuid)
@@ -930,6 +1012,58 @@ class TestExportCSVDeviceLogs(TestCaseWithHelpers):
             'attachment; filename="zigbee-messages.csv"',
         )
 
+    def get_rows(self, response):
+        content = b"".join(response.streaming_content)
+        if response.get("Content-Type") == "application/gzip":
+            content = gzip.decompress(content)
+        return list(csv.reader(io.StringIO(content.decode("utf-8"))))
+
+    def test_csv_file_is_streamed(self):
+        response = self.get_url_response(uuid=self.device.uuid)
+        rows = self.get_rows(response)
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(rows[0], ["sep=,"])
+        self.assertEqual(rows[1], ["Created At", "Raw Message"])
+        self.assertEqual(len(rows), 12)
+
+    def test_logs_are_limited_to_date_range(self):
+        now = timezone.now()
+        messages = list(ZigbeeMessage.objects.order_by("pk"))
+        for days, message in enumerate(messages):
+            message.created_at = now - datetime.timedelta(days=days)
+        ZigbeeMessage.objects.bulk_update(messages, ["created_at"])
+
+        url = reverse("devices:device:logs:export", kwargs={"uuid": self.device.uuid})
+        start = (now - datetime.timedelta(days=3, hours=1)).isoformat()
+        end = (now - datetime.timedelta(days=1, hours=1)).isoformat()
+        response = self.client.get(url, {"start": start, "end": end})
+
+        # two days of logs, plus the separator and header
+        self.assertEqual(len(self.get_rows(response)), 4)
+
+    def test_csv_file_can_be_gzipped(self):
+        url = reverse("devices:device:logs:export", kwargs={"uuid": self.device.uuid})
+        response = self.client.get(url, {"gzip": "1"})
+
+        self.assertEqual(response.get("Content-Type"), "application/gzip")
+        self.assertEqual(
+            response.get("Content-Disposition"),
+            'attachment; filename="zigbee-messages.csv.gz"',
+        )
+        self.assertEqual(len(self.get_rows(response)), 12)
+
+    def test_invalid_date_range_returns_400(self):
+        url = reverse("devices:device:logs:export", kwargs={"uuid": self.device.uuid})
+
+        response = self.client.get(url, {"start": "not-a-date"})
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get(
+            url, {"start": "2021-09-02T00:00:00", "end": "2021-09-01T00:00:00"}
+        )
+        self.assertEqual(response.status_code, 400)
+
     def test_view_returns_404_when_there_are_no_messages(self):
         ZigbeeMessage.objects.all().delete()
 
@@ -952,6 +1086,196 @@ class TestExportCSVDeviceLogs(TestCaseWithHelpers):
         self.assertTrue(response.url.startswith(login_url))
 
 
+class TestExportDeviceLogFormats(TestCaseWithHelpers):
+    def setUp(self) -> None:
+        self.user = UserFactory()
+        self.client.force_login(user=self.user)
+
+        self.device = DeviceFactory(user=self.user)
+        self.zb_device = ZigbeeDeviceFactory(device=self.device)
+        self.url = reverse(
+            "devices:device:logs:export", kwargs={"uuid": self.device.uuid}
+        )
+        for name, value_type in (
+            ("temperature", FieldType.NUMBER),
+            ("state", FieldType.TEXT),
+            ("humidity", FieldType.NUMBER),
+        ):
+            ZigbeeDeviceFieldFactory(
+                zigbee_device=self.zb_device, name=name, value_type=value_type
+            )
+
+        self.now = now = timezone.now()
+        for number in range(3):
+            message = ZigbeeMessageFactory(zigbee_device=self.zb_device)
+            ZigbeeMessage.objects.filter(pk=message.pk).update(
+                created_at=now + datetime.timedelta(minutes=number)
+            )
+            ZigbeeLogFactory(
+                broker_message=message,
+                metadata_type="temperature",
+                metadata_value=20 + number,
+            )
+            ZigbeeLogFactory(
+                broker_message=message, metadata_type="state", metadata_value="ON"
+            )
+
+    def test_ndjson_has_a_line_per_message(self):
+        response = self.client.get(self.url, {"format": "ndjson", "gzip": "1"})
+        content = gzip.decompress(b"".join(response.streaming_content))
+        rows = [json.loads(line) for line in content.decode("utf-8").splitlines()]
+
+        self.assertEqual(response.get("Content-Type"), "application/gzip")
+        self.assertEqual(
+            response.get("Content-Disposition"),
+            'attachment; filename="zigbee-messages.ndjson.gz"',
+        )
+        self.assertEqual([row["temperature"] for row in rows], [20, 21, 22])
+        self.assertEqual({row["state"] for row in rows}, {"ON"})
+
+    @skipUnless(exports.pyarrow, "pyarrow is not installed")
+    def test_parquet_has_a_typed_column_per_field(self):
+        import pyarrow.parquet  # pylint: disable=import-outside-toplevel
+
+        response = self.client.get(self.url, {"format": "parquet"})
+        table = pyarrow.parquet.read_table(
+            io.BytesIO(b"".join(response.streaming_content))
+        )
+
+        self.assertEqual(table.column_names, ["created_at", "state", "temperature"])
+        self.assertEqual(str(table.schema.field("temperature").type), "double")
+        self.assertEqual(table.column("temperature").to_pylist(), [20.0, 21.0, 22.0])
+
+    @skipUnless(exports.pyarrow, "pyarrow is not installed")
+    @patch("apps.devices.exports.DEVICE_LOG_EXPORT_CHUNK_SIZE", 1)
+    def test_parquet_columns_are_typed_from_the_field_catalog(self):
+        import pyarrow.parquet  # pylint: disable=import-outside-toplevel
+
+        # humidity is only in the last batch, and one temperature is not a number
+        message = ZigbeeMessageFactory(zigbee_device=self.zb_device)
+        ZigbeeMessage.objects.filter(pk=message.pk).update(
+            created_at=self.now + datetime.timedelta(minutes=3)
+        )
+        ZigbeeLogFactory(
+            broker_message=message, metadata_type="humidity", metadata_value=55
+        )
+        ZigbeeLogFactory(
+            broker_message=message, metadata_type="temperature", metadata_value="n/a"
+        )
+
+        response = self.client.get(self.url, {"format": "parquet"})
+        table = pyarrow.parquet.read_table(
+            io.BytesIO(b"".join(response.streaming_content))
+        )
+
+        self.assertEqual(str(table.schema.field("humidity").type), "double")
+        self.assertEqual(
+            table.column("humidity").to_pylist(), [None, None, None, 55.0]
+        )
+        self.assertEqual(
+            table.column("temperature").to_pylist(), [20.0, 21.0, 22.0, None]
+        )
+
+    @skipUnless(exports.pyarrow, "pyarrow is not installed")
+    def test_arrow_stream_is_exported(self):
+        import pyarrow.ipc  # pylint: disable=import-outside-toplevel
+
+        response = self.client.get(self.url, {"format": "arrow"})
+        table = pyarrow.ipc.open_stream(
+            io.BytesIO(b"".join(response.streaming_content))
+        ).read_all()
+
+        self.assertEqual(table.num_rows, 3)
+
+    @patch("apps.devices.exports.pyarrow", None)
+    def test_columnar_formats_need_pyarrow(self):
+        response = self.client.get(self.url, {"format": "parquet"})
+
+        self.assertEqual(response.status_code, 400)
+
+
+class TestDeviceSeriesJson(TestCaseWithHelpers):
+    def setUp(self) -> None:
+        self.user = UserFactory()
+        self.client.force_login(user=self.user)
+
+        self.device = DeviceFactory(user=self.user)
+        self.zb_device = ZigbeeDeviceFactory(device=self.device)
+        self.url = reverse("devices:device:series", kwargs={"uuid": self.device.uuid})
+
+        self.start = timezone.now() - datetime.timedelta(hours=1)
+        for number in range(10):
+            message = ZigbeeMessageFactory(zigbee_device=self.zb_device)
+            ZigbeeMessage.objects.filter(pk=message.pk).update(
+                created_at=self.start + datetime.timedelta(minutes=number)
+            )
+            message.refresh_from_db()
+            ZigbeeLogFactory(
+                broker_message=message,
+                metadata_type="temperature",
+                metadata_value=20 + number,
+            )
+            ZigbeeLogFactory(
+                broker_message=message, metadata_type="state", metadata_value="ON"
+            )
+
+    def test_returns_numeric_values_oldest_first(self):
+        response = self.client.get(self.url, {"field": "temperature"})
+        content = response.json()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(content["total"], 10)
+        self.assertEqual([value for _, value in content["data"]], list(range(20, 30)))
+        self.assertAlmostEqual(
+            content["data"][0][0], self.start.timestamp() * 1000, places=0
+        )
+
+    def test_series_is_downsampled_to_points(self):
+        for method in ("lttb", "minmax"):
+            with self.subTest(method=method):
+                response = self.client.get(
+                    self.url, {"field": "temperature", "points": 4, "method": method}
+                )
+                content = response.json()
+
+                self.assertEqual(content["total"], 10)
+                self.assertEqual(len(content["data"]), 4)
+                self.assertEqual(content["data"][0][1], 20)
+                self.assertEqual(content["data"][-1][1], 29)
+
+    def test_series_is_limited_to_date_range(self):
+        start = self.start + datetime.timedelta(minutes=5)
+        response = self.client.get(
+            self.url, {"field": "temperature", "start": start.isoformat()}
+        )
+
+        self.assertEqual(
+            [value for _, value in response.json()["data"]], list(range(25, 30))
+        )
+
+    def test_non_numeric_fields_have_no_values(self):
+        response = self.client.get(self.url, {"field": "state"})
+
+        self.assertEqual(response.json()["data"], [])
+
+    def test_invalid_options_return_bad_request(self):
+        for params in (
+            {},
+            {"field": "temperature", "points": 2},
+            {"field": "temperature", "method": "average"},
+        ):
+            with self.subTest(params=params):
+                response = self.client.get(self.url, params)
+
+                self.assertEqual(response.status_code, 400)
+
+    def test_cannot_view_other_users_device_series(self):
+        url = reverse("devices:device:series", kwargs={"uuid": DeviceFactory().uuid})
+        response = self.client.get(url, {"field": "temperature"})
+
+        self.assertEqual(response.status_code, 404)
+
+
 class TestDeviceRedirectView(TestCaseWithHelpers):
     def setUp(self) -> None:
         self.user = UserFactory()
@@ -1219,6 +1543,46 @@ class TestListDeviceLocations(TestCaseWithHelpers):
             text=f"<td>4321</td>",
         )
 
+    def create_locations(self, amount):
+        for _ in range(amount):
+            location = DeviceLocationFactory(user=self.user)
+            DeviceFactory(user=self.user, location=location)
+            ZigbeeDeviceFactory(
+                device=DeviceFactory(user=self.user, location=location)
+            )
+
+    def get_total_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_queries_do_not_grow_with_locations(self):
+        self.create_locations(2)
+        total_queries = self.get_total_queries()
+
+        self.create_locations(5)
+
+        self.assertEqual(self.get_total_queries(), total_queries)
+
+    def test_location_totals_are_annotated(self):
+        location = DeviceLocationFactory(user=self.user)
+        DeviceFactory(user=self.user, location=location, protocol=DeviceProtocol.API)
+        for _ in range(2):
+            ZigbeeDeviceFactory(
+                device=DeviceFactory(
+                    user=self.user, location=location, protocol=DeviceProtocol.ZIGBEE
+                )
+            )
+
+        response = self.client.get(self.url)
+        location = response.context["device_locations"][0]
+
+        self.assertEqual(location.device_count, 3)
+        self.assertEqual(location.total_linked_devices(), 2)
+        self.assertEqual(location.zigbee_device_count, 2)
+        self.assertEqual(location.api_device_count, 1)
+
 
 class TestDetailDeviceLocation(TestCaseWithHelpers):
     def setUp(self) -> None:
@@ -1290,6 +1654,40 @@ class TestDetailDeviceLocation(TestCaseWithHelpers):
         self.assertEqual(response.status_code, 200)
         self.assert_values_in_reponse(response=response, values=values)
 
+    def test_protocol_totals_are_displayed(self):
+        DeviceFactory(
+            user=self.user, location=self.location, protocol=DeviceProtocol.API
+        )
+        DeviceFactory(
+            user=self.user, location=self.location, protocol=DeviceProtocol.ZIGBEE
+        )
+        total_devices = self.location.device_set.count()
+        total_zigbee = self.location.device_set.filter(
+            protocol=DeviceProtocol.ZIGBEE
+        ).count()
+
+        response = self.get_url_response()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["location"].device_count, total_devices)
+        self.assertEqual(response.context["total_zigbee"], total_zigbee)
+        self.assertEqual(response.context["total_api"], total_devices - total_zigbee)
+
+    def test_queries_do_not_grow_with_devices(self):
+        def get_total_queries():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.get_url_response()
+            self.assertEqual(response.status_code, 200)
+            return len(queries)
+
+        total_queries = get_total_queries()
+        for _ in range(3):
+            ZigbeeDeviceFactory(
+                device=DeviceFactory(user=self.user, location=self.location)
+            )
+
+        self.assertEqual(get_total_queries(), total_queries)
+
     def test_user_cannot_view_other_user_locations(self):
         new_user = UserFactory()
         self.client.force_login(user=new_user)
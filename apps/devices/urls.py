@@ -18,6 +18,10 @@ urlpatterns = [
                     path("delete/", views.DeleteDevice.as_view(), name="delete"),
                     path("metadata/", views.DeviceMetadata.as_view(), name="metadata"),
                     path("states/", views.DeviceStatesJson.as_view(), name="states"),
+                    path(
+                        "latest/", views.DeviceLatestStateJson.as_view(), name="latest"
+                    ),
+                    path("series/", views.DeviceSeriesJson.as_view(), name="series"),
                     path(
                         "logs/",
                         include(
@@ -28,7 +32,7 @@ urlpatterns = [
                                     ),
                                     path(
                                         "export/",
-                                        views.ExportCSVDeviceLogs.as_view(),
+                                        views.ExportDeviceLogs.as_view(),
                                         name="export",
                                     ),
                                 ],
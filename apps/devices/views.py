@@ -1,5 +1,6 @@
 """Handles user requests to devices app"""
 
+import hashlib
 import logging
 
 from django.apps import apps
@@ -7,21 +8,26 @@ from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.db.models.deletion import ProtectedError
 from django.db.utils import IntegrityError
-from django.http.response import Http404, HttpResponseRedirect, JsonResponse
+from django.http.response import (Http404, HttpResponseBadRequest,
+                                  HttpResponseRedirect, JsonResponse)
 from django.shortcuts import get_object_or_404
 from django.urls import reverse_lazy
 from django.urls.base import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
 from django.views.generic import (CreateView, DeleteView, DetailView, ListView,
                                   RedirectView, UpdateView)
 from django.views.generic.detail import BaseDetailView
 
-from csv_export.views import CSVExportView
+from smarthub.settings import DEVICE_METADATA_MAX_AGE
 
 from ..mixins import (AddUserToFormMixin, FormSuccessMessageMixin,
                       LimitResultsToUserMixin,
                       MakeRequestObjectAvailableInFormMixin)
+from ..pagination import CursorPaginationMixin
 from ..views import UUIDView
-from . import forms, models
+from ..zigbee import downsample
+from . import exports, forms, models
 from .mixins import (DeviceStateFormMixin, PermitDeviceOwnerOnly,
                      PermitObjectOwnerOnly)
 
@@ -68,17 +74,17 @@ class DetailDeviceLocation(LimitResultsToUserMixin, UUIDView, DetailView):
     context_object_name = "location"
     ordering = "created_at"
 
+    def get_queryset(self):
+        return super().get_queryset().with_device_totals()
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context["uuid"] = self.kwargs.get("uuid")
-        context[
-            "total_zigbee"
-        ] = models.DeviceLocation.objects.total_zigbee_by_location(
-            location=self.get_object()
-        )
-        context["total_api"] = models.DeviceLocation.objects.total_api_by_location(
-            location=self.get_object()
+        context["devices"] = self.object.device_set.with_linked_status().order_by(
+            "created_at"
         )
+        context["total_zigbee"] = self.object.zigbee_device_count
+        context["total_api"] = self.object.api_device_count
 
         return context
 
@@ -170,23 +176,112 @@ class DeviceMetadata(UUIDView, PermitObjectOwnerOnly, BaseDetailView):
         )
 
     def get(self, request, *args, **kwargs):
-        """Create JSON response with list of metadata fields from logs"""
+        """Create JSON response with list of metadata fields from the device's field catalog.
+        The response may be cached by the browser - and is revalidated with its ETag, as the
+        list only changes when the device reports a new field"""
         self.request = request
         device = self.get_object()
 
-        response_data = ("", "-----")
+        zb_model = apps.get_model("zigbee", "ZigbeeDevice")
+        fields = list(zb_model.objects.get_metadata_fields(device))
+        if not fields:
+            logger.info("Device has no metadata - %s", device)
 
-        try:
-            zb_model = apps.get_model("zigbee", "ZigbeeDevice")
-            metadata = zb_model.objects.get_metadata_fields(device)
+        response = JsonResponse({"data": fields or ["", "-----"]}, safe=False)
+        response["ETag"] = quote_etag(
+            hashlib.sha1("\n".join(fields).encode("utf-8")).hexdigest()
+        )
+        patch_cache_control(response, private=True, max_age=DEVICE_METADATA_MAX_AGE)
+        return get_conditional_response(
+            request, etag=response["ETag"], response=response
+        )
 
-            if metadata.first():
-                response_data = metadata
-        except (AssertionError, TypeError) as ex:
-            logger.info("Device has no metadata - %s - %s", device, ex)
 
-        json_data = list(response_data)
-        return JsonResponse({"data": json_data}, safe=False)
+class DeviceLatestStateJson(UUIDView, PermitObjectOwnerOnly, BaseDetailView):
+    """Return the newest value of each field reported by the device"""
+
+    http_method_names = [
+        "get",
+    ]
+
+    def __init__(self) -> None:
+        self.request = None
+        super().__init__()
+
+    def get_object(self, queryset=None):
+        """Prevent user from accessing devices that aren't theirs"""
+        return get_object_or_404(
+            models.Device, uuid=self.kwargs["uuid"], user=self.request.user
+        )
+
+    def get(self, request, *args, **kwargs):
+        """Create JSON response with the device's latest state"""
+        self.request = request
+        latest_state = self.get_object().get_latest_state()
+
+        if not latest_state:
+            return JsonResponse({"data": {}, "last_message_at": None})
+
+        return JsonResponse(
+            {
+                "data": latest_state.state,
+                "last_message_at": latest_state.last_message_at,
+            }
+        )
+
+
+class DeviceSeriesJson(UUIDView, PermitObjectOwnerOnly, BaseDetailView):
+    """Return the values of a numeric field reported by the device, for charts. Query
+    parameters select the field, limit the values to a date range (start/end) and set the
+    most points returned (points) and how the series is downsampled to them (method - lttb or
+    minmax, see zigbee/downsample.py)"""
+
+    http_method_names = [
+        "get",
+    ]
+    # rows read from the database per server-side cursor fetch
+    chunk_size = 10000
+
+    def __init__(self) -> None:
+        self.request = None
+        super().__init__()
+
+    def get_object(self, queryset=None):
+        """Prevent user from accessing devices that aren't theirs"""
+        return get_object_or_404(
+            models.Device, uuid=self.kwargs["uuid"], user=self.request.user
+        )
+
+    def get(self, request, *args, **kwargs):
+        """Create JSON response with the downsampled [timestamp, value] points - timestamps
+        are in milliseconds since the epoch. total is the number of values in the range"""
+        self.request = request
+        device = self.get_object()
+
+        form = forms.DeviceSeriesForm(request.GET)
+        if not form.is_valid():
+            return HttpResponseBadRequest(form.errors.as_text())
+
+        field, method = form.cleaned_data["field"], form.cleaned_data["method"]
+        zb_log_model = apps.get_model("zigbee", "ZigbeeLog")
+        logs = form.filter(
+            zb_log_model.objects.filter(zigbee_device__device=device),
+            field="received_at",
+        )
+        times, values = downsample.read_series(
+            logs.get_series(field).iterator(chunk_size=self.chunk_size)
+        )
+
+        return JsonResponse(
+            {
+                "field": field,
+                "method": method,
+                "total": len(times),
+                "data": downsample.downsample(
+                    times, values, form.cleaned_data["points"], method
+                ),
+            }
+        )
 
 
 class ListDeviceLocations(LimitResultsToUserMixin, ListView):
@@ -198,6 +293,9 @@ class ListDeviceLocations(LimitResultsToUserMixin, ListView):
     template_name = "devicelocation_list.html"
     ordering = ["created_at"]
 
+    def get_queryset(self):
+        return super().get_queryset().with_device_totals()
+
 
 class UpdateDeviceLocationRedirectView(RedirectView):
     """Redirects URL to proper update path - for breadcrumb"""
@@ -332,6 +430,10 @@ class ListDevices(UUIDView, LimitResultsToUserMixin, ListView):
     context_object_name = "devices"
     ordering = ["created_at"]
 
+    def get_queryset(self):
+        """Annotate linked status and last communication - see DeviceQuerySet.with_linked_status()"""
+        return super().get_queryset().with_linked_status()
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context["protocols"] = models.DeviceProtocol.__members__
@@ -350,11 +452,12 @@ class DetailDevice(UUIDView, PermitObjectOwnerOnly, DetailView):
         return context
 
 
-class LogsForDevice(UUIDView, PermitDeviceOwnerOnly, ListView):
+class LogsForDevice(UUIDView, PermitDeviceOwnerOnly, CursorPaginationMixin, ListView):
     """Enables user to view hardware device logs - if their device has been linked to a
-    hadware device"""
+    hadware device. Logs are paged by cursor, so later pages are as quick as the first"""
 
     paginate_by = 15
+    estimate_total = True
     context_object_name = "logs"
     template_name = "devices/device_logs.html"
     ordering = ["-created_at"]
@@ -385,18 +488,56 @@ class LogsForDevice(UUIDView, PermitDeviceOwnerOnly, ListView):
         return queryset
 
 
-class ExportCSVDeviceLogs(CSVExportView, LogsForDevice):
-    """Exports logs for specified device"""
+class ExportDeviceLogs(LogsForDevice):
+    """Exports logs for specified device - the file is streamed as rows are read. Query
+    parameters select the format (csv, ndjson, parquet or arrow - see exports.py), limit the
+    logs to a date range (start/end) and gzip csv/ndjson files (gzip=1)"""
 
-    exclude = ("id", "uuid", "zigbee_device", "updated_at", "topic")
+    fields = ("created_at", "raw_message")
+    filename = "zigbee-messages"
 
-    def get_queryset(self):
-        qs = super().get_queryset()
+    def get(self, request, *args, **kwargs):
+        form = forms.DeviceLogExportForm(request.GET)
+        if not form.is_valid():
+            return HttpResponseBadRequest(form.errors.as_text())
+
+        queryset = self.get_queryset()
+        if queryset is None:
+            raise Http404("No device logs to export")
 
-        if not qs:
+        queryset = form.filter(queryset)
+        if not queryset.exists():
             raise Http404("No device logs to export")
 
-        return qs
+        export_format = form.cleaned_data["format"]
+        content_type, extension = exports.FORMATS[export_format]
+
+        if export_format == "csv":
+            header = [
+                str(queryset.model._meta.get_field(field).verbose_name).title()
+                for field in self.fields
+            ]
+            chunks = exports.iter_csv(exports.iter_rows(queryset, self.fields), header)
+        else:
+            logs = exports.get_logs(queryset)
+            rows = exports.iter_pivoted(logs)
+            if export_format == "ndjson":
+                chunks = exports.iter_ndjson(rows)
+            else:
+                field_types = exports.get_field_types(
+                    queryset, exports.get_log_fields(logs)
+                )
+                chunks = exports.iter_columnar(rows, field_types, export_format)
+
+        return exports.streaming_response(
+            chunks,
+            filename=f"{self.filename}.{extension}",
+            content_type=content_type,
+            compress=(
+                form.cleaned_data["gzip"]
+                and export_format not in exports.COLUMNAR_FORMATS
+            ),
+        )
 
 
 class DeviceRedirectView(RedirectView):
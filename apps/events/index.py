@@ -0,0 +1,239 @@
+"""In-process index of enabled event triggers, grouped by device and metadata field.
+
+The MQTT ingest process warms the index at startup. ZigbeeMessage.check_event_triggers() then
+looks up the triggers for a device without a query, and only evaluates triggers for fields
+present in the message. Triggers are loaded with their event and device, and each trigger's
+comparison (see EventTrigger.comparison) is prepared when the index is built. The commands
+published in response to each event (its response plan) are resolved once, in a fixed number
+of queries, and held alongside the triggers.
+
+Signals (see signals.py) recompile only the devices affected when an Event or EventTrigger
+changes, drop the response plans affected by EventResponse/DeviceState changes, and bump a
+generation counter in the django cache so that the index is rebuilt when the change was made
+by another process (e.g. the web app). Processes that never warm the index load a device's
+triggers from the DB in one query when needed."""
+import logging
+import threading
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from smarthub.settings import MQTT_INDEX_CHECK_INTERVAL
+
+from ..mqtt.utils import CacheGeneration
+from .models import EventResponse, EventTrigger
+
+logger = logging.getLogger(__name__)
+
+# metadata field -> enabled triggers for that field
+FieldTriggers = Dict[str, List[EventTrigger]]
+
+
+class ResponseCommand(NamedTuple):
+    """MQTT command published when an event is triggered"""
+
+    mqtt_topic: str
+    command: str
+    command_value: str
+
+
+def build_response_plan(event_id: int) -> Optional[List[ResponseCommand]]:
+    """Resolve the commands for an event's enabled responses. Device states and their devices
+    are loaded with the responses, so the number of queries does not grow with the number of
+    responses. Returns None if any response is missing a command or value."""
+    responses = (
+        EventResponse.objects.filter(event_id=event_id, is_enabled=True)
+        .select_related("device_state")
+        .prefetch_related("device_state__content_object")
+    )
+
+    plan = []
+    for response in responses:
+        state = response.device_state
+        device = state.content_object
+
+        if not state.command or not state.command_value:
+            logger.info(
+                "Event response has no command and/or value - cmd: %s - val: %s",
+                state.command,
+                state.command_value,
+            )
+            return None
+
+        plan.append(
+            ResponseCommand(
+                mqtt_topic=getattr(device, "friendly_name", None),
+                command=state.command,
+                command_value=state.command_value,
+            )
+        )
+
+    return plan
+
+
+class EventTriggerIndex:
+    """Maps user device ids to their enabled triggers, grouped by metadata field"""
+
+    def __init__(self, check_interval: float = 5.0) -> None:
+        self.generation = CacheGeneration(
+            "event-trigger-index", check_interval=check_interval
+        )
+        self.is_warm = False
+
+        self._devices: Dict[int, FieldTriggers] = {}
+        self._triggers: Dict[int, int] = {}  # trigger id -> device id
+        self._events: Dict[int, set] = {}  # event id -> device ids
+        self._plans: Dict[int, Optional[List[ResponseCommand]]] = {}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def get_queryset():
+        """Enabled triggers of enabled events, with everything needed to evaluate them"""
+        return EventTrigger.objects.filter(
+            is_enabled=True, event__is_enabled=True
+        ).select_related("event", "device")
+
+    @staticmethod
+    def compile(triggers: Iterable[EventTrigger]) -> Dict[int, FieldTriggers]:
+        """Group triggers by device id and metadata field"""
+        devices = {}
+        for trigger in triggers:
+            trigger.comparison  # pylint: disable=pointless-statement
+            fields = devices.setdefault(trigger.device_id, {})
+            fields.setdefault(trigger.metadata_field, []).append(trigger)
+        return devices
+
+    def warm(self) -> "EventTriggerIndex":
+        """(Re)build the index from the DB in one query"""
+        generation = self.generation.current()
+        devices = self.compile(self.get_queryset())
+
+        with self._lock:
+            self._devices = {}
+            self._triggers = {}
+            self._events = {}
+            self._plans = {}
+            self._set_devices(devices)
+
+            self.is_warm = True
+            self.generation.mark_seen(generation)
+
+        logger.info("Event trigger index warmed - %s devices", len(devices))
+        return self
+
+    def clear(self) -> None:
+        """Empty the index - lookups fall back to the DB until warm() is called again"""
+        with self._lock:
+            self._devices = {}
+            self._triggers = {}
+            self._events = {}
+            self._plans = {}
+            self.is_warm = False
+            self.generation.seen = None
+
+    def get_triggers(self, device_id: int) -> FieldTriggers:
+        """Return enabled triggers for the device grouped by metadata field"""
+        if self.generation.is_stale():
+            logger.info("Event trigger index changed by another process - rebuilding")
+            self.warm()
+
+        if not self.is_warm:
+            triggers = self.get_queryset().filter(device_id=device_id)
+            return self.compile(triggers).get(device_id, {})
+
+        with self._lock:
+            return self._devices.get(device_id, {})
+
+    def get_response_plan(self, event_id: int) -> Optional[List[ResponseCommand]]:
+        """Return the commands to publish when the event is triggered - built on first use and
+        then held until the event, its responses, or the device states they use change"""
+        if not self.is_warm:
+            return build_response_plan(event_id)
+
+        with self._lock:
+            if event_id in self._plans:
+                return self._plans[event_id]
+
+        plan = build_response_plan(event_id)
+
+        with self._lock:
+            self._plans[event_id] = plan
+        return plan
+
+    def invalidate_response_plan(self, event_id: int) -> None:
+        """Drop the event's response plan (e.g. one of its responses changed)"""
+        with self._lock:
+            self._plans.pop(event_id, None)
+        self._bump()
+
+    def invalidate_response_plans(self) -> None:
+        """Drop all response plans (e.g. a device state or device topic changed)"""
+        with self._lock:
+            self._plans = {}
+        self._bump()
+
+    def invalidate_trigger(self, trigger_id: int, device_id: int) -> None:
+        """Recompile the device(s) the trigger is (device_id) or was attached to"""
+        with self._lock:
+            device_ids = {device_id, self._triggers.get(trigger_id)}
+        self.invalidate_devices(device_ids)
+
+    def invalidate_event(self, event_id: int) -> None:
+        """Recompile all devices with triggers for the event"""
+        if self.is_warm:
+            with self._lock:
+                self._plans.pop(event_id, None)
+                device_ids = set(self._events.get(event_id, ()))
+            device_ids.update(
+                EventTrigger.objects.filter(event_id=event_id).values_list(
+                    "device_id", flat=True
+                )
+            )
+            self._recompile(device_ids)
+        self._bump()
+
+    def invalidate_devices(self, device_ids: Iterable[int]) -> None:
+        """Recompile the triggers for the devices"""
+        if self.is_warm:
+            self._recompile(device_ids)
+        self._bump()
+
+    def _recompile(self, device_ids: Iterable[int]) -> None:
+        device_ids = {device_id for device_id in device_ids if device_id is not None}
+        if not device_ids:
+            return
+
+        devices = self.compile(self.get_queryset().filter(device_id__in=device_ids))
+
+        with self._lock:
+            for device_id in device_ids:
+                self._remove_device(device_id)
+            self._set_devices(devices)
+
+    def _set_devices(self, devices: Dict[int, FieldTriggers]) -> None:
+        for device_id, fields in devices.items():
+            self._devices[device_id] = fields
+            for triggers in fields.values():
+                for trigger in triggers:
+                    self._triggers[trigger.pk] = device_id
+                    self._events.setdefault(trigger.event_id, set()).add(device_id)
+
+    def _remove_device(self, device_id: int) -> None:
+        for triggers in self._devices.pop(device_id, {}).values():
+            for trigger in triggers:
+                self._triggers.pop(trigger.pk, None)
+                device_ids = self._events.get(trigger.event_id, set())
+                device_ids.discard(device_id)
+                if not device_ids:
+                    self._events.pop(trigger.event_id, None)
+
+    def _bump(self) -> None:
+        """Bump the shared generation - if nothing else changed in between, this process is
+        already up to date so there is no need to rebuild on the next check"""
+        generation = self.generation.bump()
+
+        with self._lock:
+            seen = self.generation.seen
+            if self.is_warm and seen is not None and generation == seen + 1:
+                self.generation.mark_seen(generation)
+
+
+event_trigger_index = EventTriggerIndex(check_interval=MQTT_INDEX_CHECK_INTERVAL)
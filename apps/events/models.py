@@ -1,5 +1,8 @@
 """Captures information relating to device event triggers"""
 import logging
+import operator
+from functools import cached_property, partial
+from typing import Any, Callable, Union
 
 from django.contrib.auth import get_user_model
 from django.db import models
@@ -60,6 +63,58 @@ class EventTriggerType(models.TextChoices):
     GREATER_THAN = "Greater than", _("Greater than")
 
 
+def convert_to_number(value) -> Union[int, float, None]:
+    """Returns value as an int (whole numbers) or float - None if it is not a number"""
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+
+    return int(number) if number.is_integer() else number
+
+
+def prepare_trigger_value(trigger_type: str, trigger_value):
+    """Converts trigger value into the form used for comparison - lowercase for equality
+    checks, a number for the remaining (numeric) trigger types"""
+    if isinstance(trigger_value, str):
+        trigger_value = trigger_value.lower()
+
+    if trigger_type in (EventTriggerType.EQUAL, EventTriggerType.NOT_EQUAL):
+        return trigger_value
+
+    return convert_to_number(trigger_value)
+
+
+TRIGGER_OPERATORS = {
+    EventTriggerType.EQUAL: operator.eq,
+    EventTriggerType.NOT_EQUAL: operator.ne,
+    EventTriggerType.LESS_THAN: operator.lt,
+    EventTriggerType.LESS_THAN_OR_EQUAL: operator.le,
+    EventTriggerType.GREATER_THAN_OR_EQUAL: operator.ge,
+    EventTriggerType.GREATER_THAN: operator.gt,
+}
+
+
+def compare_trigger_value(trigger_type: str, trigger_value, device_value) -> bool:
+    """Compare device value against a trigger value prepared by prepare_trigger_value()"""
+    compare = TRIGGER_OPERATORS.get(trigger_type)
+    if not compare:
+        return False
+
+    if isinstance(device_value, str):
+        device_value = device_value.lower()
+
+    if trigger_type in (EventTriggerType.EQUAL, EventTriggerType.NOT_EQUAL):
+        return compare(device_value, trigger_value)
+
+    # next set of conditions require number - if not a number return false
+    device_value = convert_to_number(device_value)
+    if trigger_value is None or device_value is None:
+        return False
+
+    return compare(device_value, trigger_value)
+
+
 class EventTrigger(BaseAbstractModel):
     """Stores potential event trigger values. Metadata values will be checked against
     device log tables"""
@@ -83,52 +138,21 @@ class EventTrigger(BaseAbstractModel):
     )
     is_enabled = models.BooleanField(verbose_name="Enable this trigger?", default=True)
 
+    @cached_property
+    def comparison(self) -> Callable[[Any], bool]:
+        """Comparison function bound to this trigger - the trigger value is lowercased and
+        (for numeric trigger types) converted to a number once, rather than on every check"""
+        return partial(
+            compare_trigger_value,
+            self.trigger_type,
+            prepare_trigger_value(self.trigger_type, self.metadata_trigger_value),
+        )
+
     def is_triggered(self, device_value) -> bool:
         """Compare device value to trigger value using trigger_type for comparison - returns bool
         True    -> trigger criteria has been met
         False   -> trigger criteria has not been met"""
-        logger.info("Start EventTrigger is_triggered()")
-        trigger_type = self.trigger_type
-        trigger_value = self.metadata_trigger_value
-
-        # convert all values to lower case
-        trigger_value = (
-            trigger_value.lower() if isinstance(trigger_value, str) else trigger_value
-        )
-        device_value = (
-            device_value.lower() if isinstance(device_value, str) else device_value
-        )
-
-        if trigger_type == EventTriggerType.EQUAL:
-            return trigger_value == device_value
-        elif trigger_type == EventTriggerType.NOT_EQUAL:
-            return trigger_value != device_value
-
-        # next set of conditions require number - if not a number return false
-        try:
-            trigger_value = (
-                int(trigger_value)
-                if int(trigger_value) == float(trigger_value)
-                else float(trigger_value)
-            )
-            device_value = (
-                int(device_value)
-                if int(device_value) == float(device_value)
-                else float(device_value)
-            )
-        except ValueError:
-            return False
-
-        if trigger_type == EventTriggerType.GREATER_THAN_OR_EQUAL:
-            return device_value >= trigger_value
-        elif trigger_type == EventTriggerType.GREATER_THAN:
-            return device_value > trigger_value
-        elif trigger_type == EventTriggerType.LESS_THAN:
-            return device_value < trigger_value
-        elif trigger_type == EventTriggerType.LESS_THAN_OR_EQUAL:
-            return device_value <= trigger_value
-
-        logger.info("Finish EventTrigger is_triggered()")
+        return self.comparison(device_value)
 
     def __str__(self) -> str:
         return (
@@ -0,0 +1,57 @@
+"""Keeps the event trigger index current when events, triggers, responses or the device states
+used by responses change. Invalidation waits for the change to be committed (see
+zigbee/signals.py)"""
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from ..devices.models import Device, DeviceState
+from ..zigbee.models import ZigbeeDevice
+from .index import event_trigger_index
+from .models import Event, EventResponse, EventTrigger
+
+
+@receiver(post_save, sender=EventTrigger)
+@receiver(post_delete, sender=EventTrigger)
+def event_trigger_changed(sender, instance, **kwargs):
+    """Recompile the triggers for the trigger's device"""
+    transaction.on_commit(
+        partial(
+            event_trigger_index.invalidate_trigger, instance.pk, instance.device_id
+        )
+    )
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+def event_changed(sender, instance, **kwargs):
+    """Recompile the triggers for every device the event is attached to"""
+    transaction.on_commit(partial(event_trigger_index.invalidate_event, instance.pk))
+
+
+@receiver(post_save, sender=EventResponse)
+@receiver(post_delete, sender=EventResponse)
+def event_response_changed(sender, instance, **kwargs):
+    """Rebuild the event's response plan (held with its triggers)"""
+    transaction.on_commit(
+        partial(event_trigger_index.invalidate_response_plan, instance.event_id)
+    )
+
+
+@receiver(post_save, sender=Device)
+def device_changed(sender, instance, **kwargs):
+    """Triggers hold their device (used to describe the trigger) - recompile them"""
+    transaction.on_commit(
+        partial(event_trigger_index.invalidate_devices, [instance.pk])
+    )
+
+
+@receiver(post_save, sender=DeviceState)
+@receiver(post_delete, sender=DeviceState)
+@receiver(post_save, sender=ZigbeeDevice)
+@receiver(post_delete, sender=ZigbeeDevice)
+def response_device_changed(sender, instance, **kwargs):
+    """Response plans hold device state commands and device topics - rebuild them"""
+    transaction.on_commit(event_trigger_index.invalidate_response_plans)
@@ -3,8 +3,9 @@ from django.urls import reverse
 
 from ...devices.tests.factories import (DeviceFactory, UserFactory,
                                         ZigbeeDeviceStateFactory)
-from ...zigbee.tests.factories import (ZigbeeDeviceFactory, ZigbeeLogFactory,
-                                       ZigbeeMessageFactory)
+from ...zigbee.tests.factories import (ZigbeeDeviceFactory,
+                                       ZigbeeDeviceFieldFactory,
+                                       ZigbeeLogFactory, ZigbeeMessageFactory)
 from ..forms import (NON_NUMERIC_TRIGGER_TYPES, NUMERIC_TRIGGER_TYPES,
                      EventForm, EventResponseForm, EventResponseUpdateForm,
                      EventTriggerForm)
@@ -30,6 +31,7 @@ class TestEventTriggerForm(TestCase):
             metadata_type="dummy-metadata",
             metadata_value="dummy-on",
         )
+        ZigbeeDeviceFieldFactory(zigbee_device=self.zb_device, name="dummy-metadata")
 
         self.form_data = {
             "_device": self.device.uuid,
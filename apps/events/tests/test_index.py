@@ -0,0 +1,175 @@
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from ...devices.tests.factories import DeviceFactory, ZigbeeDeviceStateFactory
+from ..index import EventTriggerIndex, ResponseCommand, event_trigger_index
+from ..models import EventTrigger
+from .factories import EventFactory, EventResponseFactory, EventTriggerFactory
+
+
+class TestEventTriggerIndex(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.device = DeviceFactory()
+        self.event = EventFactory(is_enabled=True)
+        self.trigger = EventTriggerFactory(
+            event=self.event,
+            device=self.device,
+            metadata_field="temperature",
+            is_enabled=True,
+        )
+        self.index = EventTriggerIndex(check_interval=0).warm()
+
+    def tearDown(self):
+        event_trigger_index.clear()
+
+    def test_triggers_grouped_by_field(self):
+        EventTriggerFactory(
+            event=self.event,
+            device=self.device,
+            metadata_field="state",
+            is_enabled=True,
+        )
+        self.index.warm()
+
+        triggers = self.index.get_triggers(self.device.pk)
+
+        self.assertEqual(set(triggers), {"temperature", "state"})
+        self.assertEqual(triggers["temperature"], [self.trigger])
+
+    def test_lookup_and_evaluation_do_not_query_db(self):
+        with self.assertNumQueries(0):
+            for trigger in self.index.get_triggers(self.device.pk)["temperature"]:
+                trigger.is_triggered("20")
+                str(trigger)
+                trigger.event.uuid
+
+    def test_disabled_triggers_and_events_are_excluded(self):
+        EventTriggerFactory(
+            event=self.event,
+            device=self.device,
+            metadata_field="state",
+            is_enabled=False,
+        )
+        EventTriggerFactory(
+            event=EventFactory(is_enabled=False),
+            device=self.device,
+            metadata_field="humidity",
+            is_enabled=True,
+        )
+        self.index.warm()
+
+        self.assertEqual(set(self.index.get_triggers(self.device.pk)), {"temperature"})
+
+    def test_only_affected_device_is_recompiled(self):
+        other_trigger = EventTriggerFactory(metadata_field="state", is_enabled=True)
+        other_trigger.event.is_enabled = True
+        other_trigger.event.save()
+        self.index.warm()
+        other_triggers = self.index.get_triggers(other_trigger.device_id)
+
+        self.trigger.metadata_field = "humidity"
+        self.trigger.save()
+        with self.assertNumQueries(1):
+            self.index.invalidate_trigger(self.trigger.pk, self.trigger.device_id)
+
+        self.assertEqual(set(self.index.get_triggers(self.device.pk)), {"humidity"})
+        self.assertIs(self.index.get_triggers(other_trigger.device_id), other_triggers)
+
+    def test_disabling_event_removes_its_triggers(self):
+        self.event.is_enabled = False
+        self.event.save()
+        self.index.invalidate_event(self.event.pk)
+
+        self.assertEqual(self.index.get_triggers(self.device.pk), {})
+
+    def test_index_rebuilt_when_changed_by_another_process(self):
+        # trigger changed without signals (i.e. by another process) - only the generation changes
+        EventTrigger.objects.filter(pk=self.trigger.pk).update(metadata_field="state")
+        self.index.generation.bump()
+
+        self.assertEqual(set(self.index.get_triggers(self.device.pk)), {"state"})
+
+    def test_signals_keep_shared_index_current(self):
+        event_trigger_index.warm()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            trigger = EventTrigger.objects.create(
+                event=self.event, device=self.device, metadata_field="state"
+            )
+            # the index is not invalidated until the change is committed
+            self.assertNotIn("state", event_trigger_index.get_triggers(self.device.pk))
+        self.assertIn("state", event_trigger_index.get_triggers(self.device.pk))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            trigger.delete()
+        self.assertNotIn("state", event_trigger_index.get_triggers(self.device.pk))
+
+    def test_unwarmed_index_reads_from_db(self):
+        index = EventTriggerIndex()
+
+        self.assertEqual(
+            index.get_triggers(self.device.pk), {"temperature": [self.trigger]}
+        )
+
+
+class TestResponsePlan(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.event = EventFactory(is_enabled=True)
+        self.index = EventTriggerIndex(check_interval=0).warm()
+
+    def add_responses(self, event, amount: int) -> None:
+        for _ in range(amount):
+            EventResponseFactory(
+                event=event, device_state=ZigbeeDeviceStateFactory(), is_enabled=True
+            )
+
+    def count_plan_queries(self, event) -> tuple:
+        ContentType.objects.clear_cache()
+        with CaptureQueriesContext(connection) as queries:
+            plan = EventTriggerIndex().get_response_plan(event.pk)
+        return len(queries), len(plan)
+
+    def test_plan_contains_command_for_each_enabled_response(self):
+        state = ZigbeeDeviceStateFactory(command="state", command_value="on")
+        EventResponseFactory(event=self.event, device_state=state, is_enabled=True)
+        EventResponseFactory(event=self.event, is_enabled=False)
+
+        plan = self.index.get_response_plan(self.event.pk)
+
+        self.assertEqual(
+            plan,
+            [
+                ResponseCommand(
+                    mqtt_topic=state.content_object.friendly_name,
+                    command="state",
+                    command_value="on",
+                )
+            ],
+        )
+
+    def test_query_count_does_not_grow_with_number_of_responses(self):
+        small_event = EventFactory(is_enabled=True)
+        self.add_responses(small_event, 1)
+        self.add_responses(self.event, 20)
+
+        small_queries, small_plan = self.count_plan_queries(small_event)
+        large_queries, large_plan = self.count_plan_queries(self.event)
+
+        self.assertEqual(small_plan, 1)
+        self.assertEqual(large_plan, 20)
+        self.assertEqual(small_queries, large_queries)
+
+    def test_plan_is_held_until_responses_change(self):
+        self.add_responses(self.event, 2)
+        plan = self.index.get_response_plan(self.event.pk)
+
+        with self.assertNumQueries(0):
+            self.assertIs(self.index.get_response_plan(self.event.pk), plan)
+
+        self.index.invalidate_response_plan(self.event.pk)
+        self.assertIsNot(self.index.get_response_plan(self.event.pk), plan)
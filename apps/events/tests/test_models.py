@@ -0,0 +1,44 @@
+from django.test import SimpleTestCase
+
+from ..models import EventTrigger, EventTriggerType
+
+
+class TestEventTriggerIsTriggered(SimpleTestCase):
+    def build_trigger(self, trigger_type, value):
+        return EventTrigger(trigger_type=trigger_type, metadata_trigger_value=value)
+
+    def test_equality_is_case_insensitive(self):
+        trigger = self.build_trigger(EventTriggerType.EQUAL, "ON")
+
+        self.assertTrue(trigger.is_triggered("on"))
+        self.assertFalse(trigger.is_triggered("off"))
+        self.assertTrue(
+            self.build_trigger(EventTriggerType.NOT_EQUAL, "ON").is_triggered("off")
+        )
+
+    def test_numeric_comparisons(self):
+        self.assertTrue(
+            self.build_trigger(EventTriggerType.GREATER_THAN, "20").is_triggered("21")
+        )
+        self.assertTrue(
+            self.build_trigger(EventTriggerType.LESS_THAN_OR_EQUAL, "20").is_triggered(
+                "20.0"
+            )
+        )
+        self.assertTrue(
+            self.build_trigger(EventTriggerType.LESS_THAN, "21.5").is_triggered("21.37")
+        )
+
+    def test_numeric_comparison_with_non_numeric_values_is_not_triggered(self):
+        self.assertFalse(
+            self.build_trigger(EventTriggerType.GREATER_THAN, "20").is_triggered("on")
+        )
+        self.assertFalse(
+            self.build_trigger(EventTriggerType.GREATER_THAN, "on").is_triggered("21")
+        )
+
+    def test_trigger_value_is_converted_once(self):
+        trigger = self.build_trigger(EventTriggerType.GREATER_THAN, "20")
+
+        self.assertIs(trigger.comparison, trigger.comparison)
+        self.assertEqual(trigger.comparison.args[1], 20)
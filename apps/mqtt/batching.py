@@ -0,0 +1,92 @@
+"""Batches ZigbeeLog writes so that a message costs one INSERT rather than one per field"""
+import logging
+import threading
+from typing import List
+
+from django.db import close_old_connections, transaction
+
+from ..zigbee.models import ZigbeeLog
+
+logger = logging.getLogger(__name__)
+
+
+class ZigbeeLogWriter:
+    """Writes ZigbeeLog rows using bulk_create.
+
+    By default the logs for each message are written immediately in a single bulk_create.
+    When interval_ms is greater than zero the writer micro-batches - logs from many messages
+    are buffered and flushed inside one transaction every interval_ms milliseconds, or as soon
+    as batch_size rows are waiting, whichever happens first."""
+
+    def __init__(self, batch_size: int = 500, interval_ms: int = 0) -> None:
+        self.batch_size = max(1, int(batch_size))
+        self.interval = max(0, int(interval_ms)) / 1000
+        self.buffer: List[ZigbeeLog] = []
+
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def is_batching(self) -> bool:
+        """True when logs are buffered rather than written immediately"""
+        return self.interval > 0
+
+    def start(self) -> "ZigbeeLogWriter":
+        """Start the background flush thread (only required when micro-batching)"""
+        if self.is_batching and not self._thread:
+            self._stop_event.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="mqtt-log-writer", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop the background flush thread and write any buffered logs"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def write(self, logs: List[ZigbeeLog]) -> None:
+        """Write logs - immediately, or add them to the current batch"""
+        if not logs:
+            return
+
+        if not self.is_batching:
+            ZigbeeLog.objects.bulk_create(logs, batch_size=self.batch_size)
+            return
+
+        with self._lock:
+            self.buffer.extend(logs)
+            is_full = len(self.buffer) >= self.batch_size
+
+        if is_full:
+            self.flush()
+
+    def flush(self) -> int:
+        """Write all buffered logs in one transaction - returns the number of rows written"""
+        with self._lock:
+            batch, self.buffer = self.buffer, []
+
+        if not batch:
+            return 0
+
+        try:
+            with transaction.atomic():
+                ZigbeeLog.objects.bulk_create(batch, batch_size=self.batch_size)
+        except Exception as ex:
+            logger.error("Could not write batch of %s ZigbeeLogs - %s", len(batch), ex)
+            return 0
+
+        logger.debug("ZigbeeLog batch written - %s rows", len(batch))
+        return len(batch)
+
+    def _run(self) -> None:
+        """Flush loop - runs on its own thread, so manages its own DB connection"""
+        while not self._stop_event.wait(self.interval):
+            close_old_connections()
+            self.flush()
+        close_old_connections()
@@ -0,0 +1,103 @@
+"""JSON codec used for MQTT payloads.
+
+Uses orjson or ujson when installed, falling back to the standard library json module. The
+codec is selected with the MQTT_JSON_CODEC setting - 'auto' picks the fastest one available.
+Payloads should be decoded once per message and the parsed object passed along, rather than
+being re-parsed by each step of the ingest pipeline."""
+import json
+import logging
+from typing import Any, Union
+
+from smarthub.settings import MQTT_JSON_CODEC
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+logger = logging.getLogger(__name__)
+
+# all codecs raise a subclass of ValueError when data cannot be decoded
+DecodeError = ValueError
+
+
+class JSONCodec:
+    """Standard library codec"""
+
+    name = "json"
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        """Decode JSON bytes/str"""
+        return json.loads(data)
+
+    def dumps(self, obj: Any, sort_keys: bool = False) -> str:
+        """Encode obj as JSON - sort_keys produces compact canonical output"""
+        if sort_keys:
+            return json.dumps(
+                obj, sort_keys=True, separators=(",", ":"), ensure_ascii=False
+            )
+        return json.dumps(obj)
+
+
+class OrjsonCodec(JSONCodec):
+    """orjson codec - https://github.com/ijl/orjson"""
+
+    name = "orjson"
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        return orjson.loads(data)
+
+    def dumps(self, obj: Any, sort_keys: bool = False) -> str:
+        option = orjson.OPT_SORT_KEYS if sort_keys else 0
+        return orjson.dumps(obj, option=option).decode("utf-8")
+
+
+class UjsonCodec(JSONCodec):
+    """ujson codec - https://github.com/ultrajson/ultrajson"""
+
+    name = "ujson"
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        return ujson.loads(data)
+
+    def dumps(self, obj: Any, sort_keys: bool = False) -> str:
+        return ujson.dumps(
+            obj,
+            sort_keys=sort_keys,
+            ensure_ascii=False,
+            escape_forward_slashes=False,
+        )
+
+
+def get_codec(name: str = "auto") -> JSONCodec:
+    """Return codec by name ('auto', 'orjson', 'ujson' or 'json'). If the requested library is
+    not installed the standard library codec is returned."""
+    name = str(name).lower()
+
+    if name in ("auto", OrjsonCodec.name) and orjson:
+        return OrjsonCodec()
+    if name in ("auto", UjsonCodec.name) and ujson:
+        return UjsonCodec()
+
+    if name not in ("auto", JSONCodec.name):
+        logger.warning("JSON codec '%s' is not installed - using json", name)
+
+    return JSONCodec()
+
+
+_codec = get_codec(MQTT_JSON_CODEC)
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """Decode JSON using the configured codec"""
+    return _codec.loads(data)
+
+
+def dumps(obj: Any, sort_keys: bool = False) -> str:
+    """Encode obj as JSON using the configured codec"""
+    return _codec.dumps(obj, sort_keys=sort_keys)
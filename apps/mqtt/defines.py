@@ -30,3 +30,28 @@ MQTT_STATE_TOGGLE_VALUE = "TOGGLE"
 
 # field used to map zigbee devices to MQTT device
 ZIGBEE_DEVICE_IDENTIFIER_FIELD = "ieee_address"
+
+# ingest pipeline - overflow policies applied when the ingest queue is full
+#   block       - network thread waits up to MQTT_INGEST_BLOCK_TIMEOUT seconds, then drops message
+#   drop_newest - incoming message is dropped
+#   drop_oldest - oldest queued message is dropped to make room for the incoming message
+#   spill       - incoming message is appended to a file and replayed once the queue drains
+INGEST_OVERFLOW_BLOCK = "block"
+INGEST_OVERFLOW_DROP_NEWEST = "drop_newest"
+INGEST_OVERFLOW_DROP_OLDEST = "drop_oldest"
+INGEST_OVERFLOW_SPILL = "spill"
+INGEST_OVERFLOW_POLICIES = [
+    INGEST_OVERFLOW_BLOCK,
+    INGEST_OVERFLOW_DROP_NEWEST,
+    INGEST_OVERFLOW_DROP_OLDEST,
+    INGEST_OVERFLOW_SPILL,
+]
+
+INGEST_DEFAULT_WORKERS = 4
+INGEST_DEFAULT_QUEUE_SIZE = 1000
+INGEST_DEFAULT_BLOCK_TIMEOUT = 1.0
+# seconds a worker waits for a message before checking whether it should stop
+INGEST_WORKER_POLL_INTERVAL = 0.5
+# seconds between logging/caching ingest stats (including queue depth)
+INGEST_STATS_INTERVAL = 30.0
+INGEST_STATS_CACHE_KEY = "ingest-stats"
@@ -0,0 +1,368 @@
+"""Bounded ingest pipeline which decouples the MQTT network loop from message processing.
+
+The paho network thread only hands raw topic/payload pairs to IngestPipeline.put(). Messages are
+sharded by topic onto a pool of worker threads - each worker owns a bounded queue, which keeps
+messages from a single device in the order they were received, whilst devices are processed
+concurrently. When a shard is full the configured overflow policy is applied (see defines).
+
+With the 'spill' policy each shard has its own spill file. Once a shard has spilled, its new
+messages are appended to the file too (so they cannot overtake the spilled ones), and its
+worker replays the file, oldest first, whenever the shard's queue drains."""
+import base64
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import zlib
+from typing import Callable, NamedTuple, Optional
+
+from django.core.cache import cache
+from django.db import close_old_connections
+
+from . import defines
+from .utils import get_cache_key
+
+logger = logging.getLogger(__name__)
+
+
+class IngestItem(NamedTuple):
+    """Raw message as received from the MQTT broker"""
+
+    topic: str
+    payload: bytes
+    received_at: float
+
+
+class IngestPipeline:
+    """Hands MQTT messages from the network thread to a pool of worker threads.
+
+    Parameters:
+        handler         - callable invoked by the workers as handler(topic, payload)
+        workers         - number of worker threads (and queue shards)
+        maxsize         - total number of messages that can be queued across all shards
+        overflow_policy - one of defines.INGEST_OVERFLOW_POLICIES
+        block_timeout   - seconds the network thread will wait for space when policy is 'block'
+        spill_path      - file used to persist overflow messages when policy is 'spill' - each
+                          shard writes to its own file, numbered after the shard
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[str, bytes], None],
+        workers: int = defines.INGEST_DEFAULT_WORKERS,
+        maxsize: int = defines.INGEST_DEFAULT_QUEUE_SIZE,
+        overflow_policy: str = defines.INGEST_OVERFLOW_BLOCK,
+        block_timeout: float = defines.INGEST_DEFAULT_BLOCK_TIMEOUT,
+        spill_path: Optional[str] = None,
+        stats_interval: float = defines.INGEST_STATS_INTERVAL,
+    ) -> None:
+        if overflow_policy not in defines.INGEST_OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown ingest overflow policy '{overflow_policy}'")
+
+        if overflow_policy == defines.INGEST_OVERFLOW_SPILL and not spill_path:
+            raise ValueError("A spill_path must be provided for the 'spill' policy")
+
+        self.handler = handler
+        self.workers = max(1, int(workers))
+        self.overflow_policy = overflow_policy
+        self.block_timeout = float(block_timeout)
+        self.spill_path = spill_path
+        self.stats_interval = float(stats_interval)
+
+        shard_size = max(1, int(maxsize) // self.workers)
+        self.queues = [queue.Queue(maxsize=shard_size) for _ in range(self.workers)]
+
+        # shard -> spill file, number of its entries waiting to be replayed and position of
+        # the next one - files left by a previous run are replayed from the start
+        self.spill_paths = []
+        self._spilled = [0] * self.workers
+        self._spill_offsets = [0] * self.workers
+        self._spill_locks = [threading.Lock() for _ in range(self.workers)]
+
+        if overflow_policy == defines.INGEST_OVERFLOW_SPILL:
+            os.makedirs(os.path.dirname(os.path.abspath(spill_path)), exist_ok=True)
+            root, extension = os.path.splitext(spill_path)
+            self.spill_paths = [
+                f"{root}-{number}{extension}" for number in range(self.workers)
+            ]
+            self._spilled = [self._count_entries(path) for path in self.spill_paths]
+
+        self.counters = {
+            "received": 0,
+            "processed": 0,
+            "failed": 0,
+            "dropped": 0,
+            "spilled": 0,
+            "replayed": 0,
+        }
+        self._counter_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._threads = []
+
+    @property
+    def maxsize(self) -> int:
+        """Total capacity of the pipeline across all shards"""
+        return sum(shard.maxsize for shard in self.queues)
+
+    @property
+    def depth(self) -> int:
+        """Number of messages currently waiting to be processed"""
+        return sum(shard.qsize() for shard in self.queues)
+
+    def stats(self) -> dict:
+        """Return a snapshot of the pipeline counters and current queue depth"""
+        with self._counter_lock:
+            stats = dict(self.counters)
+
+        stats["depth"] = self.depth
+        stats["maxsize"] = self.maxsize
+        stats["shard_depths"] = [shard.qsize() for shard in self.queues]
+        stats["spill_depth"] = sum(self._spilled)
+        return stats
+
+    def _increment(self, counter: str, amount: int = 1) -> None:
+        with self._counter_lock:
+            self.counters[counter] += amount
+
+    def _get_shard_index(self, topic: str) -> int:
+        """Messages for the same topic always land on the same shard to preserve ordering"""
+        return zlib.crc32(topic.encode("utf-8")) % self.workers
+
+    @staticmethod
+    def _count_entries(path: str) -> int:
+        """Number of entries in a spill file - 0 if there is none"""
+        try:
+            with open(path, "rb") as file:
+                return sum(1 for _ in file)
+        except FileNotFoundError:
+            return 0
+
+    def start(self) -> "IngestPipeline":
+        """Start worker threads - and the monitor thread which logs stats"""
+        self._stop_event.clear()
+
+        for number in range(self.workers):
+            thread = threading.Thread(
+                target=self._work,
+                args=(number,),
+                name=f"mqtt-ingest-{number}",
+                daemon=True,
+            )
+            thread.start()
+            self._threads.append(thread)
+
+        monitor = threading.Thread(
+            target=self._monitor, name="mqtt-ingest-monitor", daemon=True
+        )
+        monitor.start()
+        self._threads.append(monitor)
+
+        logger.info(
+            "MQTT ingest started - workers=%s - capacity=%s - overflow policy=%s",
+            self.workers,
+            self.maxsize,
+            self.overflow_policy,
+        )
+        return self
+
+    def stop(self, drain: bool = True, timeout: float = 10.0) -> None:
+        """Stop the worker threads. If drain is True queued (and spilled) messages are
+        processed first."""
+        if drain:
+            deadline = time.monotonic() + timeout
+            while (self.depth or any(self._spilled)) and time.monotonic() < deadline:
+                time.sleep(0.05)
+
+        self._stop_event.set()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads = []
+
+        logger.info("MQTT ingest stopped - %s", self.stats())
+
+    def put(self, topic: str, payload: bytes) -> bool:
+        """Called from the MQTT network thread - must never perform any I/O other than, at
+        worst, a bounded wait (block policy) or an append to the spill file (spill policy).
+
+        Returns True if the message was queued."""
+        self._increment("received")
+        item = IngestItem(topic=topic, payload=payload, received_at=time.time())
+        index = self._get_shard_index(topic)
+
+        # messages for a shard with spilled messages are spilled behind them
+        if not self._spilled[index]:
+            try:
+                self.queues[index].put_nowait(item)
+                return True
+            except queue.Full:
+                pass
+
+        return self._handle_overflow(index, item)
+
+    def _handle_overflow(self, index: int, item: IngestItem) -> bool:
+        """Apply the overflow policy for a full shard"""
+        policy = self.overflow_policy
+        shard = self.queues[index]
+
+        if policy == defines.INGEST_OVERFLOW_BLOCK:
+            try:
+                shard.put(item, timeout=self.block_timeout)
+                return True
+            except queue.Full:
+                logger.warning(
+                    "MQTT ingest queue full for %ss - message dropped [%s]",
+                    self.block_timeout,
+                    item.topic,
+                )
+        elif policy == defines.INGEST_OVERFLOW_DROP_OLDEST:
+            try:
+                dropped = shard.get_nowait()
+                shard.task_done()
+                logger.warning(
+                    "MQTT ingest queue full - oldest message dropped [%s]",
+                    dropped.topic,
+                )
+                shard.put_nowait(item)
+                self._increment("dropped")
+                return True
+            except (queue.Empty, queue.Full):
+                logger.warning(
+                    "MQTT ingest queue full - message dropped [%s]", item.topic
+                )
+        elif policy == defines.INGEST_OVERFLOW_SPILL:
+            if self._spill(index, item):
+                return False
+        else:
+            logger.warning("MQTT ingest queue full - message dropped [%s]", item.topic)
+
+        self._increment("dropped")
+        return False
+
+    def _spill(self, index: int, item: IngestItem) -> bool:
+        """Append message to the shard's spill file so it can be replayed once the queue
+        drains"""
+        line = json.dumps(
+            {
+                "topic": item.topic,
+                "payload": base64.b64encode(item.payload).decode("ascii"),
+                "received_at": item.received_at,
+            }
+        )
+
+        try:
+            with self._spill_locks[index], open(
+                self.spill_paths[index], "a", encoding="utf-8"
+            ) as file:
+                file.write(line + "\n")
+                self._spilled[index] += 1
+        except OSError as ex:
+            logger.error("MQTT ingest could not spill message - %s", ex)
+            return False
+
+        self._increment("spilled")
+        return True
+
+    @staticmethod
+    def _parse_spilled(line: bytes) -> Optional[IngestItem]:
+        try:
+            data = json.loads(line)
+            return IngestItem(
+                topic=data["topic"],
+                payload=base64.b64decode(data["payload"]),
+                received_at=data["received_at"],
+            )
+        except (ValueError, KeyError) as ex:
+            logger.error("MQTT ingest discarded corrupt spill entry - %s", ex)
+            return None
+
+    def replay_spilled(self, index: int = None) -> int:
+        """Re-queue the shard's spilled messages (every shard's if index is None), oldest
+        first, whilst there is room in its queue. Messages which do not fit stay in the file
+        and are replayed next time. Returns the number of messages replayed."""
+        if index is None:
+            return sum(
+                self.replay_spilled(number) for number in range(len(self.spill_paths))
+            )
+
+        if not self._spilled[index]:
+            return 0
+
+        shard = self.queues[index]
+        path = self.spill_paths[index]
+        replayed = 0
+
+        # put() spills the shard's messages until the count reaches 0, so the last entry is
+        # queued before it is counted as replayed
+        with self._spill_locks[index]:
+            try:
+                with open(path, "rb") as file:
+                    file.seek(self._spill_offsets[index])
+                    while self._spilled[index] and not shard.full():
+                        line = file.readline()
+                        if not line:
+                            logger.error("MQTT ingest spill file %s is truncated", path)
+                            self._spilled[index] = 0
+                            break
+
+                        item = self._parse_spilled(line)
+                        if item:
+                            shard.put_nowait(item)
+                            replayed += 1
+                        self._spill_offsets[index] = file.tell()
+                        self._spilled[index] -= 1
+
+                if not self._spilled[index]:
+                    os.remove(path)
+                    self._spill_offsets[index] = 0
+            except OSError as ex:
+                logger.error("MQTT ingest could not replay spilled messages - %s", ex)
+
+        if replayed:
+            self._increment("replayed", replayed)
+            logger.info("MQTT ingest replayed %s spilled messages", replayed)
+
+        return replayed
+
+    def _work(self, index: int) -> None:
+        """Worker loop - processes messages from a single shard, replaying its spilled
+        messages whenever its queue drains"""
+        shard = self.queues[index]
+        while not self._stop_event.is_set():
+            if self._spilled[index] and shard.empty():
+                self.replay_spilled(index)
+
+            try:
+                item = shard.get(timeout=defines.INGEST_WORKER_POLL_INTERVAL)
+            except queue.Empty:
+                continue
+
+            # database connections are per thread - make sure stale ones are not reused
+            close_old_connections()
+            try:
+                self.handler(item.topic, item.payload)
+                self._increment("processed")
+            except Exception as ex:
+                self._increment("failed")
+                logger.error(
+                    "MQTT ingest could not process message [%s] - %s", item.topic, ex
+                )
+            finally:
+                shard.task_done()
+                close_old_connections()
+
+    def _monitor(self) -> None:
+        """Periodically publish stats (queue depth)"""
+        while not self._stop_event.wait(self.stats_interval):
+            stats = self.stats()
+            logger.info("MQTT ingest stats - %s", stats)
+
+            try:
+                cache.set(
+                    get_cache_key(defines.INGEST_STATS_CACHE_KEY),
+                    stats,
+                    timeout=self.stats_interval * 2,
+                )
+            except Exception as ex:
+                logger.debug("MQTT ingest could not store stats in cache - %s", ex)
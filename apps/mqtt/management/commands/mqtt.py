@@ -1,12 +1,10 @@
 """Implements functionality for handling MQTT broker connections and messages"""
 import datetime
-import json
 import logging
-from json.decoder import JSONDecodeError
+from functools import partial
 from random import random
 from typing import Union
 
-from django.core.cache import cache
 from django.core.management import BaseCommand
 from django.core.management.base import CommandError
 
@@ -15,14 +13,37 @@ import paho.mqtt.client as mqtt
 from smarthub.settings import (
     MQTT_BASE_TOPIC,
     MQTT_CLIENT_NAME,
+    MQTT_FIELD_SEEN_INTERVAL,
+    MQTT_INGEST_BLOCK_TIMEOUT,
+    MQTT_INGEST_OVERFLOW_POLICY,
+    MQTT_INGEST_QUEUE_SIZE,
+    MQTT_INGEST_SPILL_PATH,
+    MQTT_INGEST_WORKERS,
+    MQTT_LAST_SEEN_INTERVAL,
+    MQTT_LOG_BATCH_INTERVAL_MS,
+    MQTT_LOG_BATCH_SIZE,
     MQTT_QOS,
     MQTT_SERVER,
+    MQTT_STATE_CACHE_SIZE,
+    MQTT_STATE_WRITE_BEHIND_INTERVAL,
     MQTT_TOPICS,
 )
 
 from ....devices.models import DeviceState
-from ....zigbee.models import ZigbeeDevice, ZigbeeLog, ZigbeeMessage
-from ... import defines
+from ....events.index import event_trigger_index
+from ....zigbee.fields import FieldCatalog
+from ....zigbee.index import device_topic_index
+from ....zigbee.models import (
+    DeviceLatestState,
+    ZigbeeDevice,
+    ZigbeeLog,
+    ZigbeeMessage,
+)
+from ....zigbee.seen import LastSeenRecorder
+from ... import codec, defines
+from ...batching import ZigbeeLogWriter
+from ...ingest import IngestPipeline
+from ...state import MessageStateStore
 from ...utils import get_cache_key
 
 logger = logging.getLogger(__name__)
@@ -47,56 +68,106 @@ def parse_message_for_comparison(
     if not message:
         return None
 
-    try:
+    parsed_message = parse_message_for_state(message)
+
+    if parsed_message is None:
+        logger.debug("Could not parse message %s - is_cache=%s", message, is_cache)
+        return None
 
-        json_message = json.loads(message)
+    if not is_cache:
+        logger.info("Parsed message %s", parsed_message)
+    return codec.dumps(parsed_message)
 
-        parsed_message = {}
 
-        for field in json_message:
-            if field in defines.MESSAGE_FIELDS_TO_IGNORE:
-                continue  # ignore
+def strip_ignored_fields(message: dict) -> dict:
+    """Return copy of message without the fields listed in MESSAGE_FIELDS_TO_IGNORE"""
+    return {
+        field: value
+        for field, value in message.items()
+        if field not in defines.MESSAGE_FIELDS_TO_IGNORE
+    }
 
-            parsed_message[field] = json_message[field]
 
-        if not is_cache:
-            logger.info("Parsed message %s", parsed_message)
-        return json.dumps(parsed_message)
-    except JSONDecodeError:
-        logger.debug("Could not parse message %s - is_cache=%s", message, is_cache)
+def parse_message_for_state(message: Union[str, bytes]) -> Union[dict, None]:
+    """Parses raw message into the dict retained by the message state store - ignored fields
+    are removed. Returns None if the message cannot be parsed.
+
+    Only used when the store has to read a message back from the django cache - messages
+    received by the ingest process are passed to the store already parsed."""
+    try:
+        json_message = codec.loads(message)
+    except (codec.DecodeError, TypeError):
         return None
 
+    if not isinstance(json_message, dict):
+        return None
 
-def has_message_sufficiently_changed(message: str, cache_key: str) -> bool:
-    """Compares the message against the last cached message to see if it has changed -
-    excluding ignored fields. This helps prevent event triggers when a device rebroadcasts a
-    message, with little to no content change."""
+    return strip_ignored_fields(json_message)
 
-    cache_data = cache.get(key=cache_key)
-    has_changed = True
 
-    if cache_data:
-        # parsing both messages so that the raw message is retained in cache for debugging if needed
-        parsed_message = parse_message_for_comparison(message=message)
-        parsed_cache = parse_message_for_comparison(message=cache_data, is_cache=True)
+# last message received per topic - held in memory by the ingest process, with the django cache
+# updated in the background so that the raw message is available for debugging
+message_state = MessageStateStore(
+    parser=parse_message_for_state,
+    maxsize=MQTT_STATE_CACHE_SIZE,
+    write_behind_interval=MQTT_STATE_WRITE_BEHIND_INTERVAL,
+)
 
-        if parsed_message == parsed_cache:
+# ZigbeeDevice.last_seen_at is written at most once per interval for each device
+last_seen = LastSeenRecorder(interval=MQTT_LAST_SEEN_INTERVAL)
+
+# fields are added to ZigbeeDeviceField when a device reports them for the first time - their
+# last_seen_at is refreshed at most once per interval for each device
+field_catalog = FieldCatalog(interval=MQTT_FIELD_SEEN_INTERVAL)
+
+
+def has_message_sufficiently_changed(
+    message: str, cache_key: str, parsed_message: Union[dict, None] = None
+) -> bool:
+    """Compares the message against the last message for the same key to see if it has
+    changed - excluding ignored fields. This helps prevent event triggers when a device
+    rebroadcasts a message, with little to no content change.
+
+    Messages are compared using the digest held in the in-process message state store, so no
+    network round trip is needed once a key has been seen. If parsed_message is supplied the
+    raw message is not parsed again."""
+    payload = None
+    if isinstance(parsed_message, dict):
+        payload = strip_ignored_fields(parsed_message)
+
+    previous_state = message_state.get(cache_key)
+    current_state = message_state.set(cache_key, raw=message, payload=payload)
+    has_changed = True
+
+    if previous_state and current_state:
+        if previous_state.digest == current_state.digest:
             logger.info("Message content unchanged - skipping event triggers")
             has_changed = False
 
-    # device has no message or message is different from cached value
+    # device has no message or message is different from previous value
     if has_changed:
         logger.info("Message content changed - checking event triggers")
 
-    cache.set(key=cache_key, value=message, timeout=None)
     return has_changed
 
 
+def process_message(
+    topic: str, payload: bytes, log_writer: "ZigbeeLogWriter" = None
+) -> None:
+    """Ingest worker handler - processes a message received through MQTT topic subscriptions"""
+    now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    logger.info("MQTT msg received: %s - [%s] %s", now, topic, payload)
+    MQTTMessage(topic=topic, payload=payload, log_writer=log_writer)
+
+
 class MQTTClient:
-    """Handles connection to MQTT server and parsing all messages"""
+    """Handles connection to MQTT server and hands all messages to the ingest pipeline"""
 
     client = None
     subscribed_topics = None
+    ingest = None
+    log_writer = None
 
     def __init__(
         self,
@@ -118,6 +189,24 @@ class MQTTClient:
         rand_num = int(random() * 1000)
         self.client_name = f"{str(client_name)}-{rand_num}"
 
+        # topic -> device and device -> trigger lookups are served from memory for the life of
+        # the process
+        device_topic_index.warm()
+        event_trigger_index.warm()
+
+        self.log_writer = ZigbeeLogWriter(
+            batch_size=MQTT_LOG_BATCH_SIZE, interval_ms=MQTT_LOG_BATCH_INTERVAL_MS
+        ).start()
+
+        self.ingest = IngestPipeline(
+            handler=partial(process_message, log_writer=self.log_writer),
+            workers=MQTT_INGEST_WORKERS,
+            maxsize=MQTT_INGEST_QUEUE_SIZE,
+            overflow_policy=MQTT_INGEST_OVERFLOW_POLICY,
+            block_timeout=MQTT_INGEST_BLOCK_TIMEOUT,
+            spill_path=MQTT_INGEST_SPILL_PATH,
+        ).start()
+
         self.connect()
 
     def connect(self) -> None:
@@ -162,16 +251,12 @@ class MQTTClient:
             )
 
     def on_message(self, client, user_data, message) -> None:
-        """Callback function - called each time a message is received"""
+        """Callback function - called each time a message is received. This runs on the paho
+        network thread, so the message is only queued - processing happens on ingest workers."""
         try:
-            now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            topic = message.topic
-            payload = message.payload.decode("utf-8")
-
-            logger.info("MQTT msg received: %s - [%s] %s", now, topic, str(payload))
-            MQTTMessage(topic=topic, payload=payload)
+            self.ingest.put(topic=message.topic, payload=message.payload)
         except Exception as ex:
-            logger.debug("There was a problem parsing MQTT message - %s", ex)
+            logger.debug("There was a problem queueing MQTT message - %s", ex)
 
     def on_subscribe(self, client, user_data, mid, qos) -> None:
         """Callback function - called when MQTT subscribers have been successful"""
@@ -186,6 +271,14 @@ class MQTTClient:
         self.client.disconnect()
         self.client = None
 
+        if self.ingest:
+            self.ingest.stop()
+
+        if self.log_writer:
+            self.log_writer.stop()
+
+        message_state.flush()
+
     def get_topics_for_subscribing(self) -> None:
         """Returns list of topics used to subscribe to via MQTT broker"""
         topics_for_subscribing = []
@@ -212,18 +305,28 @@ class MQTTMessage:
     raw_payload = None
     parsed_payload = None
 
-    def __init__(self, topic: str, payload: str) -> None:
-        """Constructor"""
+    def __init__(
+        self,
+        topic: str,
+        payload: Union[str, bytes],
+        log_writer: "ZigbeeLogWriter" = None,
+    ) -> None:
+        """Constructor - the payload is parsed here, once, and parsed_payload is shared by
+        every later step (dedup, change detection, logs and event triggers)"""
+        self.log_writer = log_writer or ZigbeeLogWriter()
+
         if len(payload) == 0:
             logger.debug("MQTT Message - payload empty - ignored")
             return
 
         self.topic = str(topic).strip().lower()
-        self.raw_payload = payload
 
         try:
-            self.parsed_payload = json.loads(payload)
-        except JSONDecodeError as ex:
+            self.parsed_payload = codec.loads(payload)
+            self.raw_payload = (
+                payload.decode("utf-8") if isinstance(payload, bytes) else payload
+            )
+        except (codec.DecodeError, UnicodeDecodeError) as ex:
             logger.error(
                 "MQTT Messsage - could not process payload - %s - %s", ex, payload
             )
@@ -354,16 +457,19 @@ class MQTTMessage:
 
             # make sure message does not already exist first - MQTT devices rebroadcast if
             # it is not aware that the message has been received
-            existing_messages = ZigbeeMessage.objects.filter(
-                raw_message=self.raw_payload
-            ).count()
+            digest = ZigbeeMessage.get_digest(
+                topic=self.topic, payload=self.parsed_payload
+            )
 
-            if existing_messages > 0:
+            if ZigbeeMessage.is_duplicate(digest=digest):
                 logger.info("Duplicate message - ignoring")
                 return
 
             zigbee_message = ZigbeeMessage(
-                zigbee_device=None, raw_message=self.raw_payload, topic=self.topic
+                zigbee_device=None,
+                raw_message=self.raw_payload,
+                topic=self.topic,
+                message_digest=digest,
             )
 
             mqtt_data = payload
@@ -377,40 +483,55 @@ class MQTTMessage:
                 return
 
             cache_key = get_cache_key(device_identifier=self.topic)
-            # take a copy of the last cache value and pass it through for comparison
-            last_message = cache.get(cache_key, "")
+            # take a copy of the last parsed message and pass it through for comparison
+            last_state = message_state.get(cache_key)
+            last_message = last_state.payload if last_state else None
 
             has_message_changed = has_message_sufficiently_changed(
-                message=self.raw_payload, cache_key=cache_key
+                message=self.raw_payload,
+                cache_key=cache_key,
+                parsed_message=mqtt_data,
             )
             logger.info("%s - Creating ZigbeeMessage: %s", __name__, zigbee_message)
 
             # updates zigbeedevice field and saves object
             try:
                 zigbee_message.save(
-                    check_triggers=has_message_changed, last_message=last_message
+                    check_triggers=has_message_changed,
+                    last_message=last_message,
+                    parsed_message=mqtt_data,
                 )
             except Exception as ex:
                 logger.info("Could not create ZigbeeMessage - %s", ex)
+                return
 
             logger.info("%s - ZigbeeMessage saved", __name__)
 
-            for field in mqtt_data:
-                value = mqtt_data[field]
+            # logs are built in memory and written in one query (or batched with other messages)
+            logs = [
+                ZigbeeLog(
+                    broker_message=zigbee_message,
+                    metadata_type=field,
+                    metadata_value=value,
+                    numeric_value=ZigbeeLog.get_numeric_value(value),
+                    zigbee_device_id=zigbee_message.zigbee_device_id,
+                    received_at=zigbee_message.created_at,
+                )
+                for field, value in mqtt_data.items()
+                if len(str(value)) > 0
+            ]
+            self.log_writer.write(logs)
+
+            # device pages read the newest value of each field from the latest state table
+            try:
+                DeviceLatestState.objects.upsert(zigbee_message, mqtt_data)
+            except Exception as ex:
+                logger.error("Could not update device latest state - %s", ex)
 
-                if len(str(value)) > 0:
-                    log = ZigbeeLog(
-                        broker_message=zigbee_message,
-                        metadata_type=field,
-                        metadata_value=value,
-                    )
-                    if not log:
-                        logger.error(
-                            "%s - parse_message - could not record ZigbeeMessage - data: %s",
-                            __name__,
-                            mqtt_data,
-                        )
-                    log.save()
+            last_seen.record(zigbee_message.zigbee_device_id, zigbee_message.created_at)
+            field_catalog.record(
+                zigbee_message.zigbee_device_id, mqtt_data, zigbee_message.created_at
+            )
 
             logger.info("%s - parse_message - message successfully parsed", __name__)
 
@@ -1,13 +1,21 @@
-"""Creates an MQTT client, publishes a message, and closes connection"""
-import datetime
+"""Publishes messages to the MQTT broker over a long-lived connection shared by the process"""
+import heapq
+import itertools
 import json
 import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from random import random
+from typing import Deque, Dict, List, Tuple, Union
 
 import paho.mqtt.client as mqtt
 
-from smarthub.settings import (MQTT_BASE_TOPIC, MQTT_CLIENT_NAME, MQTT_QOS,
-                               MQTT_SERVER)
+from smarthub.settings import (MQTT_BASE_TOPIC, MQTT_CLIENT_NAME, MQTT_PORT,
+                               MQTT_PUBLISH_TIMEOUT, MQTT_QOS, MQTT_SERVER)
 
 from .defines import MQTT_DEVICE_STATE_ENDPOINT, MQTT_STATE_COMMAND
 
@@ -18,91 +26,321 @@ class MQTTPublishError(Exception):
     """Custom exception to indicate error publishing to MQTT"""
 
 
-class MQTTPublish:
-    """Connects to MQTT broker, publishes message, and disconnects"""
+class PendingMessage:
+    """Message waiting to be sent and/or acknowledged by the broker"""
 
-    client = None
+    def __init__(self, topic: str, payload: str, qos: int, deadline: float) -> None:
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.deadline = deadline
+        self.mid = None
+        self.future = Future()
+
+
+class MQTTPublisher:
+    """Thread-safe publisher holding one connection to the MQTT broker.
+
+    The connection is started on first use and paho's network thread (loop_start) keeps it
+    alive, reconnecting if the broker drops it. publish() never waits - neither for the
+    connection nor for the broker. It returns a Future which is resolved when the broker
+    acknowledges the message (PUBACK for QoS 1), or failed with MQTTPublishError if that has not
+    happened by the message's deadline. Messages published before the broker has accepted the
+    connection are held and sent once it does - unless their deadline passes first, in which
+    case they are dropped and never sent."""
+
+    # seconds an acknowledgement received before its message id was registered is kept
+    EARLY_ACK_WINDOW = 1.0
 
     def __init__(
         self,
         server: str,
-        topic: str,
-        message: str,
-        qos: int,
+        port: int = 1883,
+        qos: int = 1,
+        timeout: float = 5.0,
+        keepalive: int = 60,
     ) -> None:
-        """Constructor captures required information for MQTT connection"""
-        self.server = server
-        self.topic = topic
-        self.message = message
+        self.server = str(server)
+        self.port = int(port)
+        self.qos = int(qos)
+        self.timeout = float(timeout)
+        self.keepalive = int(keepalive)
+        self.pid = os.getpid()
 
         # if client disconnected without informing the server then server will not allow another
-        # client to connect with the same name. To prevent a loop cycle, change name each
-        # connection
+        # client to connect with the same name - include pid and random number to keep unique
         rand_num = int(random() * 1000)
-        self.client_name = f"{MQTT_CLIENT_NAME} - publisher -{rand_num}"
-        self.qos = int(qos)
+        self.client_name = f"{MQTT_CLIENT_NAME} - publisher-{self.pid}-{rand_num}"
 
-        self.connect()
+        self.client = None
+        self._connected = threading.Event()
+        self._lock = threading.Lock()
+
+        # messages not yet acknowledged, keyed by a local id (paho only assigns a message id
+        # once the message is handed to it). Acks can arrive before the message id is
+        # registered (QoS 0 acks are immediate) - those are held in _early_acks. This lock is
+        # never held while calling into paho or resolving futures.
+        self._keys = itertools.count()
+        self._messages: Dict[int, PendingMessage] = {}
+        self._mids: Dict[int, int] = {}  # paho message id -> key
+        # keys held until the broker accepts the connection
+        self._unsent: Deque[int] = deque()
+        self._early_acks: Dict[int, float] = {}  # paho message id -> time received
+        self._acks_lock = threading.Lock()
+
+        # heap of (deadline, key) - watched by a background thread which fails messages that
+        # have not been acknowledged in time
+        self._deadlines: List[Tuple[float, int]] = []
+        self._deadlines_changed = threading.Condition(self._acks_lock)
+        self._watcher = None
+        self._closing = False
+
+    @property
+    def is_connected(self) -> bool:
+        """True when connected to the broker"""
+        return self._connected.is_set()
+
+    def connect(self, timeout: float = None) -> None:
+        """Start connecting to the broker (if not already connected). Returns immediately
+        unless timeout is given - then raises MQTTPublishError if the broker has not accepted
+        the connection within timeout seconds."""
+        with self._lock:
+            if not self._watcher:
+                with self._acks_lock:
+                    self._closing = False
+                self._watcher = threading.Thread(
+                    target=self._watch_deadlines, name="mqtt-publish-deadlines"
+                )
+                self._watcher.daemon = True
+                self._watcher.start()
+
+            if not self.client:
+                self.client = mqtt.Client(self.client_name)
+                self.client.on_connect = self.on_connect
+                self.client.on_disconnect = self.on_disconnect
+                self.client.on_publish = self.on_publish
+                self.client.reconnect_delay_set(min_delay=1, max_delay=30)
+                self.client.max_inflight_messages_set(100)
+
+                try:
+                    self.client.connect_async(self.server, self.port, self.keepalive)
+                    self.client.loop_start()
+                except Exception as ex:
+                    self.client = None
+                    raise MQTTPublishError("Could not connect to server") from ex
+
+        if timeout is not None and not self._connected.wait(timeout):
+            raise MQTTPublishError("Could not connect to server")
+
+    def publish(
+        self, topic: str, payload: str, qos: int = None, timeout: float = None
+    ) -> Future:
+        """Queue message for sending - returns Future resolved once the broker has it.
+
+        Parameters:
+            qos         - defaults to the publisher's qos
+            timeout     - seconds until the message's deadline - defaults to the publisher's
+                            timeout. The deadline covers connecting to the broker as well as
+                            waiting for the acknowledgement.
+        """
+        qos = self.qos if qos is None else int(qos)
+        timeout = self.timeout if timeout is None else float(timeout)
+        message = PendingMessage(topic, payload, qos, time.monotonic() + timeout)
 
-    def connect(self) -> None:
-        """Connects to MQTT broker and retains connection through loop"""
         try:
-            self.client = mqtt.Client(self.client_name)
-            self.client.on_connect = self.on_connect
-            self.client.on_message = self.on_message
-            self.client.on_disconnect = self.on_disconnect
-            self.client.on_publish = self.on_publish
-
-            self.client.connect(self.server)
-            self.client.loop_forever()
-        except Exception as ex:
-            logger.info(ex)
-            self.disconnect()
-
-            raise MQTTPublishError("Could not connect to server") from ex
-
-    def on_connect(
-        self, client, user_data, flags, result_code, properties=None
-    ) -> None:
-        """Called when client connects to broker"""
-        if result_code == 0:
-            logger.info("Connected to MQTT Broker")
-            # timer = threading.Timer(interval=10.0, function=self.disconnect)
-            # timer.start()
-
-            self.publish(topic=self.topic, payload=self.message, qos=self.qos)
-
-            # set non-blocking timer to disconnect
-
+            self.connect()
+        except MQTTPublishError as ex:
+            message.future.set_exception(ex)
+            return message.future
+
+        with self._acks_lock:
+            key = next(self._keys)
+            self._messages[key] = message
+            heapq.heappush(self._deadlines, (message.deadline, key))
+            self._deadlines_changed.notify()
+
+            if not self.is_connected:
+                self._unsent.append(key)
+                return message.future
+
+        self._send(key, message)
+        return message.future
+
+    def _send(self, key: int, message: PendingMessage) -> None:
+        """Hand message to paho and register its message id"""
+        info = self.client.publish(message.topic, message.payload, message.qos)
+
+        # paho holds QoS 1/2 messages published while disconnected and sends them on reconnect
+        is_queued = info.rc == mqtt.MQTT_ERR_NO_CONN and message.qos > 0
+
+        with self._acks_lock:
+            if key not in self._messages:
+                # deadline passed while the message was being sent
+                return
+
+            if info.rc != mqtt.MQTT_ERR_SUCCESS and not is_queued:
+                del self._messages[key]
+                error = MQTTPublishError(
+                    f"Could not publish message - {mqtt.error_string(info.rc)}"
+                )
+            else:
+                error = None
+                message.mid = info.mid
+                acked_at = self._early_acks.pop(info.mid, None)
+                if (
+                    acked_at is not None
+                    and time.monotonic() - acked_at < self.EARLY_ACK_WINDOW
+                ):
+                    del self._messages[key]
+                else:
+                    self._mids[info.mid] = key
+                    return
+
+        if error:
+            message.future.set_exception(error)
         else:
-            logger.error("Could not connect to MQTT broker")
-
-    def on_publish(self, client, user_data, mid):
-        logger.info("Message published - disconnecting...")
-        if mid > 0:
-            self.success = True
-        self.disconnect()
-
-    def publish(self, topic, payload, qos=1, retain=False, properties=None):
-        """Send messages to MQTT broker"""
-        self.client.publish(topic, payload, qos, retain, properties)
-
-    def on_message(self, client, user_data, message) -> None:
-        """Callback function - called each time a message is received"""
-        now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        topic = message.topic
-        payload = message.payload.decode("utf-8")
-
-        logger.info("MQTT msg received: %s - [%s] %s", now, topic, str(payload))
-
-    def on_disconnect(self, client, user_data, result_code):
-        """Callback function - called when client disconnects from MQTT broker"""
-        logger.info("MQTT client disconnected")
+            message.future.set_result(info.mid)
+
+    def _watch_deadlines(self) -> None:
+        """Fail messages which have not been acknowledged by their deadline"""
+        while True:
+            with self._deadlines_changed:
+                while not self._closing:
+                    wait = None
+                    if self._deadlines:
+                        wait = self._deadlines[0][0] - time.monotonic()
+                        if wait <= 0:
+                            break
+                    self._deadlines_changed.wait(wait)
+
+                if self._closing:
+                    return
+                expired = self._pop_expired(time.monotonic())
+
+            for message in expired:
+                logger.info("MQTT message not acknowledged in time - %s", message.topic)
+                message.future.set_exception(
+                    MQTTPublishError("Timed out waiting for broker acknowledgement")
+                )
+
+    def _pop_expired(self, now: float) -> List[PendingMessage]:
+        """Remove messages past their deadline - called with _acks_lock held. Messages that
+        were never sent are dropped from _unsent when it is flushed."""
+        expired = []
+        while self._deadlines and self._deadlines[0][0] <= now:
+            _, key = heapq.heappop(self._deadlines)
+            message = self._messages.pop(key, None)
+            if message is None:
+                continue
+            if message.mid is not None and self._mids.get(message.mid) == key:
+                del self._mids[message.mid]
+            expired.append(message)
+
+        for mid, acked_at in list(self._early_acks.items()):
+            if now - acked_at >= self.EARLY_ACK_WINDOW:
+                del self._early_acks[mid]
+        return expired
+
+    def on_connect(self, client, user_data, flags, result_code) -> None:
+        """Called when client connects to broker - sends messages held for the connection"""
+        if result_code != 0:
+            logger.error(
+                "MQTT publisher could not connect to broker - %s",
+                mqtt.connack_string(result_code),
+            )
+            return
+
+        logger.info("MQTT publisher connected to broker")
+        self._connected.set()
+
+        with self._acks_lock:
+            unsent, self._unsent = self._unsent, deque()
+            held = [
+                (key, self._messages[key]) for key in unsent if key in self._messages
+            ]
+
+        for key, message in held:
+            self._send(key, message)
+
+    def on_disconnect(self, client, user_data, result_code) -> None:
+        """Called when client disconnects - paho reconnects unless disconnect() was called"""
+        self._connected.clear()
+        logger.info("MQTT publisher disconnected (rc=%s)", result_code)
+
+    def on_publish(self, client, user_data, mid) -> None:
+        """Called when the broker has acknowledged a message"""
+        with self._acks_lock:
+            key = self._mids.pop(mid, None)
+            if key is None:
+                self._early_acks[mid] = time.monotonic()
+                return
+            message = self._messages.pop(key)
+
+        message.future.set_result(mid)
 
     def disconnect(self) -> None:
-        """Disconnects from MQTT broker - manually invoked via Ctrl+C in terminal"""
-        self.client.disconnect()
-        self.client = None
+        """Disconnect from broker - messages awaiting acknowledgement are failed"""
+        with self._lock:
+            client, self.client = self.client, None
+            watcher, self._watcher = self._watcher, None
+
+        if client:
+            client.disconnect()
+            client.loop_stop()
+        self._connected.clear()
+
+        with self._acks_lock:
+            self._closing = True
+            self._deadlines_changed.notify()
+
+            messages, self._messages = self._messages, {}
+            self._mids = {}
+            self._unsent = deque()
+            self._early_acks = {}
+            self._deadlines = []
+
+        if watcher:
+            watcher.join()
+
+        for message in messages.values():
+            message.future.set_exception(MQTTPublishError("Disconnected from server"))
+
+
+_publisher = None
+_publisher_lock = threading.Lock()
+
+
+def get_publisher() -> MQTTPublisher:
+    """Return the publisher for this process - a new one is created after a fork"""
+    global _publisher  # pylint: disable=global-statement
+
+    with _publisher_lock:
+        if _publisher is None or _publisher.pid != os.getpid():
+            _publisher = MQTTPublisher(
+                server=MQTT_SERVER,
+                port=MQTT_PORT,
+                qos=MQTT_QOS or 1,
+                timeout=MQTT_PUBLISH_TIMEOUT,
+            )
+        return _publisher
+
+
+def wait_for_delivery(futures: List[Future], timeout: float = None):
+    """Wait for all messages to be acknowledged - the messages are in flight together, so this
+    takes as long as the slowest message rather than the sum of them all. Each message fails at
+    its own deadline, so timeout is only needed to give up sooner than that."""
+    deadline = None if timeout is None else time.monotonic() + timeout
+
+    for future in futures:
+        if future is None:
+            continue
+        remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            future.result(timeout=remaining)
+        except FutureTimeoutError as ex:
+            raise MQTTPublishError(
+                "Timed out waiting for broker acknowledgement"
+            ) from ex
 
 
 def send_message(
@@ -111,7 +349,9 @@ def send_message(
     command_value="",
     base_topic=MQTT_BASE_TOPIC,
     state_endpoint=MQTT_DEVICE_STATE_ENDPOINT,
-):
+    wait=True,
+    timeout=None,
+) -> Union[Future, None]:
     """Publish message to MQTT broker.
 
     Parameters:
@@ -124,6 +364,11 @@ def send_message(
                             MQTT_BASE_TOPIC
         state_endpoint  - the device topic endpoint for changing device state -
                             e.g. [base_topic]/[device_topic]/[state_endpoint]
+        wait            - wait for the broker to acknowledge the message. When False the
+                            Future for the message is returned without waiting.
+        timeout         - seconds the broker has to acknowledge the message, including
+                            connecting - defaults to MQTT_PUBLISH_TIMEOUT. If the message has
+                            not been sent by then it is dropped.
     """
     if not mqtt_topic:
         logger.info("%s - device friendly_name empty - cannot proceed", __name__)
@@ -137,21 +382,42 @@ def send_message(
     logger.info("Publishing to MQTT topic %s: %s", device_state_topic, command)
 
     # exceptions are handled in view
-    MQTTPublish(
-        server=str(MQTT_SERVER), topic=device_state_topic, message=command, qos=MQTT_QOS
+    future = get_publisher().publish(
+        topic=device_state_topic, payload=command, timeout=timeout
     )
 
+    if wait:
+        wait_for_delivery([future])
+    return future
+
 
 def send_messages(
     message_list: dict,
     base_topic=MQTT_BASE_TOPIC,
     state_endpoint=MQTT_DEVICE_STATE_ENDPOINT,
-):
-    """Handles publishing multiple messages - only needs one broker connection"""
+    wait=True,
+    timeout=None,
+) -> List[Future]:
+    """Handles publishing multiple messages - all messages are sent over the shared broker
+    connection before waiting for any acknowledgements. See send_message() for wait and
+    timeout."""
+    futures = []
     for message in message_list:
         assert message["mqtt_topic"]
         assert message["command"]
         assert message["command_value"]
         assert len(message) == 3
 
-        send_message(**message, base_topic=base_topic, state_endpoint=state_endpoint)
+        futures.append(
+            send_message(
+                **message,
+                base_topic=base_topic,
+                state_endpoint=state_endpoint,
+                wait=False,
+                timeout=timeout,
+            )
+        )
+
+    if wait:
+        wait_for_delivery(futures)
+    return futures
@@ -0,0 +1,161 @@
+"""Two tier store for the last message received on each topic - used for change detection.
+
+Tier one is an in-process LRU holding the parsed message (with ignored fields removed) and its
+digest, so change detection is a digest comparison without any network round trip. Tier two is
+the shared django cache (memcached) which other processes read - writes to it happen in the
+background (write-behind) and only the newest message per key is written."""
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, NamedTuple, Optional, Union
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+class MessageState(NamedTuple):
+    """Last message received for a topic"""
+
+    raw: str
+    payload: dict  # parsed message, as returned by the store parser
+    digest: str
+
+
+def get_payload_digest(payload: dict) -> str:
+    """Return digest of payload - key order does not affect the digest"""
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class MessageStateStore:
+    """In-process LRU of MessageState objects with write-behind to the django cache.
+
+    Parameters:
+        parser                  - converts a raw message into the dict used for comparison.
+                                    Returns None if the message cannot be parsed.
+        maxsize                 - number of keys (topics) held in memory
+        write_behind_interval   - seconds between background writes to the django cache. If 0
+                                    the django cache is updated synchronously on each set().
+    """
+
+    def __init__(
+        self,
+        parser: Callable[[str], Optional[dict]],
+        maxsize: int = 1024,
+        write_behind_interval: float = 1.0,
+    ) -> None:
+        self.parser = parser
+        self.maxsize = max(1, int(maxsize))
+        self.write_behind_interval = float(write_behind_interval)
+
+        self._states: "OrderedDict[str, MessageState]" = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def build_state(
+        self, raw: str, payload: Union[dict, None] = None
+    ) -> Optional[MessageState]:
+        """Create MessageState for raw message - payload can be passed in if the message has
+        already been parsed. Returns None if the message cannot be parsed."""
+        if payload is None:
+            payload = self.parser(raw)
+
+        if payload is None:
+            return None
+
+        return MessageState(
+            raw=raw, payload=payload, digest=get_payload_digest(payload)
+        )
+
+    def get(self, key: str) -> Optional[MessageState]:
+        """Return state for key - on a local miss the django cache is read once"""
+        with self._lock:
+            state = self._states.get(key)
+            if state:
+                self._states.move_to_end(key)
+                return state
+
+        raw = cache.get(key)
+        if not raw:
+            return None
+
+        state = self.build_state(raw=raw)
+        if state:
+            self._store(key, state)
+        return state
+
+    def set(
+        self, key: str, raw: str, payload: Union[dict, None] = None
+    ) -> Optional[MessageState]:
+        """Store the latest message for key and queue it for writing to the django cache"""
+        state = self.build_state(raw=raw, payload=payload)
+
+        if state:
+            self._store(key, state)
+        else:
+            self.discard(key)
+
+        if self.write_behind_interval <= 0:
+            cache.set(key=key, value=raw, timeout=None)
+            return state
+
+        with self._lock:
+            self._pending[key] = raw
+        self._ensure_writer()
+
+        return state
+
+    def discard(self, key: str) -> None:
+        """Remove locally held state for key"""
+        with self._lock:
+            self._states.pop(key, None)
+
+    def clear(self) -> None:
+        """Remove all locally held state (pending writes are kept)"""
+        with self._lock:
+            self._states.clear()
+
+    def flush(self) -> int:
+        """Write pending messages to the django cache - returns number of keys written"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        if not pending:
+            return 0
+
+        try:
+            cache.set_many(pending, timeout=None)
+        except Exception as ex:
+            logger.error("Could not write message state to cache - %s", ex)
+            return 0
+
+        return len(pending)
+
+    def _store(self, key: str, state: MessageState) -> None:
+        with self._lock:
+            self._states[key] = state
+            self._states.move_to_end(key)
+
+            while len(self._states) > self.maxsize:
+                self._states.popitem(last=False)
+
+    def _ensure_writer(self) -> None:
+        """Lazily start the background thread that writes to the django cache"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+
+            self._thread = threading.Thread(
+                target=self._write_behind, name="mqtt-state-writer", daemon=True
+            )
+            self._thread.start()
+
+    def _write_behind(self) -> None:
+        while True:
+            time.sleep(self.write_behind_interval)
+            self.flush()
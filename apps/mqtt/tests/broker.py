@@ -0,0 +1,183 @@
+"""Minimal MQTT 3.1.1 broker used by tests and benchmarks in place of a real broker.
+
+Accepts connections, acknowledges CONNECT/PUBLISH/SUBSCRIBE/PINGREQ and records published
+messages. It does not route messages to subscribers."""
+import socket
+import struct
+import threading
+import time
+from typing import List, Tuple
+
+CONNECT = 1
+PUBLISH = 3
+PUBREL = 6
+SUBSCRIBE = 8
+PINGREQ = 12
+DISCONNECT = 14
+
+
+class StubBroker:
+    """Threaded stand-in broker.
+
+    Parameters:
+        ack_delay       - seconds to wait before sending PUBACK (simulates network/broker latency)
+        send_connack    - when False the broker accepts TCP connections but never answers CONNECT
+    """
+
+    def __init__(
+        self, host: str = "127.0.0.1", ack_delay: float = 0.0, send_connack: bool = True
+    ) -> None:
+        self.host = host
+        self.port = None
+        self.ack_delay = ack_delay
+        self.send_connack = send_connack
+
+        self.messages: List[Tuple[str, bytes]] = []
+        self.connections = 0
+
+        self._socket = None
+        self._clients = []
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def start(self) -> "StubBroker":
+        """Listen on a free port"""
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((self.host, 0))
+        self._socket.listen(16)
+        self.port = self._socket.getsockname()[1]
+
+        threading.Thread(target=self._accept, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        """Close the listening socket and all client connections"""
+        self._stopped.set()
+        for sock in [self._socket] + self._clients:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    def drop_clients(self) -> None:
+        """Close all client connections (clients are expected to reconnect)"""
+        clients, self._clients = self._clients, []
+        for client in clients:
+            try:
+                client.shutdown(socket.SHUT_RDWR)
+                client.close()
+            except OSError:
+                pass
+
+    def wait_for_messages(self, count: int, timeout: float = 5.0) -> bool:
+        """Wait until count messages have been received"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if len(self.messages) >= count:
+                return True
+            time.sleep(0.01)
+        return False
+
+    def _accept(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                client, _ = self._socket.accept()
+            except OSError:
+                return
+
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._clients.append(client)
+            self.connections += 1
+            threading.Thread(target=self._serve, args=(client,), daemon=True).start()
+
+    def _serve(self, client: socket.socket) -> None:
+        send_lock = threading.Lock()
+
+        def send(data: bytes) -> None:
+            with send_lock:
+                try:
+                    client.sendall(data)
+                except OSError:
+                    pass
+
+        try:
+            while not self._stopped.is_set():
+                header = self._read(client, 1)
+                if not header:
+                    return
+
+                packet_type, flags = header[0] >> 4, header[0] & 0x0F
+                body = self._read(client, self._read_length(client))
+
+                if packet_type == CONNECT:
+                    if self.send_connack:
+                        send(b"\x20\x02\x00\x00")
+                elif packet_type == PUBLISH:
+                    self._publish(body, (flags >> 1) & 0x03, send)
+                elif packet_type == PUBREL:
+                    send(b"\x70\x02" + body[:2])
+                elif packet_type == SUBSCRIBE:
+                    granted = bytes(body[index] for index in self._qos_offsets(body))
+                    send(bytes([0x90, 2 + len(granted)]) + body[:2] + granted)
+                elif packet_type == PINGREQ:
+                    send(b"\xd0\x00")
+                elif packet_type == DISCONNECT:
+                    return
+        except OSError:
+            return
+        finally:
+            client.close()
+
+    def _publish(self, body: bytes, qos: int, send) -> None:
+        topic_length = struct.unpack("!H", body[:2])[0]
+        topic = body[2 : 2 + topic_length].decode("utf-8")
+        offset = 2 + topic_length
+
+        packet_id = b""
+        if qos:
+            packet_id = body[offset : offset + 2]
+            offset += 2
+
+        with self._lock:
+            self.messages.append((topic, body[offset:]))
+
+        if not qos:
+            return
+
+        ack = (b"\x40\x02" if qos == 1 else b"\x50\x02") + packet_id
+        if self.ack_delay:
+            threading.Timer(self.ack_delay, send, args=(ack,)).start()
+        else:
+            send(ack)
+
+    @staticmethod
+    def _qos_offsets(body: bytes):
+        """Offsets of the requested QoS byte for each topic filter in a SUBSCRIBE packet"""
+        offset = 2
+        while offset < len(body):
+            length = struct.unpack("!H", body[offset : offset + 2])[0]
+            offset += 2 + length
+            yield offset
+            offset += 1
+
+    @staticmethod
+    def _read(client: socket.socket, length: int) -> bytes:
+        data = b""
+        while len(data) < length:
+            chunk = client.recv(length - len(data))
+            if not chunk:
+                return b""
+            data += chunk
+        return data
+
+    def _read_length(self, client: socket.socket) -> int:
+        multiplier, length = 1, 0
+        while True:
+            byte = self._read(client, 1)
+            if not byte:
+                raise OSError("connection closed")
+            length += (byte[0] & 0x7F) * multiplier
+            if not byte[0] & 0x80:
+                return length
+            multiplier *= 128
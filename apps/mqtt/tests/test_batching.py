@@ -0,0 +1,58 @@
+from django.test import TestCase
+
+from ...zigbee.models import ZigbeeLog
+from ...zigbee.tests.factories import ZigbeeMessageFactory
+from ..batching import ZigbeeLogWriter
+
+
+class TestZigbeeLogWriter(TestCase):
+    def setUp(self):
+        self.message = ZigbeeMessageFactory()
+
+    def build_logs(self, amount: int) -> list:
+        return [
+            ZigbeeLog(
+                broker_message=self.message,
+                metadata_type=f"field_{number}",
+                metadata_value=number,
+            )
+            for number in range(amount)
+        ]
+
+    def test_logs_are_written_immediately_in_one_query(self):
+        writer = ZigbeeLogWriter()
+
+        with self.assertNumQueries(1):
+            writer.write(self.build_logs(12))
+
+        self.assertEqual(ZigbeeLog.objects.count(), 12)
+
+    def test_micro_batching_buffers_logs_until_flushed(self):
+        writer = ZigbeeLogWriter(batch_size=100, interval_ms=60000)
+
+        writer.write(self.build_logs(5))
+        writer.write(self.build_logs(5))
+
+        self.assertEqual(ZigbeeLog.objects.count(), 0)
+        self.assertEqual(len(writer.buffer), 10)
+
+        self.assertEqual(writer.flush(), 10)
+        self.assertEqual(ZigbeeLog.objects.count(), 10)
+        self.assertEqual(writer.buffer, [])
+
+    def test_micro_batching_flushes_when_batch_size_reached(self):
+        writer = ZigbeeLogWriter(batch_size=10, interval_ms=60000)
+
+        writer.write(self.build_logs(6))
+        self.assertEqual(ZigbeeLog.objects.count(), 0)
+
+        writer.write(self.build_logs(6))
+        self.assertEqual(ZigbeeLog.objects.count(), 12)
+
+    def test_stop_flushes_remaining_logs(self):
+        writer = ZigbeeLogWriter(batch_size=100, interval_ms=60000)
+
+        writer.write(self.build_logs(3))
+        writer.stop()
+
+        self.assertEqual(ZigbeeLog.objects.count(), 3)
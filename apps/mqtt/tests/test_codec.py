@@ -0,0 +1,26 @@
+from django.test import SimpleTestCase
+
+from .. import codec
+
+
+class TestCodec(SimpleTestCase):
+    def test_loads_accepts_bytes_and_str(self):
+        self.assertEqual(codec.loads(b'{"a": 1}'), {"a": 1})
+        self.assertEqual(codec.loads('{"a": 1}'), {"a": 1})
+
+    def test_invalid_json_raises_decode_error(self):
+        with self.assertRaises(codec.DecodeError):
+            codec.loads(b"{not-json")
+
+    def test_sorted_dumps_is_canonical_for_every_codec(self):
+        payload = {"b": [1, 2.5, None], "a": {"d": True, "c": "é/x"}}
+        expected = '{"a":{"c":"é/x","d":true},"b":[1,2.5,null]}'
+
+        for name in ("json", "orjson", "ujson"):
+            with self.subTest(codec=name):
+                self.assertEqual(
+                    codec.get_codec(name).dumps(payload, sort_keys=True), expected
+                )
+
+    def test_unavailable_codec_falls_back_to_json(self):
+        self.assertEqual(codec.get_codec("not-a-codec").name, "json")
@@ -0,0 +1,194 @@
+import os
+import tempfile
+import threading
+from unittest import mock
+
+from django.test import TestCase
+
+from .. import defines
+from ..ingest import IngestPipeline
+
+
+class TestIngestPipeline(TestCase):
+    def setUp(self):
+        self.processed = []
+        self.handled = threading.Event()
+
+    def handler(self, topic, payload):
+        self.processed.append((topic, payload))
+        self.handled.set()
+
+    def test_invalid_overflow_policy_raises_error(self):
+        with self.assertRaises(ValueError):
+            IngestPipeline(handler=self.handler, overflow_policy="not-a-policy")
+
+    def test_spill_policy_requires_spill_path(self):
+        with self.assertRaises(ValueError):
+            IngestPipeline(
+                handler=self.handler, overflow_policy=defines.INGEST_OVERFLOW_SPILL
+            )
+
+    def test_messages_are_processed_by_workers(self):
+        pipeline = IngestPipeline(handler=self.handler, workers=2, maxsize=10).start()
+
+        pipeline.put(topic="zigbee2mqtt/sensor", payload=b'{"a": 1}')
+        pipeline.stop()
+
+        self.assertEqual(self.processed, [("zigbee2mqtt/sensor", b'{"a": 1}')])
+        self.assertEqual(pipeline.stats()["processed"], 1)
+        self.assertEqual(pipeline.depth, 0)
+
+    def test_messages_for_same_topic_are_processed_in_order(self):
+        pipeline = IngestPipeline(handler=self.handler, workers=4, maxsize=400).start()
+
+        for number in range(50):
+            pipeline.put(topic="zigbee2mqtt/sensor", payload=str(number).encode())
+        pipeline.stop()
+
+        payloads = [int(payload) for _, payload in self.processed]
+        self.assertEqual(payloads, list(range(50)))
+
+    def test_handler_exception_does_not_stop_worker(self):
+        handler = mock.Mock(side_effect=[Exception("boom"), None])
+        pipeline = IngestPipeline(handler=handler, workers=1, maxsize=10).start()
+
+        pipeline.put(topic="topic", payload=b"1")
+        pipeline.put(topic="topic", payload=b"2")
+        pipeline.stop()
+
+        stats = pipeline.stats()
+        self.assertEqual(handler.call_count, 2)
+        self.assertEqual(stats["failed"], 1)
+        self.assertEqual(stats["processed"], 1)
+
+    def test_depth_reports_queued_messages(self):
+        # workers are not started so messages remain queued
+        pipeline = IngestPipeline(handler=self.handler, workers=2, maxsize=10)
+
+        pipeline.put(topic="topic-1", payload=b"1")
+        pipeline.put(topic="topic-2", payload=b"2")
+
+        self.assertEqual(pipeline.depth, 2)
+        self.assertEqual(pipeline.stats()["depth"], 2)
+
+    def test_drop_newest_policy_drops_incoming_message(self):
+        pipeline = IngestPipeline(
+            handler=self.handler,
+            workers=1,
+            maxsize=2,
+            overflow_policy=defines.INGEST_OVERFLOW_DROP_NEWEST,
+        )
+
+        results = [
+            pipeline.put(topic="topic", payload=str(n).encode()) for n in range(3)
+        ]
+
+        self.assertEqual(results, [True, True, False])
+        self.assertEqual(pipeline.stats()["dropped"], 1)
+        queued = [pipeline.queues[0].get_nowait().payload for _ in range(2)]
+        self.assertEqual(queued, [b"0", b"1"])
+
+    def test_drop_oldest_policy_keeps_newest_messages(self):
+        pipeline = IngestPipeline(
+            handler=self.handler,
+            workers=1,
+            maxsize=2,
+            overflow_policy=defines.INGEST_OVERFLOW_DROP_OLDEST,
+        )
+
+        for number in range(3):
+            self.assertTrue(pipeline.put(topic="topic", payload=str(number).encode()))
+
+        self.assertEqual(pipeline.stats()["dropped"], 1)
+        queued = [pipeline.queues[0].get_nowait().payload for _ in range(2)]
+        self.assertEqual(queued, [b"1", b"2"])
+
+    def test_block_policy_drops_message_after_timeout(self):
+        pipeline = IngestPipeline(
+            handler=self.handler,
+            workers=1,
+            maxsize=1,
+            overflow_policy=defines.INGEST_OVERFLOW_BLOCK,
+            block_timeout=0.01,
+        )
+
+        self.assertTrue(pipeline.put(topic="topic", payload=b"1"))
+        self.assertFalse(pipeline.put(topic="topic", payload=b"2"))
+        self.assertEqual(pipeline.stats()["dropped"], 1)
+
+    def test_spill_policy_persists_and_replays_messages(self):
+        with tempfile.TemporaryDirectory() as directory:
+            spill_path = os.path.join(directory, "spill.jsonl")
+            pipeline = IngestPipeline(
+                handler=self.handler,
+                workers=1,
+                maxsize=1,
+                overflow_policy=defines.INGEST_OVERFLOW_SPILL,
+                spill_path=spill_path,
+            )
+
+            pipeline.put(topic="topic", payload=b"1")
+            pipeline.put(topic="topic", payload=b"2")
+
+            self.assertEqual(pipeline.stats()["spilled"], 1)
+            self.assertTrue(os.path.exists(pipeline.spill_paths[0]))
+
+            # free up space and replay
+            pipeline.queues[0].get_nowait()
+            replayed = pipeline.replay_spilled()
+
+            self.assertEqual(replayed, 1)
+            self.assertFalse(os.path.exists(pipeline.spill_paths[0]))
+            self.assertEqual(pipeline.queues[0].get_nowait().payload, b"2")
+
+    def test_messages_are_spilled_behind_spilled_messages(self):
+        with tempfile.TemporaryDirectory() as directory:
+            pipeline = IngestPipeline(
+                handler=self.handler,
+                workers=1,
+                maxsize=1,
+                overflow_policy=defines.INGEST_OVERFLOW_SPILL,
+                spill_path=os.path.join(directory, "spill.jsonl"),
+            )
+            shard = pipeline.queues[0]
+
+            pipeline.put(topic="topic", payload=b"1")
+            pipeline.put(topic="topic", payload=b"2")
+            shard.get_nowait()
+            # there is room in the queue, but 2 has not been replayed yet
+            self.assertFalse(pipeline.put(topic="topic", payload=b"3"))
+            self.assertTrue(shard.empty())
+
+            payloads = []
+            while pipeline.replay_spilled():
+                payloads.append(shard.get_nowait().payload)
+
+            self.assertEqual(payloads, [b"2", b"3"])
+            self.assertEqual(pipeline.stats()["spill_depth"], 0)
+
+    def test_workers_replay_spilled_messages_in_order(self):
+        with tempfile.TemporaryDirectory() as directory:
+            pipeline = IngestPipeline(
+                handler=self.handler,
+                workers=1,
+                maxsize=2,
+                overflow_policy=defines.INGEST_OVERFLOW_SPILL,
+                spill_path=os.path.join(directory, "spill.jsonl"),
+                stats_interval=60,
+            )
+            for number in range(10):
+                pipeline.put(topic="topic", payload=str(number).encode())
+            self.assertEqual(pipeline.stats()["spilled"], 8)
+
+            pipeline.start()
+            pipeline.stop()
+
+            payloads = [int(payload) for _, payload in self.processed]
+            self.assertEqual(payloads, list(range(10)))
+
+    def test_spill_directory_only_created_for_spill_policy(self):
+        with tempfile.TemporaryDirectory() as directory:
+            spill_path = os.path.join(directory, "spill", "spill.jsonl")
+            IngestPipeline(handler=self.handler, spill_path=spill_path)
+
+            self.assertFalse(os.path.exists(os.path.dirname(spill_path)))
@@ -6,8 +6,10 @@ from django.test import TestCase, override_settings
 
 from ...zigbee.models import ZigbeeDevice, ZigbeeLog, ZigbeeMessage
 from ...zigbee.tests.factories import ZigbeeDeviceFactory
+from .. import codec
 from ..management.commands.mqtt import (MQTTClient, MQTTMessage,
                                         has_message_sufficiently_changed,
+                                        message_state,
                                         parse_message_for_comparison)
 from ..utils import get_cache_key
 
@@ -58,6 +60,7 @@ class TestHasMessageSufficientlyChanged(TestCase):
         autospec=True,
     )
     def setUp(self, mock_ignored):
+        message_state.clear()
         self.ignored_fields = [
             "dummy_field_1",
             "dummy_field_3",
@@ -81,7 +84,12 @@ class TestHasMessageSufficientlyChanged(TestCase):
         # call to create cache for message
         has_message_sufficiently_changed(message=self.message, cache_key=self.cache_key)
 
-    def test_when_message_is_unchanged_returns_false(self):
+    @mock.patch(
+        "apps.mqtt.management.commands.mqtt.defines",
+        autospec=True,
+    )
+    def test_when_message_is_unchanged_returns_false(self, mock_ignored):
+        mock_ignored.MESSAGE_FIELDS_TO_IGNORE = self.ignored_fields
         self.assertFalse(
             has_message_sufficiently_changed(
                 message=self.message, cache_key=self.cache_key
@@ -109,6 +117,7 @@ class TestHasMessageSufficientlyChanged(TestCase):
         self.assertFalse(
             has_message_sufficiently_changed(message=message, cache_key=self.cache_key)
         )
+        message_state.flush()
         self.assertEqual(message, cache.get(self.cache_key))
 
     @mock.patch(
@@ -132,8 +141,19 @@ class TestHasMessageSufficientlyChanged(TestCase):
         self.assertTrue(
             has_message_sufficiently_changed(message=message, cache_key=self.cache_key)
         )
+        message_state.flush()
         self.assertEqual(message, cache.get(self.cache_key))
 
+    def test_previous_message_is_read_from_cache_when_not_held_in_memory(self):
+        message_state.flush()
+        message_state.clear()
+
+        self.assertFalse(
+            has_message_sufficiently_changed(
+                message=self.message, cache_key=self.cache_key
+            )
+        )
+
 
 @override_settings(
     CACHES={
@@ -144,6 +164,7 @@ class TestHasMessageSufficientlyChanged(TestCase):
 )
 class TestMQTTMessage(TestCase):
     def setUp(self):
+        message_state.clear()
         self.devices_payload = json.dumps(
             [
                 {
@@ -378,6 +399,52 @@ class TestMQTTMessage(TestCase):
         self.assertTrue(
             zb_logs.filter(metadata_type="a_number_field", metadata_value=1234).exists()
         )
+        # numbers are also stored as typed values for time series
+        self.assertEqual(
+            dict(zb_logs.values_list("metadata_type", "numeric_value")),
+            {"some_field": None, "another_field": None, "a_number_field": 1234.0},
+        )
+        self.assertEqual(
+            set(zb_logs.values_list("received_at", flat=True)),
+            {zb_message.first().created_at},
+        )
+
+    def test_bytes_payload_is_parsed_once_per_message(self):
+        device_message = json.dumps({"some_field": "some value", "a_number_field": 1})
+        cache_key = get_cache_key(device_identifier="dummy-topic")
+
+        with mock.patch.object(codec, "loads", wraps=codec.loads) as mock_loads:
+            mqtt_msg = MQTTMessage(
+                topic="dummy-topic", payload=device_message.encode("utf-8")
+            )
+            MQTTMessage(
+                topic="dummy-topic",
+                payload=json.dumps({"some_field": "another value"}).encode("utf-8"),
+            )
+
+        self.assertEqual(mock_loads.call_count, 2)
+        self.assertEqual(mqtt_msg.raw_payload, device_message)
+        self.assertEqual(
+            message_state.get(cache_key).payload["some_field"], "another value"
+        )
+        self.assertEqual(ZigbeeLog.objects.count(), 3)
+
+    def test_duplicate_message_is_ignored(self):
+        device_message = json.dumps({"some_field": "some value", "a_number_field": 1})
+
+        MQTTMessage(topic="dummy-topic", payload=device_message)
+        MQTTMessage(topic="dummy-topic", payload=device_message)
+
+        self.assertEqual(ZigbeeMessage.objects.filter(topic="dummy-topic").count(), 1)
+        self.assertEqual(ZigbeeLog.objects.count(), 2)
+
+    def test_same_message_on_different_topics_is_not_a_duplicate(self):
+        device_message = json.dumps({"some_field": "some value"})
+
+        MQTTMessage(topic="dummy-topic-1", payload=device_message)
+        MQTTMessage(topic="dummy-topic-2", payload=device_message)
+
+        self.assertEqual(ZigbeeMessage.objects.count(), 2)
 
     @mock.patch(
         "apps.mqtt.management.commands.mqtt.defines",
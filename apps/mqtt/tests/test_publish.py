@@ -0,0 +1,139 @@
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from .. import publish
+from ..publish import MQTTPublisher, MQTTPublishError, send_message, send_messages
+from .broker import StubBroker
+
+
+class TestMQTTPublisher(SimpleTestCase):
+    def setUp(self):
+        self.broker = StubBroker().start()
+        self.publisher = MQTTPublisher(
+            server=self.broker.host, port=self.broker.port, qos=1, timeout=5
+        )
+        patcher = mock.patch.object(
+            publish, "get_publisher", return_value=self.publisher
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.publisher.disconnect()
+        self.broker.stop()
+
+    def test_messages_share_one_connection(self):
+        for number in range(5):
+            send_message(
+                mqtt_topic=f"device-{number}",
+                command_value="on",
+                base_topic="zigbee2mqtt",
+            )
+
+        self.assertEqual(self.broker.connections, 1)
+        self.assertEqual(len(self.broker.messages), 5)
+        self.assertEqual(
+            self.broker.messages[0], ("zigbee2mqtt/device-0/set", b'{"state": "on"}')
+        )
+
+    def test_send_messages_waits_for_every_acknowledgement(self):
+        self.broker.ack_delay = 0.2
+        messages = [
+            {
+                "mqtt_topic": f"device-{number}",
+                "command": "state",
+                "command_value": "on",
+            }
+            for number in range(10)
+        ]
+
+        send_messages(messages, base_topic="zigbee2mqtt")
+
+        self.assertEqual(len(self.broker.messages), 10)
+        self.assertEqual(self.publisher._messages, {})
+
+    def test_publish_returns_future_resolved_on_acknowledgement(self):
+        future = self.publisher.publish(topic="test/topic", payload="{}")
+
+        self.assertIsInstance(future.result(timeout=5), int)
+
+    def test_publisher_reconnects_after_connection_is_dropped(self):
+        send_message(mqtt_topic="device", command_value="on")
+        self.broker.drop_clients()
+
+        send_message(mqtt_topic="device", command_value="off")
+
+        self.assertEqual(self.broker.connections, 2)
+        self.assertTrue(self.broker.wait_for_messages(2))
+
+    def test_publish_does_not_wait_for_connection(self):
+        broker = StubBroker(send_connack=False).start()
+        self.addCleanup(broker.stop)
+        publisher = MQTTPublisher(server=broker.host, port=broker.port, timeout=0.2)
+        self.addCleanup(publisher.disconnect)
+
+        start = time.monotonic()
+        future = publisher.publish(topic="test/topic", payload="{}")
+
+        self.assertLess(time.monotonic() - start, 0.1)
+        with self.assertRaises(MQTTPublishError):
+            future.result(timeout=5)
+
+    def test_message_dropped_when_connection_not_accepted_before_deadline(self):
+        broker = StubBroker(send_connack=False).start()
+        self.addCleanup(broker.stop)
+        publisher = MQTTPublisher(server=broker.host, port=broker.port)
+        self.addCleanup(publisher.disconnect)
+
+        future = publisher.publish(topic="test/topic", payload="{}", timeout=0.1)
+
+        with self.assertRaises(MQTTPublishError):
+            future.result(timeout=5)
+        broker.send_connack = True
+        self.assertFalse(broker.wait_for_messages(1, timeout=0.3))
+        self.assertEqual(publisher._messages, {})
+
+    def test_send_message_raises_at_deadline(self):
+        self.broker.ack_delay = 1.0
+
+        start = time.monotonic()
+        with self.assertRaises(MQTTPublishError):
+            send_message(mqtt_topic="device", command_value="on", timeout=0.2)
+
+        self.assertLess(time.monotonic() - start, 0.8)
+        self.assertEqual(self.publisher._messages, {})
+        self.assertEqual(self.publisher._mids, {})
+
+    def test_messages_published_before_connection_are_sent_once_connected(self):
+        futures = [
+            self.publisher.publish(topic=f"test/{number}", payload="{}")
+            for number in range(3)
+        ]
+
+        for future in futures:
+            self.assertIsInstance(future.result(timeout=5), int)
+        self.assertEqual(len(self.broker.messages), 3)
+
+    def test_send_messages_without_waiting_returns_futures(self):
+        self.broker.ack_delay = 0.2
+        messages = [
+            {"mqtt_topic": "device", "command": "state", "command_value": "on"}
+        ]
+
+        futures = send_messages(messages, base_topic="zigbee2mqtt", wait=False)
+
+        self.assertFalse(futures[0].done())
+        self.assertIsInstance(futures[0].result(timeout=5), int)
+
+
+class TestGetPublisher(SimpleTestCase):
+    def test_publisher_is_shared_within_a_process(self):
+        self.assertIs(publish.get_publisher(), publish.get_publisher())
+
+    def test_new_publisher_created_after_fork(self):
+        publisher = publish.get_publisher()
+
+        with mock.patch("apps.mqtt.publish.os.getpid", return_value=-1):
+            self.assertIsNot(publish.get_publisher(), publisher)
@@ -0,0 +1,80 @@
+import json
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from ..state import MessageStateStore, get_payload_digest
+
+
+def parser(message):
+    try:
+        return json.loads(message)
+    except ValueError:
+        return None
+
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+)
+class TestMessageStateStore(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.store = MessageStateStore(
+            parser=parser, maxsize=2, write_behind_interval=60
+        )
+
+    def test_digest_ignores_key_order(self):
+        self.assertEqual(
+            get_payload_digest({"a": 1, "b": 2}), get_payload_digest({"b": 2, "a": 1})
+        )
+
+    def test_set_returns_parsed_state(self):
+        state = self.store.set("key", raw='{"a": 1}')
+
+        self.assertEqual(state.raw, '{"a": 1}')
+        self.assertEqual(state.payload, {"a": 1})
+        self.assertEqual(state.digest, get_payload_digest({"a": 1}))
+        self.assertEqual(self.store.get("key"), state)
+
+    def test_unparsable_message_has_no_state(self):
+        self.assertIsNone(self.store.set("key", raw="not-json"))
+        self.assertIsNone(self.store.get("key"))
+
+    def test_least_recently_used_key_is_evicted(self):
+        self.store.set("key-1", raw='{"a": 1}')
+        self.store.set("key-2", raw='{"a": 2}')
+        self.store.get("key-1")
+        self.store.set("key-3", raw='{"a": 3}')
+
+        self.store.flush()
+        cache.clear()
+
+        self.assertIsNotNone(self.store.get("key-1"))
+        self.assertIsNone(self.store.get("key-2"))
+        self.assertIsNotNone(self.store.get("key-3"))
+
+    def test_cache_is_only_written_when_flushed(self):
+        self.store.set("key", raw='{"a": 1}')
+        self.store.set("key", raw='{"a": 2}')
+
+        self.assertIsNone(cache.get("key"))
+        self.assertEqual(self.store.flush(), 1)
+        self.assertEqual(cache.get("key"), '{"a": 2}')
+
+    def test_cache_is_written_immediately_when_write_behind_disabled(self):
+        store = MessageStateStore(parser=parser, write_behind_interval=0)
+
+        store.set("key", raw='{"a": 1}')
+
+        self.assertEqual(cache.get("key"), '{"a": 1}')
+
+    def test_local_miss_reads_from_cache(self):
+        cache.set("key", '{"a": 1}')
+
+        state = self.store.get("key")
+
+        self.assertEqual(state.payload, {"a": 1})
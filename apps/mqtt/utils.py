@@ -1,7 +1,72 @@
 """MQTT utility functions module"""
+import logging
+import time
+
+from django.core.cache import cache
+
 from . import defines
 
+logger = logging.getLogger(__name__)
+
 
 def get_cache_key(device_identifier: str):
     """Returns a cache key for retrieving from/storing in the cache"""
     return ":".join([defines.CACHE_KEY_PREFIX, str(device_identifier)])
+
+
+class CacheGeneration:
+    """Version counter held in the django cache.
+
+    In-process indexes (e.g. those held by the MQTT ingest process) record the generation they
+    were built from. Any process changing the underlying rows calls bump(), and the index owner
+    calls is_stale() - which reads the cache at most once every check_interval seconds - to find
+    out when it needs rebuilding. If the cache is unavailable the index is treated as current."""
+
+    def __init__(self, name: str, check_interval: float = 5.0) -> None:
+        self.key = get_cache_key(name)
+        self.check_interval = float(check_interval)
+        self.seen = None
+        self._checked_at = 0.0
+
+    def current(self) -> int:
+        """Return generation stored in the cache (0 when not set)"""
+        try:
+            generation = cache.get(self.key)
+            if generation is None:
+                cache.add(self.key, 0, timeout=None)
+                generation = cache.get(self.key, 0)
+        except Exception as ex:
+            logger.debug("Could not read cache generation %s - %s", self.key, ex)
+            return self.seen or 0
+
+        return int(generation)
+
+    def bump(self) -> int:
+        """Increment the generation - returns the new value"""
+        try:
+            try:
+                return cache.incr(self.key)
+            except ValueError:
+                # key does not exist yet
+                cache.add(self.key, 0, timeout=None)
+                return cache.incr(self.key)
+        except Exception as ex:
+            logger.debug("Could not bump cache generation %s - %s", self.key, ex)
+            return self.seen or 0
+
+    def mark_seen(self, generation: int) -> None:
+        """Record the generation the in-process index was built from"""
+        self.seen = generation
+        self._checked_at = time.monotonic()
+
+    def is_stale(self) -> bool:
+        """True when another process has bumped the generation since mark_seen()"""
+        if self.seen is None:
+            return False
+
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return False
+
+        self._checked_at = now
+        return self.current() != self.seen
@@ -4,6 +4,8 @@ from django.http.response import Http404, JsonResponse
 from django.shortcuts import get_object_or_404
 from django.views.generic.base import View
 
+from smarthub.settings import MQTT_REQUEST_PUBLISH_TIMEOUT
+
 from ..devices.models import Device, DeviceState
 from ..views import UUIDView
 from .defines import MQTT_STATE_COMMAND, MQTT_STATE_TOGGLE_VALUE
@@ -42,6 +44,7 @@ class ToggleDeviceState(UUIDView, View):
                 mqtt_topic=mqtt_topic,
                 command=MQTT_STATE_COMMAND,
                 command_value=MQTT_STATE_TOGGLE_VALUE,
+                timeout=MQTT_REQUEST_PUBLISH_TIMEOUT,
             )
             logger.info("%s - toggle command sent", __name__)
 
@@ -108,6 +111,7 @@ class TriggerDeviceState(UUIDView, View):
                 mqtt_topic=mqtt_topic,
                 command=cmd,
                 command_value=val,
+                timeout=MQTT_REQUEST_PUBLISH_TIMEOUT,
             )
             logger.info("%s - toggle command sent", __name__)
 
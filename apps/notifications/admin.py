@@ -59,5 +59,24 @@ class NotificationAdmin(admin.ModelAdmin):
     )
 
 
+class NotificationOutboxAdmin(admin.ModelAdmin):
+    """Displays queued notifications and their delivery status"""
+
+    list_display = (
+        "medium",
+        "topic",
+        "status",
+        "attempts",
+        "next_attempt_at",
+        "sent_at",
+    )
+    list_filter = ("status",)
+    readonly_fields = (
+        "created_at",
+        "updated_at",
+    )
+
+
 admin.site.register(models.NotificationSetting, UserNotificationSettingAdmin)
 admin.site.register(models.NotificationLog, NotificationAdmin)
+admin.site.register(models.NotificationOutbox, NotificationOutboxAdmin)
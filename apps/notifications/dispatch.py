@@ -0,0 +1,318 @@
+"""Sends a user's notifications for every medium concurrently.
+
+The dispatcher runs an asyncio event loop on a background thread for the life of the process.
+Pushbullet pushes are made with a pooled aiohttp session on that loop, and emails are queued
+on an EmailBatcher (see mail.py), which sends them over a persistent SMTP connection. Each
+medium has its own timeout and the number of notifications in flight is bounded, so sending
+notifications takes as long as the slowest medium rather than the sum of them all.
+NotificationLog rows for the notifications that were sent are written with one insert.
+Mediums with a request quota (Pushbullet) are checked against a token bucket (see limits.py)
+before anything is sent, and the token is given back if the notification is not sent."""
+import asyncio
+import logging
+import os
+import threading
+from typing import Iterable, List, Tuple
+
+from django.core.mail import EmailMessage
+
+import aiohttp
+
+from smarthub.settings import (
+    NOTIFICATION_EMAIL_BATCH_SIZE,
+    NOTIFICATION_EMAIL_BATCH_WINDOW,
+    NOTIFICATION_EMAIL_IDLE_TIMEOUT,
+    NOTIFICATION_EMAIL_TIMEOUT,
+    NOTIFICATION_MAX_CONCURRENCY,
+    PUSHBULLET_POOL_SIZE,
+    PUSHBULLET_RATE_LIMIT_BURST,
+    PUSHBULLET_RATE_LIMIT_PER_MONTH,
+    PUSHBULLET_TIMEOUT,
+)
+
+from .limits import TokenBucket
+from .mail import EmailBatcher
+from .models import NotificationLog, NotificationMedium, NotificationSetting
+from .utils import get_pushbullet
+
+logger = logging.getLogger(__name__)
+
+# medium -> name of the related model holding the medium's settings
+MEDIUM_SETTINGS = {
+    NotificationMedium.PUSHBULLET: "pushbulletnotification",
+    NotificationMedium.EMAIL: "emailnotification",
+}
+
+SECONDS_PER_MONTH = 30 * 24 * 60 * 60
+
+
+def get_pushbullet_bucket(settings) -> TokenBucket:
+    """Return the PushbulletNotification's quota"""
+    return TokenBucket(
+        f"pushbullet:{settings.pk}",
+        capacity=PUSHBULLET_RATE_LIMIT_BURST,
+        refill_rate=PUSHBULLET_RATE_LIMIT_PER_MONTH / SECONDS_PER_MONTH,
+    )
+
+
+def pushbullet_limit(settings) -> bool:
+    """Take a push from the PushbulletNotification's quota - False when it is used up"""
+    return get_pushbullet_bucket(settings).consume()
+
+
+def pushbullet_refund(settings) -> None:
+    """Give back a push taken from the PushbulletNotification's quota"""
+    get_pushbullet_bucket(settings).refund()
+
+
+class NotificationDispatcher:
+    """Sends notifications concurrently - see module docstring.
+
+    Parameters:
+        max_concurrency     - maximum number of notifications being sent at once
+        timeouts            - seconds each medium has to send a notification - for emails, the
+                                seconds an email can wait in the mailer's queue
+        pool_size           - maximum number of pooled HTTP connections
+        limiters            - medium -> function taking the medium's settings, returning False
+                                if the notification must not be sent (e.g. quota used up)
+        refunds             - medium -> function taking the medium's settings, giving back what
+                                its limiter took when the notification was not sent
+        mailer              - sends emails - defaults to an EmailBatcher with default settings
+    """
+
+    # medium -> name of the method sending it
+    SENDERS = {
+        NotificationMedium.PUSHBULLET: "send_pushbullet",
+        NotificationMedium.EMAIL: "send_email",
+    }
+
+    def __init__(
+        self,
+        max_concurrency: int = 10,
+        timeouts: dict = None,
+        pool_size: int = 10,
+        limiters: dict = None,
+        refunds: dict = None,
+        mailer: EmailBatcher = None,
+    ) -> None:
+        self.max_concurrency = int(max_concurrency)
+        self.timeouts = {
+            NotificationMedium.PUSHBULLET: 10.0,
+            NotificationMedium.EMAIL: 10.0,
+            **(timeouts or {}),
+        }
+        self.pool_size = int(pool_size)
+        self.limiters = limiters or {}
+        self.refunds = refunds or {}
+        self.pid = os.getpid()
+
+        # medium -> coroutine function overriding the medium's SENDERS method
+        self.senders = {}
+
+        self._loop = None
+        self._http = None
+        self.mailer = mailer or EmailBatcher()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_medium_settings(notification: NotificationSetting):
+        """Return the medium's settings (e.g. PushbulletNotification) - None if missing"""
+        field = MEDIUM_SETTINGS.get(notification.notification_medium)
+        if not field:
+            return None
+        try:
+            return getattr(notification, field)
+        except NotificationSetting._meta.get_field(field).related_model.DoesNotExist:
+            return None
+
+    def dispatch(
+        self,
+        notifications: Iterable[NotificationSetting],
+        topic: str,
+        message: str,
+        triggered_by: str,
+        trigger_log=None,
+    ) -> List[NotificationLog]:
+        """Send notifications and record those sent - returns the NotificationLogs created"""
+        notifications = list(notifications)
+        results = self.deliver(notifications, topic=topic, message=message)
+
+        logs = [
+            NotificationLog(
+                medium=notification,
+                topic=topic,
+                message=message,
+                triggered_by=triggered_by,
+                trigger_log=trigger_log,
+            )
+            for notification, is_sent in zip(notifications, results)
+            if is_sent
+        ]
+        if logs:
+            NotificationLog.objects.record(logs)
+
+        logger.info("Notifications sent - %s of %s", len(logs), len(notifications))
+        return logs
+
+    def deliver(
+        self, notifications: List[NotificationSetting], topic: str, message: str
+    ) -> List[bool]:
+        """Send notifications concurrently - returns whether each notification was sent"""
+        return self.deliver_messages(
+            [(notification, topic, message) for notification in notifications]
+        )
+
+    def deliver_messages(
+        self, messages: List[Tuple[NotificationSetting, str, str]]
+    ) -> List[bool]:
+        """As deliver(), for (notification, topic, message) tuples - each notification can have
+        its own message (see outbox.OutboxWorker)"""
+        # medium settings are loaded here, as the DB cannot be used from the event loop
+        jobs = []
+        for notification, topic, message in messages:
+            medium = notification.notification_medium
+            settings = self.get_medium_settings(notification)
+
+            if settings is None:
+                logger.info("Notification medium %s is not configured", medium)
+            elif not self.is_within_limit(medium, settings):
+                logger.info("%s notification not sent - rate limit reached", medium)
+                settings = None
+            jobs.append((medium, settings, topic, message))
+
+        if not jobs:
+            return []
+
+        future = asyncio.run_coroutine_threadsafe(self._deliver(jobs), self._get_loop())
+        results = future.result()
+
+        for (medium, settings, _, _), is_sent in zip(jobs, results):
+            if settings is not None and not is_sent:
+                self.refund_limit(medium, settings)
+        return results
+
+    def is_within_limit(self, medium: str, settings) -> bool:
+        """True if the medium's limiter (if any) allows the notification"""
+        limiter = self.limiters.get(medium)
+        return limiter is None or limiter(settings)
+
+    def refund_limit(self, medium: str, settings) -> None:
+        """Give back what the medium's limiter (if any) took for a notification not sent"""
+        refund = self.refunds.get(medium)
+        if refund is not None:
+            refund(settings)
+
+    async def _deliver(self, jobs) -> List[bool]:
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        return await asyncio.gather(
+            *(
+                self._send(semaphore, medium, settings, topic, message)
+                for medium, settings, topic, message in jobs
+            )
+        )
+
+    async def _send(self, semaphore, medium: str, settings, topic, message) -> bool:
+        sender = self.senders.get(medium) or getattr(
+            self, self.SENDERS.get(medium, ""), None
+        )
+        if sender is None or settings is None:
+            return False
+
+        # emails time out in the mailer's queue instead (see send_email)
+        timeout = None if sender == self.send_email else self.timeouts[medium]
+
+        async with semaphore:
+            try:
+                return bool(
+                    await asyncio.wait_for(sender(settings, topic, message), timeout)
+                )
+            except asyncio.TimeoutError:
+                logger.info("%s notification timed out", medium)
+            except Exception as ex:  # pylint: disable=broad-except
+                logger.error("%s notification could not be sent - %s", medium, ex)
+        return False
+
+    async def send_pushbullet(self, settings, topic: str, message: str) -> bool:
+        """Send push with the shared HTTP session"""
+        return await get_pushbullet().send_push(
+            self._get_http(),
+            access_token=settings.access_token,
+            title=topic,
+            body=message,
+        )
+
+    async def send_email(self, settings, topic: str, message: str) -> bool:
+        """Queue email on the mailer and wait for it to be sent. The timeout only applies to
+        the wait in the queue - an email is not abandoned once it is being sent, as it could
+        then be sent twice when the notification is retried."""
+        email = EmailMessage(
+            subject=topic,
+            body=message,
+            from_email=settings.from_email,
+            to=[settings.to_email],
+        )
+        sent = await asyncio.wrap_future(
+            self.mailer.send(email, timeout=self.timeouts[NotificationMedium.EMAIL])
+        )
+        if sent:
+            logger.info("Email sent to %s", settings.to_email)
+        return bool(sent)
+
+    def _get_http(self) -> aiohttp.ClientSession:
+        """Return the pooled HTTP session - only called on the event loop"""
+        if self._http is None or self._http.closed:
+            self._http = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size)
+            )
+        return self._http
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                thread = threading.Thread(
+                    target=self._loop.run_forever, name="notification-dispatch"
+                )
+                thread.daemon = True
+                thread.start()
+            return self._loop
+
+    def close(self) -> None:
+        """Close pooled connections and stop the event loop"""
+        with self._lock:
+            loop, self._loop = self._loop, None
+
+        if loop:
+            if self._http is not None:
+                asyncio.run_coroutine_threadsafe(self._http.close(), loop).result()
+                self._http = None
+            loop.call_soon_threadsafe(loop.stop)
+        self.mailer.close()
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher() -> NotificationDispatcher:
+    """Return the dispatcher for this process - a new one is created after a fork"""
+    global _dispatcher  # pylint: disable=global-statement
+
+    with _dispatcher_lock:
+        if _dispatcher is None or _dispatcher.pid != os.getpid():
+            _dispatcher = NotificationDispatcher(
+                max_concurrency=NOTIFICATION_MAX_CONCURRENCY,
+                timeouts={
+                    NotificationMedium.PUSHBULLET: PUSHBULLET_TIMEOUT,
+                    NotificationMedium.EMAIL: NOTIFICATION_EMAIL_TIMEOUT,
+                },
+                pool_size=PUSHBULLET_POOL_SIZE,
+                limiters={NotificationMedium.PUSHBULLET: pushbullet_limit},
+                refunds={NotificationMedium.PUSHBULLET: pushbullet_refund},
+                mailer=EmailBatcher(
+                    window=NOTIFICATION_EMAIL_BATCH_WINDOW,
+                    batch_size=NOTIFICATION_EMAIL_BATCH_SIZE,
+                    idle_timeout=NOTIFICATION_EMAIL_IDLE_TIMEOUT,
+                ),
+            )
+        return _dispatcher
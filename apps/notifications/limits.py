@@ -0,0 +1,158 @@
+"""Budgets outbound notification API calls.
+
+TokenBucket limits how often a notification medium (e.g. a user's Pushbullet account, which
+has a monthly request quota) is used. NotificationCoalescer merges notifications for the same
+event within a window into one digest. Both keep their state in the django cache, so limits
+apply across every process sending notifications."""
+import logging
+import time
+import uuid
+from typing import List, Optional, Tuple
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Token bucket held in the django cache.
+
+    The bucket holds up to capacity tokens and gains refill_rate tokens per second - sending
+    a notification takes a token. State is updated under a short lock (cache.add), so buckets
+    shared by several processes are not over-spent. If the lock cannot be taken the request is
+    refused, as the point of the bucket is to protect a quota."""
+
+    LOCK_TIMEOUT = 2
+    LOCK_WAIT = 0.2
+
+    def __init__(self, name: str, capacity: float, refill_rate: float) -> None:
+        self.key = f"token-bucket:{name}"
+        self.capacity = float(capacity)
+        self.refill_rate = float(refill_rate)
+
+    @property
+    def ttl(self) -> int:
+        """Seconds until an untouched bucket is full again - state can be dropped after this"""
+        if self.refill_rate <= 0:
+            return None
+        return int(self.capacity / self.refill_rate) + 1
+
+    def _refill(self, state: Optional[Tuple[float, float]], now: float) -> float:
+        if state is None:
+            return self.capacity
+        tokens, updated_at = state
+        return min(self.capacity, tokens + (now - updated_at) * self.refill_rate)
+
+    def peek(self) -> float:
+        """Return the number of tokens available"""
+        return self._refill(cache.get(self.key), time.time())
+
+    def _change(self, tokens: float) -> Optional[bool]:
+        """Add tokens to the bucket (take them when negative) - returns False, leaving the
+        bucket as it is, if that would take more tokens than there are, and None if the bucket
+        could not be locked"""
+        lock_key = f"{self.key}:lock"
+        lock_id = uuid.uuid4().hex
+        deadline = time.monotonic() + self.LOCK_WAIT
+
+        try:
+            while not cache.add(lock_key, lock_id, self.LOCK_TIMEOUT):
+                if time.monotonic() >= deadline:
+                    logger.info("Token bucket %s is busy", self.key)
+                    return None
+                time.sleep(0.005)
+
+            try:
+                now = time.time()
+                available = self._refill(cache.get(self.key), now)
+                is_changed = available + tokens >= 0
+                if is_changed:
+                    available = min(self.capacity, available + tokens)
+                cache.set(self.key, (available, now), self.ttl)
+            finally:
+                if cache.get(lock_key) == lock_id:
+                    cache.delete(lock_key)
+        except Exception as ex:  # pylint: disable=broad-except
+            logger.error("Token bucket %s unavailable - %s", self.key, ex)
+            return None
+
+        return is_changed
+
+    def consume(self, tokens: float = 1) -> bool:
+        """Take tokens from the bucket - returns False if there are not enough"""
+        is_allowed = self._change(-tokens)
+        if is_allowed is None:
+            logger.info("Token bucket %s - request refused", self.key)
+        elif not is_allowed:
+            logger.info("Token bucket %s is empty - request refused", self.key)
+        return bool(is_allowed)
+
+    def refund(self, tokens: float = 1) -> bool:
+        """Give back tokens taken for a request which was not made - returns False if the
+        bucket could not be updated"""
+        return bool(self._change(tokens))
+
+
+class NotificationCoalescer:
+    """Merges notifications for the same key (e.g. medium and event) within a window.
+
+    Time is split into fixed windows of window seconds. The first notification in a window is
+    sent straight away; later notifications are held in the cache and sent as one digest when
+    the window ends (see flush())."""
+
+    def __init__(self, window: float) -> None:
+        self.window = float(window)
+
+    @property
+    def is_enabled(self) -> bool:
+        """Coalescing is disabled when the window is 0"""
+        return self.window > 0
+
+    def get_window(self, now: float = None) -> int:
+        """Return the id of the window containing now"""
+        return int((time.time() if now is None else now) // self.window)
+
+    def seconds_until_window_ends(self, window_id: int) -> float:
+        """Seconds until window_id has ended"""
+        return max(0.0, (window_id + 1) * self.window - time.time())
+
+    def _key(self, key: str, window_id: int) -> str:
+        return f"coalesce:{key}:{window_id}"
+
+    def add(self, key: str, message: str) -> Tuple[int, int]:
+        """Record a notification - returns (window id, position in the window). Position 1
+        should be sent now. Later positions are held for the digest, and position 2 is the
+        first held - the caller schedules flush() for the end of the window then."""
+        window_id = self.get_window()
+        count_key = self._key(key, window_id)
+        ttl = int(self.window * 2) + 60
+
+        try:
+            cache.add(count_key, 0, ttl)
+            position = cache.incr(count_key)
+            if position > 1:
+                cache.set(f"{count_key}:{position}", message, ttl)
+        except Exception as ex:  # pylint: disable=broad-except
+            logger.error("Could not coalesce notification %s - %s", key, ex)
+            return window_id, 1
+
+        return window_id, position
+
+    def flush(self, key: str, window_id: int) -> List[str]:
+        """Return (and forget) the messages held for the window"""
+        count_key = self._key(key, window_id)
+        count = cache.get(count_key) or 0
+        message_keys = [f"{count_key}:{position}" for position in range(2, count + 1)]
+
+        messages = cache.get_many(message_keys)
+        cache.delete_many(message_keys + [count_key])
+        return [messages[key] for key in message_keys if key in messages]
+
+    @staticmethod
+    def build_digest(messages: List[str]) -> str:
+        """Merge messages into the body of one notification"""
+        if len(messages) == 1:
+            return messages[0]
+        return f"{len(messages)} further notifications:\n\n" + "\n\n---\n\n".join(
+            messages
+        )
@@ -0,0 +1,152 @@
+"""Sends notification emails over a persistent SMTP connection, in batches.
+
+Opening an SMTP connection costs several round trips (greeting, EHLO, STARTTLS, AUTH), which
+used to be paid for every email. EmailBatcher keeps one backend connection open (closing it
+after idle_timeout seconds without use) and sends the emails queued within window seconds of
+each other as one batch over that connection. Emails are only dropped before they are sent -
+when their future is cancelled, or they have waited in the queue for longer than their
+timeout - so an email given up on by the caller is never sent behind its back."""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Optional, Tuple
+
+from django.core.mail import EmailMessage, get_connection
+
+logger = logging.getLogger(__name__)
+
+
+class EmailBatcher:
+    """Queues emails and sends them on a background thread.
+
+    Parameters:
+        window          - seconds to wait for further emails after the first is queued
+        batch_size      - maximum number of emails sent with one send_messages() call
+        idle_timeout    - seconds an unused connection is kept open
+        backend         - email backend path - defaults to settings.EMAIL_BACKEND
+    """
+
+    def __init__(
+        self,
+        window: float = 0.05,
+        batch_size: int = 50,
+        idle_timeout: float = 60,
+        backend: str = None,
+    ) -> None:
+        self.window = max(0.0, float(window))
+        self.batch_size = max(1, int(batch_size))
+        self.idle_timeout = float(idle_timeout)
+        self.backend = backend
+
+        self.connection = None
+        self._used_at = 0.0
+        self._queue: "queue.Queue[Tuple[EmailMessage, Future, Optional[float]]]" = (
+            queue.Queue()
+        )
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def send(self, message: EmailMessage, timeout: float = None) -> Future:
+        """Queue message - returns Future resolved with True once sent (False if it failed, or
+        was not sent within timeout seconds). Cancelling the future before the message is sent
+        removes it from the queue."""
+        future = Future()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        self._queue.put((message, future, deadline))
+
+        with self._lock:
+            if not self._thread or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="notification-email", daemon=True
+                )
+                self._thread.start()
+        return future
+
+    def _run(self) -> None:
+        while True:
+            try:
+                batch = [self._queue.get(timeout=self.idle_timeout)]
+            except queue.Empty:
+                self.close()
+                continue
+
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(
+                        self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                    )
+                except queue.Empty:
+                    break
+
+            batch = self.get_sendable(batch)
+            if not batch:
+                continue
+
+            results = self.send_batch([message for message, _ in batch])
+            for (_, future), is_sent in zip(batch, results):
+                future.set_result(is_sent)
+
+    @staticmethod
+    def get_sendable(batch) -> List[Tuple[EmailMessage, Future]]:
+        """Return the (message, future) pairs of the batch which should still be sent - their
+        futures can no longer be cancelled"""
+        now = time.monotonic()
+        sendable = []
+        for message, future, deadline in batch:
+            if not future.set_running_or_notify_cancel():
+                logger.info("Email to %s cancelled - not sent", message.to)
+            elif deadline is not None and now >= deadline:
+                logger.info("Email to %s timed out in the queue - not sent", message.to)
+                future.set_result(False)
+            else:
+                sendable.append((message, future))
+        return sendable
+
+    def get_connection(self):
+        """Return the open connection - opening a new one if needed"""
+        if self.connection and time.monotonic() - self._used_at > self.idle_timeout:
+            self.close()
+
+        if not self.connection:
+            self.connection = get_connection(self.backend, fail_silently=False)
+            self.connection.open()
+
+        self._used_at = time.monotonic()
+        return self.connection
+
+    def send_batch(self, messages: List[EmailMessage]) -> List[bool]:
+        """Send messages on one connection - returns whether each message was sent. Each
+        message is sent with its own send_messages() call, as backends stop at the first
+        failure: retrying a failed batch as a whole would send the messages before the failure
+        twice."""
+        results = [self.send_message(message) for message in messages]
+        logger.info("Email batch sent - %s of %s messages", sum(results), len(messages))
+        return results
+
+    def send_message(self, message: EmailMessage) -> bool:
+        """Send message on the shared connection. If it fails (e.g. the server dropped the
+        connection) it is retried once on a new connection."""
+        for attempt in range(2):
+            try:
+                return bool(self.get_connection().send_messages([message]))
+            except Exception as ex:  # pylint: disable=broad-except
+                self.close()
+                if attempt:
+                    logger.error("Email to %s could not be sent - %s", message.to, ex)
+                else:
+                    logger.info(
+                        "Email to %s failed - reconnecting - %s", message.to, ex
+                    )
+        return False
+
+    def close(self) -> None:
+        """Close the connection"""
+        connection, self.connection = self.connection, None
+        if connection:
+            try:
+                connection.close()
+            except Exception:  # pylint: disable=broad-except
+                pass
@@ -0,0 +1,52 @@
+"""Runs the notification worker, which sends the notifications queued in the outbox. Several
+workers can be run at once to send notifications in parallel."""
+import logging
+
+from django.core.management import BaseCommand
+
+from smarthub.settings import (NOTIFICATION_OUTBOX_BATCH_SIZE,
+                               NOTIFICATION_OUTBOX_POLL_INTERVAL)
+
+from ...outbox import OutboxWorker
+
+logger = logging.getLogger(__name__)
+logger.setLevel(level=logging.INFO)
+logging.basicConfig()
+
+
+class Command(BaseCommand):
+    """Implements Django management class required functionality to enable the notification
+    worker to be run from terminal"""
+
+    help = "Send the notifications queued in the outbox"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=NOTIFICATION_OUTBOX_BATCH_SIZE
+        )
+        parser.add_argument(
+            "--poll-interval", type=float, default=NOTIFICATION_OUTBOX_POLL_INTERVAL
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Send the notifications due now, then exit",
+        )
+
+    def handle(self, *args, **options):
+        worker = OutboxWorker(batch_size=options["batch_size"])
+
+        if options["once"]:
+            total = 0
+            while True:
+                claimed = worker.process_batch()
+                total += claimed
+                if claimed < worker.batch_size:
+                    break
+            logger.info("Notification outbox - %s notifications processed", total)
+            return
+
+        try:
+            worker.run(poll_interval=options["poll_interval"])
+        except KeyboardInterrupt:
+            worker.stop()
@@ -0,0 +1,18 @@
+"""Recounts NotificationSetting.total_sent from the notification logs - e.g. after logs have
+been deleted, or written without NotificationLog.objects.record()"""
+from django.core.management import BaseCommand
+
+from ...models import NotificationSetting
+
+
+class Command(BaseCommand):
+    """Implements Django management class required functionality to enable the notification
+    counters to be reconciled from terminal"""
+
+    help = "Recount the notifications sent by each notification setting"
+
+    def handle(self, *args, **options):
+        updated = NotificationSetting.objects.reconcile_total_sent()
+        self.stdout.write(
+            f"Notification counts reconciled - {updated} settings updated"
+        )
@@ -0,0 +1,105 @@
+# Generated by Django 3.2.5 on 2026-10-17 14:05
+
+import uuid
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("events", "0004_auto_20210910_0745"),
+        ("notifications", "0004_rename_notification_notificationlog"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="NotificationOutbox",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "uuid",
+                    models.UUIDField(default=uuid.uuid4, editable=False, unique=True),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("topic", models.CharField(max_length=100)),
+                ("message", models.TextField()),
+                ("triggered_by", models.CharField(max_length=200)),
+                ("idempotency_key", models.CharField(max_length=100)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("Pending", "Pending"),
+                            ("Sent", "Sent"),
+                            ("Coalesced", "Coalesced"),
+                            ("Failed", "Failed"),
+                        ],
+                        default="Pending",
+                        max_length=20,
+                    ),
+                ),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                (
+                    "next_attempt_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                ("last_error", models.TextField(blank=True, default="")),
+                ("sent_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "event",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to="events.event",
+                    ),
+                ),
+                (
+                    "medium",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="notifications.notificationsetting",
+                    ),
+                ),
+                (
+                    "trigger_log",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="events.eventtriggerlog",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["next_attempt_at"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="notificationoutbox",
+            index=models.Index(
+                condition=models.Q(("status", "Pending")),
+                fields=["next_attempt_at"],
+                name="outbox_pending_idx",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="notificationoutbox",
+            constraint=models.UniqueConstraint(
+                fields=("medium", "idempotency_key"),
+                name="outbox_medium_idempotency_key",
+            ),
+        ),
+    ]
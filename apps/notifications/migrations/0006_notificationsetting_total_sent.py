@@ -0,0 +1,36 @@
+# Generated by Django 3.2.5 on 2026-10-17 15:20
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_sent_notifications(apps, schema_editor):
+    """Populate total_sent from the existing notification logs"""
+    notification_log = apps.get_model("notifications", "NotificationLog")
+    notification_setting = apps.get_model("notifications", "NotificationSetting")
+
+    sent = (
+        notification_log.objects.filter(medium=OuterRef("pk"))
+        .order_by()
+        .values("medium")
+        .annotate(total=Count("pk"))
+        .values("total")
+    )
+    notification_setting.objects.update(total_sent=Coalesce(Subquery(sent), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notifications", "0005_notificationoutbox"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="notificationsetting",
+            name="total_sent",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_sent_notifications, migrations.RunPython.noop),
+    ]
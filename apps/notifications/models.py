@@ -1,16 +1,20 @@
 import logging
-from typing import TYPE_CHECKING
+from collections import Counter, defaultdict
+from typing import TYPE_CHECKING, Iterable, List
 
 from django.contrib.auth import get_user_model
-from django.core.mail import send_mail
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import Count, F, OuterRef, Subquery
 from django.db.models.constraints import UniqueConstraint
+from django.db.models.functions import Coalesce
+from django.db.models.query_utils import Q
+from django.db.models.sql import InsertQuery
 from django.urls.base import reverse
+from django.utils import timezone
 
 from ..models import BaseAbstractModel
 
 # from ..events.models import EventTriggerLog
-from .utils import Pushbullet
 
 if TYPE_CHECKING:
     from ..events.models import EventTrigger, EventTriggerLog
@@ -26,9 +30,33 @@ class NotificationMedium(models.TextChoices):
     PUSHBULLET = "Pushbullet"
 
 
+class NotificationSettingQuerySet(models.QuerySet):
+    """Custom queries"""
+
+    def reconcile_total_sent(self) -> int:
+        """Reset total_sent to the number of NotificationLogs for each setting - returns the
+        number of settings updated"""
+        sent = (
+            NotificationLog.objects.filter(medium=OuterRef("pk"))
+            .order_by()
+            .values("medium")
+            .annotate(total=Count("pk"))
+            .values("total")
+        )
+        return self.update(total_sent=Coalesce(Subquery(sent), 0))
+
+
+class NotificationSettingManager(
+    models.Manager.from_queryset(NotificationSettingQuerySet)
+):
+    """Custom manager"""
+
+
 class NotificationSetting(BaseAbstractModel):
     """Stores all mediums by which a user should be notified"""
 
+    objects = NotificationSettingManager()
+
     user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
     notification_medium = models.CharField(
         verbose_name="Notification channel",
@@ -37,6 +65,8 @@ class NotificationSetting(BaseAbstractModel):
         default=NotificationMedium.EMAIL,
     )
     is_enabled = models.BooleanField(verbose_name="Enable notifications", default=True)
+    # number of NotificationLogs for the setting - maintained by NotificationLog.objects.record()
+    total_sent = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         """Only permit user to create one entry per notification method"""
@@ -55,14 +85,38 @@ class NotificationSetting(BaseAbstractModel):
         """Return string value when object is output"""
         return f"{self.notification_medium} ({self.user.email})"
 
-    @property
-    def total_sent(self):
-        """Return total notifications sent for specified user notification setting"""
-        return NotificationLog.objects.filter(medium=self).count()
+
+class NotificationLogQuerySet(models.QuerySet):
+    """Custom queries"""
+
+    def record(self, logs: Iterable["NotificationLog"]) -> List["NotificationLog"]:
+        """Create logs with one insert and add them to the total_sent of their settings -
+        settings sent the same number of notifications are updated together"""
+        logs = list(logs)
+        sent = Counter(log.medium_id for log in logs if log.medium_id)
+
+        by_total = defaultdict(list)
+        for medium_id, total in sent.items():
+            by_total[total].append(medium_id)
+
+        with transaction.atomic():
+            logs = self.bulk_create(logs)
+            for total, medium_ids in by_total.items():
+                NotificationSetting.objects.filter(pk__in=medium_ids).update(
+                    total_sent=F("total_sent") + total
+                )
+        return logs
+
+
+class NotificationLogManager(models.Manager.from_queryset(NotificationLogQuerySet)):
+    """Custom manager"""
 
 
 class NotificationLog(BaseAbstractModel):
-    """Records all notifications sent to user including medium"""
+    """Records all notifications sent to user including medium - create logs with
+    NotificationLog.objects.record(), which keeps NotificationSetting.total_sent up to date"""
+
+    objects = NotificationLogManager()
 
     medium = models.ForeignKey(
         NotificationSetting, on_delete=models.SET_NULL, null=True, blank=False
@@ -75,6 +129,95 @@ class NotificationLog(BaseAbstractModel):
     )
 
 
+class OutboxStatus(models.TextChoices):
+    """Delivery status of a notification in the outbox"""
+
+    PENDING = "Pending"
+    SENT = "Sent"
+    COALESCED = "Coalesced"
+    FAILED = "Failed"
+
+
+class NotificationOutboxQuerySet(models.QuerySet):
+    """Custom queries"""
+
+    def enqueue(self, outbox: List["NotificationOutbox"]) -> int:
+        """Insert the outbox rows, skipping mediums already queued for the row's idempotency
+        key (INSERT ... ON CONFLICT DO NOTHING) - returns the number of rows inserted, which
+        bulk_create(ignore_conflicts=True) does not report"""
+        if not outbox:
+            return 0
+
+        fields = [
+            field for field in self.model._meta.concrete_fields if not field.primary_key
+        ]
+        query = InsertQuery(self.model, ignore_conflicts=True)
+        query.insert_values(fields, outbox)
+
+        inserted = 0
+        with connections[self.db].cursor() as cursor:
+            for sql, params in query.get_compiler(using=self.db).as_sql():
+                cursor.execute(sql, params)
+                inserted += cursor.rowcount
+        return inserted
+
+
+class NotificationOutboxManager(
+    models.Manager.from_queryset(NotificationOutboxQuerySet)
+):
+    """Custom manager"""
+
+
+class NotificationOutbox(BaseAbstractModel):
+    """Notifications waiting to be sent.
+
+    Rows are inserted in the same transaction as the EventTriggerLog they notify about, and are
+    sent by the notification worker (see outbox.py). A notification that could not be sent is
+    retried at next_attempt_at, until it has been attempted max_attempts times."""
+
+    objects = NotificationOutboxManager()
+
+    medium = models.ForeignKey(NotificationSetting, on_delete=models.CASCADE)
+    topic = models.CharField(max_length=100, null=False, blank=False)
+    message = models.TextField(blank=False, null=False)
+    triggered_by = models.CharField(max_length=200, blank=False, null=False)
+    trigger_log = models.ForeignKey(
+        "events.EventTriggerLog", null=True, blank=True, on_delete=models.CASCADE
+    )
+    event = models.ForeignKey(
+        "events.Event", null=True, blank=True, on_delete=models.SET_NULL
+    )
+    # identifies the occurrence being notified about - a medium is only notified once per key
+    idempotency_key = models.CharField(max_length=100)
+    status = models.CharField(
+        max_length=20, choices=OutboxStatus.choices, default=OutboxStatus.PENDING
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default="")
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["next_attempt_at"]
+        constraints = [
+            UniqueConstraint(
+                fields=["medium", "idempotency_key"],
+                name="outbox_medium_idempotency_key",
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["next_attempt_at"],
+                name="outbox_pending_idx",
+                condition=Q(status="Pending"),
+            )
+        ]
+
+    def __str__(self) -> str:
+        """Return string value when object is output"""
+        return f"{self.topic} ({self.status})"
+
+
 class PushbulletNotification(BaseAbstractModel):
     """Provider specific data fields"""
 
@@ -88,29 +231,22 @@ class PushbulletNotification(BaseAbstractModel):
         triggered_by: "EventTrigger",
         notification_obj: "NotificationSetting",
         trigger_log: "EventTriggerLog" = None,
-    ):
-        """Invoke functionality to send notification"""
-        pushbullet = Pushbullet(access_token=self.access_token)
+    ) -> bool:
+        """Invoke functionality to send notification - returns True if sent"""
+        from .dispatch import get_dispatcher
 
         logging.info(
             "Sending pushbullet notification (topic=%s, message=%s)", topic, message
         )
 
-        # message += f"\n\nTriggered by: {triggered_by}"
-        pushbullet.send_push(title=topic, body=message)
-
-        # create notification record
-        obj = NotificationLog(
-            medium=notification_obj,
+        logs = get_dispatcher().dispatch(
+            [notification_obj],
             topic=topic,
             message=message,
             triggered_by=triggered_by,
+            trigger_log=trigger_log,
         )
-        try:
-            obj.trigger_log = trigger_log
-        except Exception:
-            pass
-        obj.save()
+        return bool(logs)
 
 
 class EmailNotification(BaseAbstractModel):
@@ -127,27 +263,15 @@ class EmailNotification(BaseAbstractModel):
         triggered_by: "EventTrigger",
         notification_obj: "NotificationSetting",
         trigger_log: "EventTriggerLog" = None,
-    ):
-        """Invoke functionality to send notification"""
-        email = send_mail(
-            subject=topic,
+    ) -> bool:
+        """Invoke functionality to send notification - returns True if sent"""
+        from .dispatch import get_dispatcher
+
+        logs = get_dispatcher().dispatch(
+            [notification_obj],
+            topic=topic,
             message=message,
-            from_email=self.from_email,
-            recipient_list=[self.to_email],
-            fail_silently=True,
+            triggered_by=triggered_by,
+            trigger_log=trigger_log,
         )
-
-        if email:
-            # create notification record
-            logger.info("Email sent for trigger %s", triggered_by)
-            obj = NotificationLog(
-                medium=notification_obj,
-                topic=topic,
-                message=message,
-                triggered_by=triggered_by,
-            )
-            try:
-                obj.trigger_log = trigger_log
-            except Exception:
-                pass
-            obj.save()
+        return bool(logs)
@@ -0,0 +1,196 @@
+"""Sends the notifications queued in the outbox (NotificationOutbox).
+
+Workers claim a batch of due notifications with SELECT ... FOR UPDATE SKIP LOCKED, so several
+worker processes can drain the outbox in parallel without sending a notification twice. A
+claimed notification is hidden from other workers for lease seconds (by moving its
+next_attempt_at) - if the worker dies, it is picked up again once the lease has expired. Each
+batch is sent concurrently by the NotificationDispatcher, and the results are written back
+with one bulk update. Notifications which could not be sent are retried with an exponential
+backoff."""
+import datetime
+import logging
+import threading
+from typing import List
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from smarthub.settings import (NOTIFICATION_OUTBOX_BACKOFF,
+                               NOTIFICATION_OUTBOX_BATCH_SIZE,
+                               NOTIFICATION_OUTBOX_LEASE,
+                               NOTIFICATION_OUTBOX_MAX_ATTEMPTS,
+                               NOTIFICATION_OUTBOX_MAX_BACKOFF)
+
+from .dispatch import MEDIUM_SETTINGS, NotificationDispatcher, get_dispatcher
+from .models import NotificationLog, NotificationOutbox, OutboxStatus
+from .tasks import coalesce_notifications
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxWorker:
+    """Claims and sends batches of notifications from the outbox.
+
+    Parameters:
+        batch_size      - maximum number of notifications claimed at once
+        max_attempts    - attempts before a notification is marked as failed
+        backoff         - seconds before the first retry - doubled for each further attempt
+        max_backoff     - maximum seconds between attempts
+        lease           - seconds a claimed notification is hidden from other workers
+        dispatcher      - sends the notifications - defaults to the process dispatcher
+    """
+
+    def __init__(
+        self,
+        batch_size: int = NOTIFICATION_OUTBOX_BATCH_SIZE,
+        max_attempts: int = NOTIFICATION_OUTBOX_MAX_ATTEMPTS,
+        backoff: float = NOTIFICATION_OUTBOX_BACKOFF,
+        max_backoff: float = NOTIFICATION_OUTBOX_MAX_BACKOFF,
+        lease: float = NOTIFICATION_OUTBOX_LEASE,
+        dispatcher: NotificationDispatcher = None,
+    ) -> None:
+        self.batch_size = max(1, int(batch_size))
+        self.max_attempts = max(1, int(max_attempts))
+        self.backoff = float(backoff)
+        self.max_backoff = float(max_backoff)
+        self.lease = float(lease)
+        self.dispatcher = dispatcher
+
+        self._stopped = threading.Event()
+
+    def get_backoff(self, attempts: int) -> datetime.timedelta:
+        """Return the delay before the next attempt of a notification attempted attempts times"""
+        seconds = min(self.max_backoff, self.backoff * 2 ** max(0, attempts - 1))
+        return datetime.timedelta(seconds=seconds)
+
+    def claim(self) -> List[NotificationOutbox]:
+        """Claim a batch of due notifications - rows locked by other workers are skipped"""
+        now = timezone.now()
+
+        with transaction.atomic():
+            claimed = list(
+                NotificationOutbox.objects.select_for_update(skip_locked=True)
+                .filter(status=OutboxStatus.PENDING, next_attempt_at__lte=now)
+                .order_by("next_attempt_at")
+                .values_list("pk", flat=True)[: self.batch_size]
+            )
+            if not claimed:
+                return []
+
+            NotificationOutbox.objects.filter(pk__in=claimed).update(
+                attempts=F("attempts") + 1,
+                next_attempt_at=now + datetime.timedelta(seconds=self.lease),
+                updated_at=now,
+            )
+
+        # settings are loaded after the rows are claimed, so the lock only covers the outbox
+        return list(
+            NotificationOutbox.objects.filter(pk__in=claimed)
+            .select_related(
+                "medium",
+                "trigger_log",
+                *(f"medium__{field}" for field in MEDIUM_SETTINGS.values()),
+            )
+            .order_by("next_attempt_at", "pk")
+        )
+
+    def process_batch(self) -> int:
+        """Claim and send one batch - returns the number of notifications claimed"""
+        entries = self.claim()
+        if not entries:
+            return 0
+
+        results = {}
+        to_send = []
+        for entry in entries:
+            if not entry.medium.is_enabled:
+                results[entry.pk] = OutboxStatus.FAILED
+                entry.last_error = "Notification setting is disabled"
+            elif not coalesce_notifications(
+                [entry.medium],
+                event_id=entry.event_id,
+                topic=entry.topic,
+                message=entry.message,
+                triggered_by=entry.triggered_by,
+            ):
+                # held for the digest sent at the end of the coalescing window
+                results[entry.pk] = OutboxStatus.COALESCED
+            else:
+                to_send.append(entry)
+
+        dispatcher = self.dispatcher or get_dispatcher()
+        sent = dispatcher.deliver_messages(
+            [(entry.medium, entry.topic, entry.message) for entry in to_send]
+        )
+        for entry, is_sent in zip(to_send, sent):
+            results[entry.pk] = OutboxStatus.SENT if is_sent else None
+
+        self.record(entries, results)
+        return len(entries)
+
+    def record(self, entries: List[NotificationOutbox], results: dict) -> None:
+        """Write the results of a batch back to the outbox (and log notifications sent) - entries
+        without a status are retried, or failed once they have used up their attempts"""
+        now = timezone.now()
+        logs = []
+
+        for entry in entries:
+            entry.updated_at = now
+            status = results.get(entry.pk)
+
+            if status == OutboxStatus.SENT:
+                entry.sent_at = now
+                entry.last_error = ""
+                logs.append(
+                    NotificationLog(
+                        medium=entry.medium,
+                        topic=entry.topic,
+                        message=entry.message,
+                        triggered_by=entry.triggered_by,
+                        trigger_log=entry.trigger_log,
+                    )
+                )
+            elif status is None:
+                entry.last_error = f"Not sent (attempt {entry.attempts})"
+                if entry.attempts >= self.max_attempts:
+                    status = OutboxStatus.FAILED
+                else:
+                    status = OutboxStatus.PENDING
+                    entry.next_attempt_at = now + self.get_backoff(entry.attempts)
+            entry.status = status
+
+        with transaction.atomic():
+            NotificationOutbox.objects.bulk_update(
+                entries,
+                ["status", "next_attempt_at", "last_error", "sent_at", "updated_at"],
+            )
+            if logs:
+                NotificationLog.objects.record(logs)
+
+        logger.info(
+            "Notification outbox - %s sent, %s retrying, %s failed (of %s)",
+            len(logs),
+            sum(entry.status == OutboxStatus.PENDING for entry in entries),
+            sum(entry.status == OutboxStatus.FAILED for entry in entries),
+            len(entries),
+        )
+
+    def run(self, poll_interval: float = 1.0) -> None:
+        """Process batches until stop() is called - waiting poll_interval seconds whenever the
+        outbox has no further notifications due"""
+        logger.info("Notification outbox worker started")
+        while not self._stopped.is_set():
+            try:
+                claimed = self.process_batch()
+            except Exception as ex:  # pylint: disable=broad-except
+                logger.error("Notification outbox batch failed - %s", ex)
+                claimed = 0
+
+            if claimed < self.batch_size:
+                self._stopped.wait(poll_interval)
+        logger.info("Notification outbox worker stopped")
+
+    def stop(self) -> None:
+        """Stop run() after the current batch"""
+        self._stopped.set()
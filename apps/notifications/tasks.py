@@ -0,0 +1,79 @@
+"""Celery tasks for sending notifications. Notifications are queued in the outbox and sent by
+the notification worker (see outbox.py) - pushes held back by coalescing are sent by a task."""
+import logging
+from typing import List
+
+from celery import shared_task
+
+from smarthub.settings import PUSHBULLET_COALESCE_WINDOW
+
+from .dispatch import MEDIUM_SETTINGS, get_dispatcher
+from .limits import NotificationCoalescer
+from .models import NotificationMedium, NotificationSetting
+
+logger = logging.getLogger(__name__)
+
+# pushes for the same event are merged into a digest when coalescing is enabled
+coalescer = NotificationCoalescer(window=PUSHBULLET_COALESCE_WINDOW)
+
+
+def coalesce_notifications(
+    notifications: List[NotificationSetting],
+    event_id: int,
+    topic: str,
+    message: str,
+    triggered_by: str,
+) -> List[NotificationSetting]:
+    """Return the notifications to send now. Pushbullet notifications for an event which has
+    already been pushed in the current window are held, and sent as one digest when the window
+    ends."""
+    if not coalescer.is_enabled or not event_id:
+        return notifications
+
+    send_now = []
+    for notification in notifications:
+        if notification.notification_medium != NotificationMedium.PUSHBULLET:
+            send_now.append(notification)
+            continue
+
+        window_id, position = coalescer.add(f"{notification.pk}:{event_id}", message)
+        if position == 1:
+            send_now.append(notification)
+        elif position == 2:
+            send_notification_digest.apply_async(
+                kwargs={
+                    "notification_id": notification.pk,
+                    "event_id": event_id,
+                    "window_id": window_id,
+                    "topic": topic,
+                    "triggered_by": triggered_by,
+                },
+                countdown=coalescer.seconds_until_window_ends(window_id),
+            )
+    return send_now
+
+
+@shared_task(ignore_result=True)
+def send_notification_digest(
+    notification_id: int, event_id: int, window_id: int, topic: str, triggered_by: str
+) -> None:
+    """Send the pushes held for an event during a coalescing window as one notification"""
+    messages = coalescer.flush(f"{notification_id}:{event_id}", window_id)
+    if not messages:
+        return
+
+    notification = (
+        NotificationSetting.objects.filter(pk=notification_id, is_enabled=True)
+        .select_related(*MEDIUM_SETTINGS.values())
+        .first()
+    )
+    if not notification:
+        logger.info("send_notification_digest - notification setting no longer enabled")
+        return
+
+    get_dispatcher().dispatch(
+        [notification],
+        topic=topic,
+        message=coalescer.build_digest(messages),
+        triggered_by=triggered_by,
+    )
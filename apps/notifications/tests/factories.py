@@ -42,3 +42,14 @@ class EmailNotificationFactory(factory.django.DjangoModelFactory):
     notification = factory.SubFactory(NotificationSettingFactory)
     from_email = factory.Faker("email")
     to_email = factory.Faker("email")
+
+
+class NotificationOutboxFactory(factory.django.DjangoModelFactory):
+    class Meta:
+        model = models.NotificationOutbox
+
+    medium = factory.SubFactory(NotificationSettingFactory)
+    topic = "topic"
+    message = factory.Faker("sentence")
+    triggered_by = factory.Faker("sentence")
+    idempotency_key = factory.Sequence(lambda number: f"{number}:1")
@@ -0,0 +1,81 @@
+"""Minimal HTTP server used by tests in place of the Pushbullet API.
+
+Records requests and the number of connections made, and answers every request with
+status_code (HTTP/1.1 keep-alive, so clients can reuse connections)."""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, NamedTuple
+
+
+class StubRequest(NamedTuple):
+    """Request received by the stub server"""
+
+    method: str
+    path: str
+    headers: dict
+    body: bytes
+
+
+class StubAPIServer:
+    """Threaded stand-in for the Pushbullet API"""
+
+    def __init__(self, host: str = "127.0.0.1", status_code: int = 200) -> None:
+        self.host = host
+        self.port = None
+        self.status_code = status_code
+
+        self.requests: List[StubRequest] = []
+        self.connections = 0
+
+        self._server = None
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        """Base url of the server"""
+        return f"http://{self.host}:{self.port}"
+
+    def start(self) -> "StubAPIServer":
+        """Listen on a free port"""
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with stub._lock:
+                    stub.connections += 1
+
+            def log_message(self, *args):  # pylint: disable=arguments-differ
+                pass
+
+            def handle_request(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length) if length else b""
+                with stub._lock:
+                    stub.requests.append(
+                        StubRequest(self.command, self.path, dict(self.headers), body)
+                    )
+
+                response = json.dumps({}).encode("utf-8")
+                self.send_response(stub.status_code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(response)))
+                self.end_headers()
+                self.wfile.write(response)
+
+            do_GET = do_POST = handle_request
+
+        self._server = ThreadingHTTPServer((self.host, 0), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        """Stop serving"""
+        self._server.shutdown()
+        self._server.server_close()
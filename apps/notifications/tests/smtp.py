@@ -0,0 +1,88 @@
+"""Minimal SMTP server used by tests and benchmarks in place of a real mail server.
+
+Answers every command successfully and records the number of connections and messages.
+latency is added before each reply to simulate the round trip to a remote server."""
+import socket
+import threading
+import time
+
+
+class StubSMTPServer:
+    """Threaded stand-in SMTP server"""
+
+    def __init__(self, host: str = "127.0.0.1", latency: float = 0.0) -> None:
+        self.host = host
+        self.port = None
+        self.latency = latency
+
+        self.messages = 0
+        self.connections = 0
+
+        self._socket = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def start(self) -> "StubSMTPServer":
+        """Listen on a free port"""
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((self.host, 0))
+        self._socket.listen(16)
+        self.port = self._socket.getsockname()[1]
+
+        threading.Thread(target=self._accept, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        """Close the listening socket"""
+        self._stopped.set()
+        try:
+            self._socket.close()
+        except OSError:
+            pass
+
+    def _accept(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                client, _ = self._socket.accept()
+            except OSError:
+                return
+
+            with self._lock:
+                self.connections += 1
+            threading.Thread(target=self._serve, args=(client,), daemon=True).start()
+
+    def _reply(self, client: socket.socket, line: str) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+        client.sendall(f"{line}\r\n".encode("ascii"))
+
+    def _serve(self, client: socket.socket) -> None:
+        reader = client.makefile("rb")
+        try:
+            self._reply(client, "220 stub ESMTP")
+            while True:
+                line = reader.readline()
+                if not line:
+                    return
+                command = line[:4].decode("ascii", "replace").upper()
+
+                if command in ("EHLO", "HELO"):
+                    self._reply(client, "250 stub")
+                elif command == "DATA":
+                    self._reply(client, "354 end data with <CR><LF>.<CR><LF>")
+                    while reader.readline() not in (b".\r\n", b""):
+                        pass
+                    with self._lock:
+                        self.messages += 1
+                    self._reply(client, "250 queued")
+                elif command == "QUIT":
+                    self._reply(client, "221 bye")
+                    return
+                else:
+                    self._reply(client, "250 ok")
+        except OSError:
+            return
+        finally:
+            reader.close()
+            client.close()
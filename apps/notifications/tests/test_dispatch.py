@@ -0,0 +1,180 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+from unittest import mock
+
+from django.core import mail
+from django.test import SimpleTestCase
+
+from ..dispatch import NotificationDispatcher
+from ..models import (
+    EmailNotification,
+    NotificationMedium,
+    NotificationSetting,
+    PushbulletNotification,
+)
+from ..utils import Pushbullet
+from .server import StubAPIServer
+
+
+def make_notification(medium):
+    """Unsaved notification setting with its medium settings"""
+    notification = NotificationSetting(notification_medium=medium)
+    if medium == NotificationMedium.PUSHBULLET:
+        PushbulletNotification(notification=notification, access_token="token")
+    else:
+        EmailNotification(
+            notification=notification,
+            from_email="from@example.com",
+            to_email="to@example.com",
+        )
+    return notification
+
+
+async def slow_send(settings, topic, message, delay=0.3):
+    await asyncio.sleep(delay)
+    return True
+
+
+class TestNotificationDispatcher(SimpleTestCase):
+    def setUp(self):
+        self.dispatcher = NotificationDispatcher(
+            max_concurrency=10,
+            timeouts={NotificationMedium.PUSHBULLET: 1, NotificationMedium.EMAIL: 1},
+        )
+        self.addCleanup(self.dispatcher.close)
+        self.notifications = [
+            make_notification(NotificationMedium.PUSHBULLET),
+            make_notification(NotificationMedium.EMAIL),
+            make_notification(NotificationMedium.PUSHBULLET),
+        ]
+
+    def deliver(self):
+        start = time.monotonic()
+        results = self.dispatcher.deliver(self.notifications, "topic", "message")
+        return results, time.monotonic() - start
+
+    def test_mediums_are_sent_concurrently(self):
+        self.dispatcher.senders = {
+            NotificationMedium.PUSHBULLET: slow_send,
+            NotificationMedium.EMAIL: slow_send,
+        }
+
+        results, elapsed = self.deliver()
+
+        self.assertEqual(results, [True, True, True])
+        self.assertLess(elapsed, 0.6)
+
+    def test_concurrency_is_bounded(self):
+        self.dispatcher.max_concurrency = 1
+        self.dispatcher.senders = {
+            NotificationMedium.PUSHBULLET: slow_send,
+            NotificationMedium.EMAIL: slow_send,
+        }
+
+        _, elapsed = self.deliver()
+
+        self.assertGreaterEqual(elapsed, 0.9)
+
+    def test_slow_medium_times_out_without_delaying_others(self):
+        async def too_slow(settings, topic, message):
+            return await slow_send(settings, topic, message, delay=5)
+
+        self.dispatcher.timeouts[NotificationMedium.EMAIL] = 0.2
+        self.dispatcher.senders = {
+            NotificationMedium.PUSHBULLET: slow_send,
+            NotificationMedium.EMAIL: too_slow,
+        }
+
+        results, elapsed = self.deliver()
+
+        self.assertEqual(results, [True, False, True])
+        self.assertLess(elapsed, 1)
+
+    def test_notification_refused_by_limiter_is_not_sent(self):
+        sender = mock.AsyncMock(return_value=True)
+        self.dispatcher.senders = {
+            NotificationMedium.PUSHBULLET: sender,
+            NotificationMedium.EMAIL: sender,
+        }
+        self.dispatcher.limiters = {
+            NotificationMedium.PUSHBULLET: mock.Mock(side_effect=[True, False])
+        }
+
+        results, _ = self.deliver()
+
+        self.assertEqual(results, [True, True, False])
+        self.assertEqual(sender.await_count, 2)
+
+    def test_limiter_is_refunded_when_notification_is_not_sent(self):
+        self.dispatcher.senders = {
+            NotificationMedium.PUSHBULLET: mock.AsyncMock(
+                side_effect=[True, ConnectionError("unreachable")]
+            ),
+            NotificationMedium.EMAIL: mock.AsyncMock(return_value=True),
+        }
+        self.dispatcher.limiters = {
+            NotificationMedium.PUSHBULLET: mock.Mock(return_value=True)
+        }
+        refund = mock.Mock()
+        self.dispatcher.refunds = {NotificationMedium.PUSHBULLET: refund}
+
+        results, _ = self.deliver()
+
+        self.assertEqual(results, [True, True, False])
+        refund.assert_called_once_with(self.notifications[2].pushbulletnotification)
+
+    def test_medium_without_settings_is_not_sent(self):
+        results = self.dispatcher.deliver(
+            [NotificationSetting(notification_medium=NotificationMedium.PUSHBULLET)],
+            "topic",
+            "message",
+        )
+
+        self.assertEqual(results, [False])
+
+    def test_email_is_sent(self):
+        results = self.dispatcher.deliver(
+            [make_notification(NotificationMedium.EMAIL)], "topic", "message"
+        )
+
+        self.assertEqual(results, [True])
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].subject, "topic")
+        self.assertEqual(mail.outbox[0].body, "message")
+        self.assertEqual(mail.outbox[0].from_email, "from@example.com")
+        self.assertEqual(mail.outbox[0].to, ["to@example.com"])
+
+    def test_email_being_sent_is_not_abandoned_at_timeout(self):
+        self.dispatcher.timeouts[NotificationMedium.EMAIL] = 0.2
+        future = Future()
+        threading.Timer(0.4, future.set_result, [True]).start()
+        self.dispatcher.mailer = mock.Mock(**{"send.return_value": future})
+
+        results = self.dispatcher.deliver(
+            [make_notification(NotificationMedium.EMAIL)], "topic", "message"
+        )
+
+        self.assertEqual(results, [True])
+        self.dispatcher.mailer.send.assert_called_once_with(mock.ANY, timeout=0.2)
+
+    def test_pushes_share_pooled_connection(self):
+        server = StubAPIServer().start()
+        self.addCleanup(server.stop)
+        pushbullet = Pushbullet(api_url=server.url)
+
+        with mock.patch(
+            "apps.notifications.dispatch.get_pushbullet", return_value=pushbullet
+        ):
+            for _ in range(3):
+                results = self.dispatcher.deliver(
+                    [make_notification(NotificationMedium.PUSHBULLET)],
+                    "topic",
+                    "message",
+                )
+                self.assertEqual(results, [True])
+
+        self.assertEqual(len(server.requests), 3)
+        self.assertEqual(server.connections, 1)
+        self.assertEqual(server.requests[0].headers["Authorization"], "Bearer token")
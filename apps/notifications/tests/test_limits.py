@@ -0,0 +1,96 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase
+
+from ..limits import NotificationCoalescer, TokenBucket
+
+
+class TestTokenBucket(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_requests_refused_once_bucket_is_empty(self):
+        bucket = TokenBucket("test", capacity=3, refill_rate=0.001)
+
+        results = [bucket.consume() for _ in range(5)]
+
+        self.assertEqual(results, [True, True, True, False, False])
+
+    def test_bucket_is_shared_by_name(self):
+        TokenBucket("test", capacity=1, refill_rate=0.001).consume()
+
+        self.assertFalse(TokenBucket("test", capacity=1, refill_rate=0.001).consume())
+        self.assertTrue(TokenBucket("other", capacity=1, refill_rate=0.001).consume())
+
+    @mock.patch("apps.notifications.limits.time.time")
+    def test_bucket_refills_over_time(self, mock_time):
+        bucket = TokenBucket("test", capacity=2, refill_rate=0.5)
+        mock_time.return_value = 1000.0
+        bucket.consume()
+        bucket.consume()
+        self.assertFalse(bucket.consume())
+
+        mock_time.return_value = 1002.0
+
+        self.assertTrue(bucket.consume())
+        self.assertFalse(bucket.consume())
+
+    def test_refunded_token_can_be_used_again(self):
+        bucket = TokenBucket("test", capacity=1, refill_rate=0.001)
+        bucket.consume()
+
+        self.assertTrue(bucket.refund())
+        self.assertTrue(bucket.consume())
+        self.assertFalse(bucket.consume())
+
+    def test_refund_does_not_overfill_bucket(self):
+        bucket = TokenBucket("test", capacity=2, refill_rate=0.001)
+
+        bucket.refund(5)
+
+        self.assertEqual(round(bucket.peek()), 2)
+
+    def test_request_refused_when_bucket_is_locked(self):
+        bucket = TokenBucket("test", capacity=1, refill_rate=1)
+        bucket.LOCK_WAIT = 0.01
+        cache.add(f"{bucket.key}:lock", "other-process", 5)
+
+        self.assertFalse(bucket.consume())
+
+
+class TestNotificationCoalescer(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.coalescer = NotificationCoalescer(window=60)
+
+    def test_first_notification_in_window_is_sent_and_later_ones_held(self):
+        positions = [self.coalescer.add("key", f"message {n}")[1] for n in range(3)]
+
+        self.assertEqual(positions, [1, 2, 3])
+
+    def test_flush_returns_held_messages_once(self):
+        window_id, _ = self.coalescer.add("key", "message 0")
+        self.coalescer.add("key", "message 1")
+        self.coalescer.add("key", "message 2")
+
+        self.assertEqual(
+            self.coalescer.flush("key", window_id), ["message 1", "message 2"]
+        )
+        self.assertEqual(self.coalescer.flush("key", window_id), [])
+
+    def test_keys_are_coalesced_separately(self):
+        self.coalescer.add("key-1", "message")
+
+        self.assertEqual(self.coalescer.add("key-2", "message")[1], 1)
+
+    def test_digest_merges_messages(self):
+        digest = self.coalescer.build_digest(["first", "second"])
+
+        self.assertIn("2 further notifications", digest)
+        self.assertIn("first", digest)
+        self.assertIn("second", digest)
+        self.assertEqual(self.coalescer.build_digest(["only"]), "only")
+
+    def test_disabled_when_window_is_zero(self):
+        self.assertFalse(NotificationCoalescer(window=0).is_enabled)
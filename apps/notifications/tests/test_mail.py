@@ -0,0 +1,128 @@
+import threading
+import time
+from unittest import mock
+
+from django.core.mail import EmailMessage
+from django.test import SimpleTestCase, override_settings
+
+from ..mail import EmailBatcher
+from .smtp import StubSMTPServer
+
+
+def make_email(number=0):
+    return EmailMessage(
+        subject=f"subject {number}",
+        body="body",
+        from_email="from@example.com",
+        to=[f"to-{number}@example.com"],
+    )
+
+
+class TestEmailBatcher(SimpleTestCase):
+    def setUp(self):
+        self.server = StubSMTPServer().start()
+        self.addCleanup(self.server.stop)
+
+        settings = override_settings(
+            EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend",
+            EMAIL_HOST=self.server.host,
+            EMAIL_PORT=self.server.port,
+            EMAIL_USE_TLS=False,
+            EMAIL_HOST_USER="",
+            EMAIL_HOST_PASSWORD="",
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.batcher = EmailBatcher(window=0.1)
+        self.addCleanup(self.batcher.close)
+
+    def test_emails_are_sent_over_one_connection(self):
+        futures = [self.batcher.send(make_email(number)) for number in range(5)]
+        results = [future.result(timeout=5) for future in futures]
+
+        futures = [self.batcher.send(make_email(number)) for number in range(2)]
+        results += [future.result(timeout=5) for future in futures]
+
+        self.assertEqual(results, [True] * 7)
+        self.assertEqual(self.server.messages, 7)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_emails_queued_together_are_sent_as_one_batch(self):
+        with mock.patch.object(
+            self.batcher, "send_batch", wraps=self.batcher.send_batch
+        ) as mock_send_batch:
+            futures = [self.batcher.send(make_email(number)) for number in range(5)]
+            for future in futures:
+                future.result(timeout=5)
+
+        mock_send_batch.assert_called_once()
+        self.assertEqual(len(mock_send_batch.call_args.args[0]), 5)
+
+    def test_connection_reopened_after_idle_timeout(self):
+        self.batcher.idle_timeout = 0
+
+        self.batcher.send(make_email()).result(timeout=5)
+        self.batcher.send(make_email()).result(timeout=5)
+
+        self.assertEqual(self.server.connections, 2)
+
+    def test_cancelled_email_is_not_sent(self):
+        release = threading.Event()
+        sent = []
+
+        def send_batch(messages):
+            release.wait(5)
+            sent.extend(message.subject for message in messages)
+            return [True] * len(messages)
+
+        self.batcher.window = 0
+        with mock.patch.object(self.batcher, "send_batch", side_effect=send_batch):
+            first = self.batcher.send(make_email(0))
+            while not first.running():
+                time.sleep(0.01)
+            cancelled = self.batcher.send(make_email(1))
+            self.assertTrue(cancelled.cancel())
+            release.set()
+
+            self.assertTrue(first.result(timeout=5))
+            self.assertTrue(self.batcher.send(make_email(2)).result(timeout=5))
+
+        self.assertEqual(sent, ["subject 0", "subject 2"])
+
+    def test_email_not_sent_within_timeout_is_dropped(self):
+        self.assertFalse(self.batcher.send(make_email(), timeout=0).result(timeout=5))
+
+        self.assertEqual(self.server.messages, 0)
+
+    def test_failed_message_is_retried_without_resending_others(self):
+        connection = mock.Mock()
+        connection.send_messages.side_effect = [
+            1,
+            ConnectionError("server went away"),
+            1,
+            ConnectionError("rejected"),
+            ConnectionError("rejected"),
+            1,
+        ]
+        messages = [make_email(number) for number in range(4)]
+
+        with mock.patch(
+            "apps.notifications.mail.get_connection", return_value=connection
+        ):
+            results = self.batcher.send_batch(messages)
+
+        self.assertEqual(results, [True, True, False, True])
+        # each message is sent on its own, and only a failed message is sent again
+        sent = [call.args[0][0] for call in connection.send_messages.call_args_list]
+        self.assertEqual(
+            sent,
+            [
+                messages[0],
+                messages[1],
+                messages[1],
+                messages[2],
+                messages[2],
+                messages[3],
+            ],
+        )
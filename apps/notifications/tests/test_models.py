@@ -0,0 +1,56 @@
+from django.test import TestCase
+
+from ..models import NotificationLog, NotificationSetting
+from .factories import NotificationLogFactory, NotificationSettingFactory
+
+
+class TestNotificationCounters(TestCase):
+    def setUp(self) -> None:
+        self.notifications = NotificationSettingFactory.create_batch(3)
+
+    def make_logs(self, notification, total):
+        return [
+            NotificationLog(
+                medium=notification, topic="topic", message="message", triggered_by="x"
+            )
+            for _ in range(total)
+        ]
+
+    def test_record_adds_logs_to_total_sent(self):
+        first, second, third = self.notifications
+
+        NotificationLog.objects.record(
+            self.make_logs(first, 2)
+            + self.make_logs(second, 2)
+            + self.make_logs(third, 1)
+        )
+        NotificationLog.objects.record(self.make_logs(first, 1))
+
+        self.assertEqual(NotificationLog.objects.count(), 6)
+        self.assertEqual(
+            dict(NotificationSetting.objects.values_list("pk", "total_sent")),
+            {first.pk: 3, second.pk: 2, third.pk: 1},
+        )
+
+    def test_record_updates_settings_sent_same_total_together(self):
+        logs = [
+            log
+            for notification in self.notifications
+            for log in self.make_logs(notification, 2)
+        ]
+
+        # one insert, one counter update
+        with self.assertNumQueries(2):
+            NotificationLog.objects.record(logs)
+
+    def test_reconcile_total_sent_counts_logs(self):
+        first, second, _ = self.notifications
+        NotificationLogFactory.create_batch(3, medium=first, trigger_log=None)
+        NotificationSetting.objects.filter(pk=second.pk).update(total_sent=5)
+
+        NotificationSetting.objects.reconcile_total_sent()
+
+        self.assertEqual(
+            sorted(NotificationSetting.objects.values_list("total_sent", flat=True)),
+            [0, 0, 3],
+        )
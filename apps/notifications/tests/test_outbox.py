@@ -0,0 +1,184 @@
+import datetime
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+
+from ...events.tests.factories import EventFactory
+from .. import tasks
+from ..dispatch import NotificationDispatcher, pushbullet_limit
+from ..models import (
+    NotificationLog,
+    NotificationMedium,
+    NotificationOutbox,
+    OutboxStatus,
+)
+from ..outbox import OutboxWorker
+from ..tasks import send_notification_digest
+from .factories import (
+    EmailNotificationFactory,
+    NotificationOutboxFactory,
+    NotificationSettingFactory,
+    PushbulletNotificationFactory,
+)
+
+
+@mock.patch(
+    "apps.notifications.dispatch.NotificationDispatcher.send_email", return_value=True
+)
+@mock.patch(
+    "apps.notifications.dispatch.NotificationDispatcher.send_pushbullet",
+    return_value=True,
+)
+class TestOutboxWorker(TestCase):
+    def setUp(self) -> None:
+        self.pb_notification = NotificationSettingFactory(
+            notification_medium=NotificationMedium.PUSHBULLET, is_enabled=True
+        )
+        PushbulletNotificationFactory(notification=self.pb_notification)
+        self.em_notification = NotificationSettingFactory(
+            notification_medium=NotificationMedium.EMAIL, is_enabled=True
+        )
+        EmailNotificationFactory(notification=self.em_notification)
+
+        dispatcher = NotificationDispatcher(
+            limiters={NotificationMedium.PUSHBULLET: mock.Mock(return_value=True)}
+        )
+        self.addCleanup(dispatcher.close)
+        self.worker = OutboxWorker(
+            batch_size=10, max_attempts=3, backoff=30, dispatcher=dispatcher
+        )
+
+    def test_each_medium_is_sent_and_logged(self, mock_pushbullet, mock_email):
+        entries = [
+            NotificationOutboxFactory(medium=self.pb_notification),
+            NotificationOutboxFactory(medium=self.em_notification),
+        ]
+
+        self.assertEqual(self.worker.process_batch(), 2)
+
+        self.assertEqual(mock_pushbullet.call_count, 1)
+        self.assertEqual(mock_email.call_count, 1)
+        for entry in entries:
+            entry.refresh_from_db()
+            self.assertEqual(entry.status, OutboxStatus.SENT)
+            self.assertIsNotNone(entry.sent_at)
+        self.assertEqual(
+            set(NotificationLog.objects.values_list("medium", flat=True)),
+            {self.pb_notification.pk, self.em_notification.pk},
+        )
+
+    def test_failed_notification_is_retried_with_backoff(
+        self, mock_pushbullet, mock_email
+    ):
+        mock_email.return_value = False
+        entry = NotificationOutboxFactory(medium=self.em_notification)
+
+        self.worker.process_batch()
+
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, OutboxStatus.PENDING)
+        self.assertEqual(entry.attempts, 1)
+        self.assertGreater(
+            entry.next_attempt_at, timezone.now() + datetime.timedelta(seconds=25)
+        )
+        self.assertEqual(NotificationLog.objects.count(), 0)
+
+        # not due again until the backoff has passed
+        self.assertEqual(self.worker.process_batch(), 0)
+
+    def test_notification_fails_once_attempts_are_used_up(
+        self, mock_pushbullet, mock_email
+    ):
+        mock_email.return_value = False
+        entry = NotificationOutboxFactory(medium=self.em_notification)
+
+        for _ in range(3):
+            NotificationOutbox.objects.filter(pk=entry.pk).update(
+                next_attempt_at=timezone.now()
+            )
+            self.worker.process_batch()
+
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, OutboxStatus.FAILED)
+        self.assertEqual(entry.attempts, 3)
+        self.assertEqual(mock_email.call_count, 3)
+
+    def test_backoff_doubles_up_to_maximum(self, mock_pushbullet, mock_email):
+        self.worker.max_backoff = 100
+
+        self.assertEqual(
+            [self.worker.get_backoff(attempts).seconds for attempts in range(1, 5)],
+            [30, 60, 100, 100],
+        )
+
+    def test_claimed_notifications_are_hidden_from_other_workers(
+        self, mock_pushbullet, mock_email
+    ):
+        NotificationOutboxFactory.create_batch(3, medium=self.em_notification)
+        self.worker.batch_size = 2
+
+        first = self.worker.claim()
+        second = self.worker.claim()
+
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 1)
+        self.assertEqual(self.worker.claim(), [])
+
+    def test_disabled_notification_is_not_sent(self, mock_pushbullet, mock_email):
+        self.pb_notification.is_enabled = False
+        self.pb_notification.save()
+        entry = NotificationOutboxFactory(medium=self.pb_notification)
+
+        self.worker.process_batch()
+
+        mock_pushbullet.assert_not_called()
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, OutboxStatus.FAILED)
+        self.assertEqual(NotificationLog.objects.count(), 0)
+
+    @mock.patch("apps.notifications.tasks.send_notification_digest.apply_async")
+    def test_pushes_for_same_event_are_coalesced_into_digest(
+        self, mock_schedule, mock_pushbullet, mock_email
+    ):
+        self.addCleanup(setattr, tasks.coalescer, "window", tasks.coalescer.window)
+        tasks.coalescer.window = 60
+        event = EventFactory()
+
+        for number in range(3):
+            NotificationOutboxFactory(
+                medium=self.pb_notification,
+                event=event,
+                message=f"message {number}",
+            )
+            NotificationOutboxFactory(medium=self.em_notification, event=event)
+            self.worker.process_batch()
+
+        # emails are not coalesced
+        self.assertEqual(mock_pushbullet.call_count, 1)
+        self.assertEqual(mock_email.call_count, 3)
+        self.assertEqual(
+            NotificationOutbox.objects.filter(status=OutboxStatus.COALESCED).count(), 2
+        )
+        mock_schedule.assert_called_once()
+
+        send_notification_digest(**mock_schedule.call_args.kwargs["kwargs"])
+
+        self.assertEqual(mock_pushbullet.call_count, 2)
+        digest = mock_pushbullet.call_args.args[2]
+        self.assertIn("message 1", digest)
+        self.assertIn("message 2", digest)
+
+    @mock.patch("apps.notifications.dispatch.PUSHBULLET_RATE_LIMIT_BURST", 2)
+    def test_pushes_over_quota_are_retried_later(self, mock_pushbullet, mock_email):
+        self.worker.dispatcher.limiters = {
+            NotificationMedium.PUSHBULLET: pushbullet_limit
+        }
+        NotificationOutboxFactory.create_batch(4, medium=self.pb_notification)
+
+        self.worker.process_batch()
+
+        self.assertEqual(mock_pushbullet.call_count, 2)
+        self.assertEqual(
+            NotificationOutbox.objects.filter(status=OutboxStatus.PENDING).count(), 2
+        )
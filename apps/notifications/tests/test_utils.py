@@ -0,0 +1,93 @@
+import asyncio
+import json
+from functools import partial
+
+from django.test import SimpleTestCase
+
+import aiohttp
+
+from ..utils import Pushbullet, get_pushbullet
+from .server import StubAPIServer
+
+
+class TestPushbullet(SimpleTestCase):
+    def setUp(self):
+        self.server = StubAPIServer().start()
+        self.addCleanup(self.server.stop)
+        self.pushbullet = Pushbullet(api_url=self.server.url, token_ttl=60)
+
+    def run_calls(self, *calls):
+        """Run calls (Pushbullet coroutine methods taking the HTTP session) in order on one
+        session - returns their results"""
+
+        async def run():
+            async with aiohttp.ClientSession() as http:
+                return [await call(http) for call in calls]
+
+        return asyncio.run(run())
+
+    def push(self, access_token="token", title="title", body="body"):
+        return partial(
+            self.pushbullet.send_push, access_token=access_token, title=title, body=body
+        )
+
+    def validate(self, access_token="token", pushbullet=None):
+        return partial(
+            (pushbullet or self.pushbullet).validate_token, access_token=access_token
+        )
+
+    def test_push_is_sent_without_authenticating_first(self):
+        self.assertEqual(self.run_calls(self.push()), [True])
+        self.assertEqual(len(self.server.requests), 1)
+
+        request = self.server.requests[0]
+        self.assertEqual((request.method, request.path), ("POST", "/v2/pushes"))
+        self.assertEqual(request.headers["Authorization"], "Bearer token")
+        self.assertEqual(
+            json.loads(request.body), {"type": "note", "title": "title", "body": "body"}
+        )
+
+    def test_pushes_reuse_one_connection(self):
+        self.run_calls(
+            *(self.push(access_token=f"token-{number}") for number in range(5))
+        )
+
+        self.assertEqual(len(self.server.requests), 5)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_token_validation_is_cached(self):
+        self.assertEqual(self.run_calls(self.validate(), self.validate()), [True, True])
+
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(self.server.requests[0].path, "/v2/users/me")
+
+    def test_token_validation_expires_after_ttl(self):
+        pushbullet = Pushbullet(api_url=self.server.url, token_ttl=0)
+
+        self.run_calls(
+            self.validate(pushbullet=pushbullet), self.validate(pushbullet=pushbullet)
+        )
+
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_successful_push_validates_token(self):
+        self.assertEqual(self.run_calls(self.push(), self.validate()), [True, True])
+
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_rejected_token_is_not_cached(self):
+        self.run_calls(self.validate())
+        self.server.status_code = 401
+
+        self.assertEqual(self.run_calls(self.push()), [False])
+        self.assertFalse(self.pushbullet.is_token_cached("token"))
+        self.assertEqual(self.run_calls(self.validate()), [False])
+
+    def test_incomplete_push_is_not_sent(self):
+        self.assertEqual(self.run_calls(self.push(title="")), [False])
+        self.assertEqual(self.server.requests, [])
+
+
+class TestGetPushbullet(SimpleTestCase):
+    def test_client_is_shared_within_a_process(self):
+        self.assertIs(get_pushbullet(), get_pushbullet())
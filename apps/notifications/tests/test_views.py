@@ -0,0 +1,54 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ...users.tests.factories import UserFactory
+from ..models import NotificationLog, NotificationMedium
+from .factories import NotificationSettingFactory
+
+
+class TestListNotificationSetting(TestCase):
+    def setUp(self) -> None:
+        self.user = UserFactory()
+        self.client.force_login(self.user)
+        self.url = reverse("notifications:list")
+
+        self.notifications = [
+            NotificationSettingFactory(user=self.user, notification_medium=medium)
+            for medium in NotificationMedium
+        ]
+
+    def send(self, total):
+        NotificationLog.objects.record(
+            NotificationLog(
+                medium=notification,
+                topic="topic",
+                message="message",
+                triggered_by="trigger",
+            )
+            for notification in self.notifications
+            for _ in range(total)
+        )
+
+    def get_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_total_sent_is_shown(self):
+        self.send(4)
+
+        response, _ = self.get_queries()
+
+        self.assertContains(response, "<td>4</td>", count=len(self.notifications))
+
+    def test_queries_do_not_grow_with_notification_history(self):
+        self.send(1)
+        _, queries = self.get_queries()
+
+        self.send(25)
+        _, queries_with_history = self.get_queries()
+
+        self.assertEqual(queries, queries_with_history)
@@ -1,7 +1,11 @@
 import json
 import logging
+import threading
+import time
 
-import requests
+import aiohttp
+
+from smarthub.settings import PUSHBULLET_TIMEOUT, PUSHBULLET_TOKEN_TTL
 
 from . import defines
 
@@ -10,89 +14,143 @@ logging.basicConfig(level=logging.INFO)
 
 
 class Pushbullet:
-    """Handles all API requests/responses"""
+    """Handles all API requests/responses.
+
+    One client is shared by the process (see get_pushbullet()). Requests are made with an
+    aiohttp session passed in by the caller - the notification dispatcher's pooled session, so
+    connections (and their TLS handshakes) are reused between pushes. Pushes are sent
+    directly - the API rejects an invalid token with a 401, so there is no need to validate the
+    token first. The result of validating a token (validate_token()) is cached for token_ttl
+    seconds, and a successful push counts as a validation."""
 
     API_URL = defines.PUSHBULLET_API_BASE_URL
     CONTENT_TYPE = defines.PUSHBULLET_CONTENT_TYPE
 
-    auth_header = None
-    request = None
+    def __init__(
+        self, api_url: str = None, token_ttl: float = 3600, timeout: float = 10
+    ) -> None:
+        self.api_url = (api_url or self.API_URL).rstrip("/")
+        self.token_ttl = float(token_ttl)
+        self.timeout = aiohttp.ClientTimeout(total=float(timeout))
+
+        # access token -> time validation expires
+        self._valid_tokens = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_auth_header(access_token: str) -> dict:
+        """Return header authenticating requests with the user's token"""
+        return {"Authorization": f"Bearer {str(access_token)}"}
+
+    def is_token_cached(self, access_token: str) -> bool:
+        """True if the token has been validated within token_ttl seconds"""
+        with self._lock:
+            expires = self._valid_tokens.get(access_token)
+            if expires is not None and expires <= time.monotonic():
+                del self._valid_tokens[access_token]
+                expires = None
+        return expires is not None
+
+    def _cache_token(self, access_token: str, is_valid: bool) -> None:
+        with self._lock:
+            if is_valid:
+                self._valid_tokens[access_token] = time.monotonic() + self.token_ttl
+            else:
+                self._valid_tokens.pop(access_token, None)
+
+    def record_response(self, access_token: str, status_code: int) -> None:
+        """Update the token cache from the status of a request made with the token"""
+        if status_code == 200:
+            self._cache_token(access_token, is_valid=True)
+        elif status_code in (401, 403):
+            self._cache_token(access_token, is_valid=False)
+
+    async def validate_token(
+        self, http: aiohttp.ClientSession, access_token: str, endpoint="/v2/users/me"
+    ) -> bool:
+        """Returns True if the API accepts the token"""
+        if not access_token:
+            return False
+        if self.is_token_cached(access_token):
+            return True
 
-    def __init__(self, access_token: str) -> None:
-        """Check that user has configured pushbullet"""
         try:
-            self.request = self.authenticate_and_create_auth_header(
-                access_token=access_token
-            )
+            async with http.get(
+                f"{self.api_url}{endpoint}",
+                headers=self.get_auth_header(access_token),
+                timeout=self.timeout,
+            ) as response:
+                await response.read()
+        except aiohttp.ClientError as ex:
+            logger.error("Could not authenticate with pushbullet - %s", ex)
+            return False
 
-        except Exception:
-            raise ValueError("User has not configured Pushbullet token")
+        logger.info("PUSHBULLET auth_response %s", response.status)
+        self.record_response(access_token, response.status)
+        return response.status == 200
 
-    def authenticate_and_create_auth_header(
-        self, access_token, method: str = "get"
-    ) -> bool:
-        """Authenticates user token and stores auth header in auth_header instance var"""
-        try:
-            auth_header = {"Authorization": f"Bearer {str(access_token)}"}
+    @staticmethod
+    def get_push_message(title: str, body: str) -> str:
+        """Return the JSON body of a 'push' API call - None if the data is incomplete"""
+        _type = "note"
 
-            request = getattr(requests, method.lower())
-            response = request(
-                self.API_URL,
-                headers=auth_header,
+        if not title or not body:
+            logger.info(
+                "Pushbullet PUSH - could not be sent as data is incomplete [title=%s, body=%s]",
+                title,
+                body,
             )
+            return None
 
-            response.raise_for_status()
-
-            logger.info(f"PUSHBULLET auth_response {response}")
+        message = {"type": _type, "title": title, "body": body}
+        return json.dumps(message)
+
+    async def send_push(
+        self,
+        http: aiohttp.ClientSession,
+        access_token: str,
+        title: str,
+        body: str,
+        endpoint="/v2/pushes",
+    ) -> bool:
+        """Send a 'push' (note) - returns True if the API accepted it"""
+        json_message = self.get_push_message(title=title, body=body)
+        if json_message is None or not access_token:
+            return False
 
-            if response.status_code == 200:
-                self.auth_header = auth_header
-                return True
-        except Exception as ex:
-            logger.error(ex)
+        headers = self.get_auth_header(access_token)
+        headers["Content-Type"] = self.CONTENT_TYPE
 
-        logger.info("Could not authenticate with pushbullet")
+        async with http.post(
+            f"{self.api_url}{endpoint}",
+            headers=headers,
+            data=json_message,
+            timeout=self.timeout,
+        ) as response:
+            await response.read()
+            self.record_response(access_token, response.status)
 
-    def make_request(
-        self, endpoint: str, json_message: str, method: str = "post"
-    ) -> bool:
-        """Make the actual API request and handle response"""
-        if not self.auth_header:
+        if response.status != 200:
             logger.info(
-                "PUSHBULLET cannot make request until auth_header has been set - has user specified access token?"
+                "Could not execute Pushbullet push - status %s", response.status
             )
-            return
+            return False
 
-        endpoint_url = f"{self.API_URL}{endpoint}"
+        logger.info("PUSHBULLET request successfully processed")
+        return True
 
-        headers = self.auth_header
-        headers["Content-Type"] = self.CONTENT_TYPE
 
-        request = getattr(requests, method.lower())
-        response = request(endpoint_url, headers=headers, data=json_message)
+_pushbullet = None
+_pushbullet_lock = threading.Lock()
 
-        response.raise_for_status()
-        if response.status_code == 200:
-            logger.info("PUSHBULLET request successfully processed")
-            return response
 
-    def send_push(self, title, body, endpoint="/v2/pushes") -> bool:
-        """Setup the 'push' API call and send to make_request"""
-        _type = "note"
+def get_pushbullet() -> Pushbullet:
+    """Return the Pushbullet client for this process - it holds the token validation cache"""
+    global _pushbullet  # pylint: disable=global-statement
 
-        if not title or not body:
-            logger.info(
-                "Pushbullet PUSH - could not be sent as data is incomplete [title=%s, body=%s]",
-                title,
-                body,
+    with _pushbullet_lock:
+        if _pushbullet is None:
+            _pushbullet = Pushbullet(
+                token_ttl=PUSHBULLET_TOKEN_TTL, timeout=PUSHBULLET_TIMEOUT
             )
-            return False
-
-        message = {"type": _type, "title": title, "body": body}
-        json_message = json.dumps(message)
-
-        try:
-            return self.make_request(endpoint=endpoint, json_message=json_message)
-        except Exception as ex:
-            logger.error(ex)
-            logger.info("Could not execute Pushbullet send_push(): %s", ex)
+        return _pushbullet
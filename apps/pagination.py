@@ -0,0 +1,285 @@
+"""Keyset (cursor) pagination for long, append-only tables such as device messages and logs.
+
+Django's Paginator pages with OFFSET, so the database reads and throws away every row before
+the page asked for, and it counts the whole queryset to number the pages. CursorPaginator
+orders by a unique key (created_at, pk) and asks for the rows after (or before) the key of the
+last row shown, which an index on the key answers in the same time for every page. Pages are
+addressed by an opaque cursor rather than a page number, so only first/next/previous
+navigation is offered. The total can optionally be estimated from the query planner instead of
+counted."""
+import base64
+import json
+import logging
+from collections.abc import Sequence
+from typing import List, Optional, Tuple
+
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ChangeList
+from django.core.paginator import InvalidPage
+from django.db import connections
+from django.db.models import Q, QuerySet
+from django.http import Http404
+from django.utils.functional import cached_property
+
+logger = logging.getLogger(__name__)
+
+# query string parameter holding the cursor
+CURSOR_VAR = "cursor"
+
+
+def estimate_count(queryset: QuerySet) -> int:
+    """Return the number of rows the query planner expects queryset to return - PostgreSQL only,
+    other databases are counted"""
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return queryset.count()
+
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+class CursorPage(Sequence):
+    """A page of objects - has the same navigation methods as django's Page, with cursors in
+    place of page numbers"""
+
+    def __init__(
+        self,
+        object_list: list,
+        paginator: "CursorPaginator",
+        has_next: bool,
+        has_previous: bool,
+    ) -> None:
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self) -> str:
+        return f"<CursorPage of {len(self.object_list)} objects>"
+
+    def __len__(self) -> int:
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self) -> bool:
+        return self._has_next
+
+    def has_previous(self) -> bool:
+        return self._has_previous
+
+    def has_other_pages(self) -> bool:
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self) -> Optional[str]:
+        """Cursor of the page after this one - None on the last page"""
+        if not self._has_next:
+            return None
+        return self.paginator.encode_cursor(self.object_list[-1], is_previous=False)
+
+    @property
+    def previous_cursor(self) -> Optional[str]:
+        """Cursor of the page before this one - None on the first page"""
+        if not self._has_previous:
+            return None
+        return self.paginator.encode_cursor(self.object_list[0], is_previous=True)
+
+
+class CursorPaginator:
+    """Pages through queryset by key - see module docstring.
+
+    Parameters:
+        queryset        - objects to page through - its ordering is replaced by key
+        per_page        - objects per page
+        key             - fields uniquely ordering the objects - should be indexed together
+        descending      - newest first when True
+        estimate_total  - count is estimated by the query planner rather than counted
+    """
+
+    # estimates are replaced by an exact count when below this, as counting is cheap then
+    exact_count_below = 1000
+
+    def __init__(
+        self,
+        queryset: QuerySet,
+        per_page: int,
+        key: Tuple[str, ...] = ("created_at", "pk"),
+        descending: bool = True,
+        estimate_total: bool = False,
+    ) -> None:
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.key = tuple(key)
+        self.descending = descending
+        self.estimate_total = estimate_total
+
+    @cached_property
+    def count(self) -> Optional[int]:
+        """Estimated number of objects - None unless estimate_total is set"""
+        if not self.estimate_total:
+            return None
+
+        try:
+            total = estimate_count(self.queryset)
+        except Exception as ex:  # pylint: disable=broad-except
+            logger.error("Could not estimate total - %s", ex)
+            return None
+
+        if total < self.exact_count_below:
+            total = self.queryset.count()
+        return total
+
+    def get_ordering(self, reverse: bool = False) -> List[str]:
+        """Return order_by() arguments for the key"""
+        prefix = "-" if self.descending != reverse else ""
+        return [f"{prefix}{field}" for field in self.key]
+
+    def get_key_values(self, obj) -> list:
+        return [getattr(obj, field) for field in self.key]
+
+    def encode_cursor(self, obj, is_previous: bool) -> str:
+        """Return the cursor for the page before (is_previous) or after obj"""
+        # str() keeps microseconds, which DjangoJSONEncoder would drop
+        data = json.dumps(
+            ["p" if is_previous else "n", *self.get_key_values(obj)], default=str
+        )
+        return base64.urlsafe_b64encode(data.encode("utf-8")).decode("ascii")
+
+    def decode_cursor(self, cursor: str) -> Tuple[bool, list]:
+        """Return (is_previous, key values) - raises InvalidPage if the cursor is invalid"""
+        try:
+            direction, *values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if direction not in ("n", "p") or len(values) != len(self.key):
+                raise ValueError("Unexpected cursor")
+
+            opts = self.queryset.model._meta
+            values = [
+                (opts.pk if field == "pk" else opts.get_field(field)).to_python(value)
+                for field, value in zip(self.key, values)
+            ]
+        except Exception as ex:
+            raise InvalidPage("Invalid cursor") from ex
+
+        return direction == "p", values
+
+    def get_key_filter(self, values: list, is_previous: bool) -> Q:
+        """Return filter for the objects after (or before, if is_previous) the key values -
+        (a, b) < (x, y) is expanded to a < x OR (a = x AND b < y)"""
+        lookup = "gt" if self.descending == is_previous else "lt"
+        key_filter = Q()
+        for position, field in enumerate(self.key):
+            key_filter |= Q(
+                **dict(zip(self.key, values[:position])),
+                **{f"{field}__{lookup}": values[position]},
+            )
+        return key_filter
+
+    def page(self, cursor: str = None) -> CursorPage:
+        """Return the page for cursor - the first page when cursor is empty"""
+        if not cursor:
+            is_previous, queryset = False, self.queryset
+        else:
+            is_previous, values = self.decode_cursor(cursor)
+            queryset = self.queryset.filter(self.get_key_filter(values, is_previous))
+
+        # one extra object is fetched to find whether there is a further page
+        objects = list(
+            queryset.order_by(*self.get_ordering(reverse=is_previous))[
+                : self.per_page + 1
+            ]
+        )
+        has_more = len(objects) > self.per_page
+        objects = objects[: self.per_page]
+
+        if is_previous:
+            objects.reverse()
+            return CursorPage(
+                objects, self, has_next=bool(objects), has_previous=has_more
+            )
+        return CursorPage(
+            objects, self, has_next=has_more, has_previous=bool(cursor and objects)
+        )
+
+
+class CursorPaginationMixin:
+    """Pages a ListView with CursorPaginator - the page is chosen by the cursor query
+    parameter and page_obj is a CursorPage"""
+
+    cursor_key = ("created_at", "pk")
+    cursor_descending = True
+    estimate_total = False
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = CursorPaginator(
+            queryset,
+            page_size,
+            key=self.cursor_key,
+            descending=self.cursor_descending,
+            estimate_total=self.estimate_total,
+        )
+        try:
+            page = paginator.page(self.request.GET.get(CURSOR_VAR))
+        except InvalidPage as ex:
+            raise Http404("Invalid page") from ex
+
+        return paginator, page, page.object_list, page.has_other_pages()
+
+
+class CursorChangeList(ChangeList):
+    """Admin change list paged with CursorPaginator - column sorting is not offered, as
+    objects are always in key order"""
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def get_results(self, request):
+        paginator = CursorPaginator(
+            self.queryset,
+            self.list_per_page,
+            key=self.model_admin.cursor_key,
+            descending=self.model_admin.cursor_descending,
+            estimate_total=True,
+        )
+        try:
+            page = paginator.page(request.GET.get(CURSOR_VAR))
+        except InvalidPage as ex:
+            raise IncorrectLookupParameters from ex
+
+        self.result_count = paginator.count or len(page)
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.result_list = page.object_list
+        self.can_show_all = False
+        self.multi_page = page.has_other_pages()
+        self.paginator = paginator
+        self.page = page
+
+        # urls for the pagination links of the change list template
+        self.first_page_url = self.get_query_string(remove=[CURSOR_VAR])
+        self.next_page_url = self.get_query_string({CURSOR_VAR: page.next_cursor})
+        self.previous_page_url = self.get_query_string(
+            {CURSOR_VAR: page.previous_cursor}
+        )
+
+
+class CursorPaginationAdminMixin:
+    """Pages a ModelAdmin change list with CursorPaginator"""
+
+    cursor_key = ("created_at", "pk")
+    cursor_descending = True
+    change_list_template = "admin/cursor_change_list.html"
+    # objects are always listed in key order
+    sortable_by = ()
+
+    def get_changelist(self, request, **kwargs):
+        return CursorChangeList
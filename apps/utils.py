@@ -0,0 +1,72 @@
+"""Helpers shared by the apps"""
+import logging
+from typing import Any
+
+from django.core.cache import cache
+
+from smarthub.settings import TASK_CLAIM_TTL, TASK_IDEMPOTENCY_TTL
+
+logger = logging.getLogger(__name__)
+
+
+class TaskInProgress(Exception):
+    """Raised when another run of a task holds its claim"""
+
+
+class TaskProgress:
+    """Records the steps an idempotent task has completed in the shared cache, so that a task
+    redelivered by the broker (or retried) resumes after the last completed step - rather than
+    repeating it, or skipping the steps that had not been done.
+
+    Used as a context manager - entering claims the task for claim_ttl seconds (raising
+    TaskInProgress if another run holds the claim) and leaving releases the claim. If the
+    worker dies the claim expires, and the redelivered task resumes from the recorded steps.
+    Steps are remembered for ttl seconds.
+
+    If the cache cannot be reached every step is run (i.e. duplicates are preferred to lost
+    work)."""
+
+    def __init__(
+        self, key: str, ttl: int = TASK_IDEMPOTENCY_TTL, claim_ttl: int = TASK_CLAIM_TTL
+    ) -> None:
+        self.key = f"task-progress:{key}"
+        self.claim_key = f"{self.key}:claim"
+        self.ttl = ttl
+        self.claim_ttl = claim_ttl
+        self.steps = {}
+
+    def __enter__(self) -> "TaskProgress":
+        try:
+            is_claimed = cache.add(self.claim_key, True, self.claim_ttl)
+            if is_claimed:
+                self.steps = cache.get(self.key) or {}
+        except Exception as ex:  # pylint: disable=broad-except
+            logger.error("TaskProgress - could not claim %s - %s", self.key, ex)
+            return self
+
+        if not is_claimed:
+            raise TaskInProgress(self.key)
+        return self
+
+    def __exit__(self, *exc_info) -> bool:
+        try:
+            cache.delete(self.claim_key)
+        except Exception:  # pylint: disable=broad-except
+            pass
+        return False
+
+    def is_done(self, step: str) -> bool:
+        """True if step was completed by this or an earlier run"""
+        return step in self.steps
+
+    def get(self, step: str, default: Any = None) -> Any:
+        """Return the data recorded for step"""
+        return self.steps.get(step, default)
+
+    def record(self, step: str, data: Any = True) -> None:
+        """Record that step has completed - data is returned by get() in later runs"""
+        self.steps[step] = data
+        try:
+            cache.set(self.key, self.steps, self.ttl)
+        except Exception as ex:  # pylint: disable=broad-except
+            logger.error("TaskProgress - could not record %s - %s", self.key, ex)
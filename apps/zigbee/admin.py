@@ -4,6 +4,7 @@ from django.contrib.contenttypes.admin import GenericInlineModelAdmin
 from django_admin_inline_paginator.admin import TabularInlinePaginated
 
 from ..devices.models import DeviceState
+from ..pagination import CursorPaginationAdminMixin
 from . import models
 
 
@@ -35,6 +36,13 @@ class ZigbeeLogsInline(TabularInlinePaginated):
     readonly_fields = ("created_at", "updated_at")
 
 
+class ZigbeeDeviceFieldInline(admin.TabularInline):
+    model = models.ZigbeeDeviceField
+    extra = 0
+    ordering = ["name"]
+    readonly_fields = ("name", "value_type", "first_seen_at", "last_seen_at")
+
+
 class ZigbeeDeviceAdmin(admin.ModelAdmin):
     list_display = (
         "friendly_name",
@@ -46,6 +54,7 @@ class ZigbeeDeviceAdmin(admin.ModelAdmin):
         "updated_at",
     )
     inlines = [
+        ZigbeeDeviceFieldInline,
         ZigbeeMessageInline,
     ]
     readonly_fields = ("created_at", "updated_at")
@@ -59,7 +68,7 @@ class ZigbeeDeviceAdmin(admin.ModelAdmin):
         return truncate_string(obj.description)
 
 
-class ZigbeeMessageAdmin(admin.ModelAdmin):
+class ZigbeeMessageAdmin(CursorPaginationAdminMixin, admin.ModelAdmin):
     list_display = ("topic", "truncated_raw_message", "created_at")
     list_filter = ("topic",)
     readonly_fields = ("created_at", "updated_at")
@@ -72,13 +81,14 @@ class ZigbeeMessageAdmin(admin.ModelAdmin):
         return truncate_string(obj.raw_message, 100)
 
 
-class ZigbeeLogAdmin(admin.ModelAdmin):
+class ZigbeeLogAdmin(CursorPaginationAdminMixin, admin.ModelAdmin):
     list_display = (
         "broker_message",
         "metadata_type",
         "truncated_metadata_value",
         "created_at",
     )
+    list_select_related = ("broker_message",)
     list_filter = ("broker_message__topic", "metadata_type")
     readonly_fields = ("created_at", "updated_at")
 
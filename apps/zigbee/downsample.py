@@ -0,0 +1,183 @@
+"""Downsamples numeric time series for charts.
+
+A chart cannot show more points than it has pixels, so long series are reduced server-side to
+at most threshold points before they are sent to the browser:
+    lttb    - Largest-Triangle-Three-Buckets (Steinarsson, 2013) - keeps the points which
+              best preserve the shape of the line
+    minmax  - the lowest and highest point of each bucket - keeps every peak and trough
+Points are (timestamp, value) pairs sorted by timestamp. NumPy is used when it is installed;
+otherwise the pure Python implementations are used, which give the same result but are much
+slower for long series."""
+import itertools
+import math
+from typing import Iterable, List, Sequence, Tuple
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+METHODS = ("lttb", "minmax")
+# fewest points a series can be downsampled to - the first and last points and the lowest
+# and highest points of a bucket
+MIN_THRESHOLD = 4
+
+Points = List[Tuple[float, float]]
+
+
+def read_series(rows: Iterable[Tuple[float, float]]) -> Tuple[Sequence, Sequence]:
+    """Return the timestamps and values of (timestamp, value) rows - as NumPy arrays if it is
+    installed, which are filled without holding every row in memory"""
+    if numpy is None:
+        times, values = [], []
+        for timestamp, value in rows:
+            times.append(timestamp)
+            values.append(value)
+        return times, values
+
+    pairs = numpy.fromiter(itertools.chain.from_iterable(rows), dtype=float)
+    pairs = pairs.reshape(-1, 2)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def get_bucket_bounds(total: int, buckets: int) -> List[int]:
+    """Return the bucket boundaries splitting points 1 to total - 2 (the first and last points
+    are kept as they are) into buckets of (nearly) equal size"""
+    size = (total - 2) / buckets
+    bounds = [1 + int(math.floor(size * bucket)) for bucket in range(buckets)]
+    return bounds + [total - 1]
+
+
+def lttb_python(
+    times: Sequence[float], values: Sequence[float], threshold: int
+) -> Points:
+    """LTTB - pure Python"""
+    total = len(times)
+    bounds = get_bucket_bounds(total, threshold - 2)
+
+    selected = 0
+    points = [(times[0], values[0])]
+    for bucket in range(threshold - 2):
+        start, end = bounds[bucket], bounds[bucket + 1]
+
+        # the third triangle point is the average of the next bucket
+        next_start = end
+        next_end = bounds[bucket + 2] if bucket + 2 < len(bounds) else total
+        next_count = next_end - next_start
+        average_time = sum(times[next_start:next_end]) / next_count
+        average_value = sum(values[next_start:next_end]) / next_count
+
+        selected_time, selected_value = times[selected], values[selected]
+        max_area, next_selected = -1.0, start
+        for index in range(start, end):
+            area = abs(
+                (selected_time - average_time) * (values[index] - selected_value)
+                - (selected_time - times[index]) * (average_value - selected_value)
+            )
+            if area > max_area:
+                max_area, next_selected = area, index
+
+        selected = next_selected
+        points.append((times[selected], values[selected]))
+
+    points.append((times[-1], values[-1]))
+    return points
+
+
+def lttb_numpy(times, values, threshold: int) -> Points:
+    """LTTB - the triangle areas of each bucket are computed with NumPy"""
+    times = numpy.asarray(times, dtype=float)
+    values = numpy.asarray(values, dtype=float)
+    total = len(times)
+    bounds = get_bucket_bounds(total, threshold - 2) + [total]
+
+    # averages of every bucket, including the last point as a bucket of its own
+    time_sums = numpy.add.reduceat(times, bounds[:-1])
+    value_sums = numpy.add.reduceat(values, bounds[:-1])
+    counts = numpy.diff(bounds)
+    average_times, average_values = time_sums / counts, value_sums / counts
+
+    indexes = numpy.empty(threshold, dtype=numpy.int64)
+    indexes[0], indexes[-1] = 0, total - 1
+    selected = 0
+    for bucket in range(threshold - 2):
+        start, end = bounds[bucket], bounds[bucket + 1]
+        selected_time, selected_value = times[selected], values[selected]
+
+        areas = numpy.abs(
+            (selected_time - average_times[bucket + 1])
+            * (values[start:end] - selected_value)
+            - (selected_time - times[start:end])
+            * (average_values[bucket + 1] - selected_value)
+        )
+        selected = start + int(areas.argmax())
+        indexes[bucket + 1] = selected
+
+    return list(zip(times[indexes].tolist(), values[indexes].tolist()))
+
+
+def minmax_python(
+    times: Sequence[float], values: Sequence[float], threshold: int
+) -> Points:
+    """Lowest and highest point of each bucket - pure Python"""
+    total = len(times)
+    bounds = get_bucket_bounds(total, (threshold - 2) // 2)
+
+    indexes = [0]
+    for start, end in zip(bounds, bounds[1:]):
+        if start >= end:
+            continue
+        bucket = range(start, end)
+        low = min(bucket, key=values.__getitem__)
+        high = max(bucket, key=values.__getitem__)
+        indexes.extend(sorted({low, high}))
+    indexes.append(total - 1)
+
+    return [(times[index], values[index]) for index in indexes]
+
+
+def minmax_numpy(times, values, threshold: int) -> Points:
+    """Lowest and highest point of each bucket - with NumPy"""
+    times = numpy.asarray(times, dtype=float)
+    values = numpy.asarray(values, dtype=float)
+    total = len(times)
+    bounds = get_bucket_bounds(total, (threshold - 2) // 2)
+
+    indexes = [0]
+    for start, end in zip(bounds, bounds[1:]):
+        if start >= end:
+            continue
+        bucket = values[start:end]
+        low, high = start + int(bucket.argmin()), start + int(bucket.argmax())
+        indexes.extend(sorted({low, high}))
+    indexes.append(total - 1)
+
+    return list(zip(times[indexes].tolist(), values[indexes].tolist()))
+
+
+def downsample(
+    times: Sequence[float],
+    values: Sequence[float],
+    threshold: int,
+    method: str = "lttb",
+    use_numpy: bool = True,
+) -> Points:
+    """Return at most threshold (timestamp, value) points representing the series - series
+    with no more than threshold points are returned as they are"""
+    if method not in METHODS:
+        raise ValueError(f"Unknown downsampling method {method}")
+
+    if len(times) <= threshold:
+        if numpy is not None and isinstance(times, numpy.ndarray):
+            times, values = times.tolist(), values.tolist()
+        return list(zip(times, values))
+    if threshold < MIN_THRESHOLD:
+        raise ValueError(
+            f"Series cannot be downsampled to less than {MIN_THRESHOLD} points"
+        )
+
+    if use_numpy and numpy is not None:
+        function = lttb_numpy if method == "lttb" else minmax_numpy
+    else:
+        function = lttb_python if method == "lttb" else minmax_python
+    return function(times, values, threshold)
@@ -0,0 +1,89 @@
+"""Maintains the catalog of fields reported by each zigbee device (ZigbeeDeviceField).
+
+The event trigger form lists a device's fields, which used to be found with a DISTINCT over
+every log of the device. The MQTT ingest process now remembers the fields it has catalogued
+for each device, and only writes to the catalog when a device reports a field it has not seen
+before. last_seen_at is updated at most once per interval seconds for each device."""
+import datetime
+import logging
+import threading
+import time
+from typing import Dict, Set
+
+logger = logging.getLogger(__name__)
+
+
+class FieldCatalog:
+    """Adds the fields of ingested messages to ZigbeeDeviceField - see module docstring"""
+
+    def __init__(self, interval: float = 60) -> None:
+        self.interval = float(interval)
+
+        # device id -> field names known to be catalogued
+        self._known: Dict[int, Set[str]] = {}
+        # device id -> time.monotonic() of the last last_seen_at write
+        self._written: Dict[int, float] = {}
+        self._lock = threading.Lock()
+
+    def record(
+        self, zigbee_device_id: int, payload: dict, seen_at: datetime.datetime
+    ) -> int:
+        """Catalog the fields in payload - returns the number of fields new to this process"""
+        if not zigbee_device_id or not isinstance(payload, dict):
+            return 0
+
+        now = time.monotonic()
+        with self._lock:
+            known = self._known.setdefault(zigbee_device_id, set())
+            # empty values are not logged, so their fields are not catalogued either
+            new_fields = {
+                field: value
+                for field, value in payload.items()
+                if field not in known and len(str(value)) > 0
+            }
+            written_at = self._written.get(zigbee_device_id)
+            is_due = written_at is None or now - written_at >= self.interval
+            if is_due:
+                self._written[zigbee_device_id] = now
+
+        if not new_fields and not is_due:
+            return 0
+
+        # pylint: disable=import-outside-toplevel
+        from .models import ZigbeeDeviceField
+
+        try:
+            if new_fields:
+                # fields catalogued by another process (or before a restart) are kept
+                ZigbeeDeviceField.objects.bulk_create(
+                    [
+                        ZigbeeDeviceField(
+                            zigbee_device_id=zigbee_device_id,
+                            name=field,
+                            value_type=ZigbeeDeviceField.get_value_type(value),
+                            first_seen_at=seen_at,
+                            last_seen_at=seen_at,
+                        )
+                        for field, value in new_fields.items()
+                    ],
+                    ignore_conflicts=True,
+                )
+            if is_due:
+                ZigbeeDeviceField.objects.filter(
+                    zigbee_device_id=zigbee_device_id, name__in=list(payload)
+                ).update(last_seen_at=seen_at)
+        except Exception as ex:  # pylint: disable=broad-except
+            logger.error("Could not catalog fields - %s - %s", zigbee_device_id, ex)
+            with self._lock:
+                self._written.pop(zigbee_device_id, None)
+            return 0
+
+        with self._lock:
+            self._known.setdefault(zigbee_device_id, set()).update(new_fields)
+        return len(new_fields)
+
+    def clear(self) -> None:
+        """Forget the catalogued fields - the next message for each device is written"""
+        with self._lock:
+            self._known = {}
+            self._written = {}
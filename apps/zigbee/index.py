@@ -0,0 +1,153 @@
+"""In-process index for resolving MQTT topics to ZigbeeDevices.
+
+The MQTT ingest process warms the index with one query at startup - from then on
+ZigbeeMessage.link_to_zigbee_device() is a dict lookup rather than an ieee_address/friendly_name
+query per message, and the message is given a ZigbeeDevice built from the indexed columns (the
+rest are deferred) so reading message.zigbee_device does not query either. Signals (see
+signals.py) keep the index current when devices are created, renamed or deleted, and bump a
+generation counter in the django cache so the index is rebuilt when the change was made by
+another process (e.g. the web app). Processes that never warm the index fall back to querying
+the DB."""
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+
+from django.db import DEFAULT_DB_ALIAS
+
+from smarthub.settings import MQTT_INDEX_CHECK_INTERVAL
+
+from ..mqtt.utils import CacheGeneration
+
+logger = logging.getLogger(__name__)
+
+# ZigbeeDevice columns held by the index
+DEVICE_FIELDS = ("id", "ieee_address", "friendly_name", "created_at", "device_id")
+
+
+class DeviceTopicIndex:
+    """Maps device identifiers (ieee_address and friendly_name) to ZigbeeDevice ids"""
+
+    def __init__(self, check_interval: float = 5.0) -> None:
+        self.generation = CacheGeneration(
+            "zigbee-device-index", check_interval=check_interval
+        )
+        self.is_warm = False
+
+        # identifier -> {device id: created_at}, device id -> identifiers, device id -> row
+        self._identifiers: Dict[str, dict] = {}
+        self._devices: Dict[int, Tuple[str, ...]] = {}
+        self._rows: Dict[int, tuple] = {}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def get_identifiers(ieee_address, friendly_name) -> Tuple[str, ...]:
+        """Return the lowercase identifiers a device can be matched on"""
+        return tuple(
+            {str(value).lower() for value in (ieee_address, friendly_name) if value}
+        )
+
+    def warm(self) -> "DeviceTopicIndex":
+        """(Re)build the index from the DB in one query"""
+        # pylint: disable=import-outside-toplevel
+        from .models import ZigbeeDevice
+
+        generation = self.generation.current()
+        rows = ZigbeeDevice.objects.values_list(*DEVICE_FIELDS)
+
+        with self._lock:
+            self._identifiers = {}
+            self._devices = {}
+            self._rows = {}
+            for row in rows:
+                self._add(row)
+
+            self.is_warm = True
+            self.generation.mark_seen(generation)
+
+        logger.info("Zigbee device index warmed - %s devices", len(self._devices))
+        return self
+
+    def clear(self) -> None:
+        """Empty the index - lookups fall back to the DB until warm() is called again"""
+        with self._lock:
+            self._identifiers = {}
+            self._devices = {}
+            self._rows = {}
+            self.is_warm = False
+            self.generation.seen = None
+
+    def resolve(self, identifier: str) -> Optional[int]:
+        """Return id of the device matching identifier - the most recently created device wins
+        when there is more than one, matching the ordering of the DB lookup"""
+        if self.generation.is_stale():
+            logger.info("Zigbee device index changed by another process - rebuilding")
+            self.warm()
+
+        with self._lock:
+            devices = self._identifiers.get(str(identifier).lower())
+            if not devices:
+                return None
+            return max(devices, key=devices.get)
+
+    def resolve_device(self, identifier: str):
+        """Return the ZigbeeDevice matching identifier (see resolve()) - a new instance each
+        call, built from the indexed columns, so related objects are never shared"""
+        # pylint: disable=import-outside-toplevel
+        from .models import ZigbeeDevice
+
+        device_id = self.resolve(identifier)
+        with self._lock:
+            row = self._rows.get(device_id)
+        if row is None:
+            return None
+        return ZigbeeDevice.from_db(DEFAULT_DB_ALIAS, DEVICE_FIELDS, row)
+
+    def update(self, device) -> None:
+        """Add/replace device in the index and notify other processes"""
+        with self._lock:
+            if self.is_warm:
+                self._remove(device.pk)
+                self._add(tuple(getattr(device, field) for field in DEVICE_FIELDS))
+        self._bump()
+
+    def remove(self, device_id: int) -> None:
+        """Remove device from the index and notify other processes"""
+        with self._lock:
+            if self.is_warm:
+                self._remove(device_id)
+        self._bump()
+
+    def invalidate(self) -> None:
+        """Rebuild the index in every process (this one included) on their next check - for
+        devices changed without signals, e.g. unlinked from a deleted user device"""
+        self.generation.bump()
+
+    def _add(self, row: tuple) -> None:
+        pk, ieee_address, friendly_name, created_at, _ = row
+        identifiers = self.get_identifiers(ieee_address, friendly_name)
+        self._devices[pk] = identifiers
+        self._rows[pk] = row
+
+        for identifier in identifiers:
+            self._identifiers.setdefault(identifier, {})[pk] = created_at
+
+    def _remove(self, pk) -> None:
+        self._rows.pop(pk, None)
+        for identifier in self._devices.pop(pk, ()):
+            devices = self._identifiers.get(identifier, {})
+            devices.pop(pk, None)
+            if not devices:
+                self._identifiers.pop(identifier, None)
+
+    def _bump(self) -> None:
+        """Bump the shared generation - if nothing else changed in between, this process is
+        already up to date so there is no need to rebuild on the next check"""
+        generation = self.generation.bump()
+
+        with self._lock:
+            seen = self.generation.seen
+            if self.is_warm and seen is not None and generation == seen + 1:
+                self.generation.mark_seen(generation)
+
+
+device_topic_index = DeviceTopicIndex(check_interval=MQTT_INDEX_CHECK_INTERVAL)
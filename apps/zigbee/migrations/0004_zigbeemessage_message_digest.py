@@ -0,0 +1,22 @@
+# Generated by Django 3.2.5 on 2026-10-17 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("zigbee", "0003_zigbeedevice_is_controllable"),
+    ]
+
+    # added without an index - adding a nullable column does not rewrite the table, and
+    # the unique index is built concurrently by 0011_zigbeemessage_digest_index
+    operations = [
+        migrations.AddField(
+            model_name="zigbeemessage",
+            name="message_digest",
+            field=models.CharField(
+                blank=True, editable=False, max_length=64, null=True
+            ),
+        ),
+    ]
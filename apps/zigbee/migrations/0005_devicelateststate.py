@@ -0,0 +1,73 @@
+# Generated by Django 3.2.5 on 2026-10-17 16:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def build_latest_states(apps, schema_editor):
+    """Create each device's state from the logs of its newest message"""
+    zigbee_message = apps.get_model("zigbee", "ZigbeeMessage")
+    zigbee_log = apps.get_model("zigbee", "ZigbeeLog")
+    device_latest_state = apps.get_model("zigbee", "DeviceLatestState")
+
+    latest_messages = (
+        zigbee_message.objects.filter(zigbee_device__isnull=False)
+        .order_by("zigbee_device", "-created_at")
+        .distinct("zigbee_device")
+    )
+
+    states = []
+    for message in latest_messages.iterator():
+        received_at = message.created_at.isoformat()
+        logs = zigbee_log.objects.filter(broker_message=message).values_list(
+            "metadata_type", "metadata_value"
+        )
+        states.append(
+            device_latest_state(
+                zigbee_device_id=message.zigbee_device_id,
+                state={
+                    field: {"value": value, "updated_at": received_at}
+                    for field, value in logs
+                },
+                last_message=message,
+                last_message_at=message.created_at,
+            )
+        )
+    device_latest_state.objects.bulk_create(states, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("zigbee", "0004_zigbeemessage_message_digest"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DeviceLatestState",
+            fields=[
+                (
+                    "zigbee_device",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="latest_state",
+                        serialize=False,
+                        to="zigbee.zigbeedevice",
+                    ),
+                ),
+                ("state", models.JSONField(default=dict)),
+                ("last_message_at", models.DateTimeField()),
+                (
+                    "last_message",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to="zigbee.zigbeemessage",
+                    ),
+                ),
+            ],
+        ),
+        migrations.RunPython(build_latest_states, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.5 on 2026-10-17 16:40
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def set_last_seen_at(apps, schema_editor):
+    """Populate last_seen_at from each device's newest message"""
+    zigbee_device = apps.get_model("zigbee", "ZigbeeDevice")
+    zigbee_message = apps.get_model("zigbee", "ZigbeeMessage")
+
+    newest_message = (
+        zigbee_message.objects.filter(zigbee_device=OuterRef("pk"))
+        .order_by("-created_at")
+        .values("created_at")[:1]
+    )
+    zigbee_device.objects.update(last_seen_at=Subquery(newest_message))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("zigbee", "0005_devicelateststate"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="zigbeedevice",
+            name="last_seen_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(set_last_seen_at, migrations.RunPython.noop),
+    ]
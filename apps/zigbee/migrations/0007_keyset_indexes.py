@@ -0,0 +1,33 @@
+# Generated by Django 3.2.5 on 2026-10-17 17:05
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # the indexes are built without blocking writes to the message and log tables
+    atomic = False
+
+    dependencies = [
+        ("zigbee", "0006_zigbeedevice_last_seen_at"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="zigbeemessage",
+            index=models.Index(
+                fields=["zigbee_device", "created_at", "id"],
+                name="zigbeemessage_device_keyset",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="zigbeemessage",
+            index=models.Index(
+                fields=["created_at", "id"], name="zigbeemessage_keyset"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="zigbeelog",
+            index=models.Index(fields=["created_at", "id"], name="zigbeelog_keyset"),
+        ),
+    ]
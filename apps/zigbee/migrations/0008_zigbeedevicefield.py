@@ -0,0 +1,81 @@
+# Generated by Django 3.2.5 on 2026-10-17 17:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# catalog each device's logged fields - the type is the most common type of the field's values
+BUILD_FIELDS = """
+INSERT INTO zigbee_zigbeedevicefield
+    (zigbee_device_id, name, value_type, first_seen_at, last_seen_at)
+SELECT
+    message.zigbee_device_id,
+    log.metadata_type,
+    CASE mode() WITHIN GROUP (ORDER BY jsonb_typeof(log.metadata_value))
+        WHEN 'boolean' THEN 'boolean'
+        WHEN 'number' THEN 'number'
+        WHEN 'object' THEN 'object'
+        WHEN 'array' THEN 'object'
+        ELSE 'text'
+    END,
+    min(message.created_at),
+    max(message.created_at)
+FROM zigbee_zigbeelog log
+JOIN zigbee_zigbeemessage message ON message.id = log.broker_message_id
+WHERE message.zigbee_device_id IS NOT NULL
+GROUP BY message.zigbee_device_id, log.metadata_type
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("zigbee", "0007_keyset_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ZigbeeDeviceField",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=100)),
+                (
+                    "value_type",
+                    models.CharField(
+                        choices=[
+                            ("boolean", "Boolean"),
+                            ("number", "Number"),
+                            ("text", "Text"),
+                            ("object", "Object"),
+                        ],
+                        default="text",
+                        max_length=10,
+                    ),
+                ),
+                ("first_seen_at", models.DateTimeField()),
+                ("last_seen_at", models.DateTimeField()),
+                (
+                    "zigbee_device",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="fields",
+                        to="zigbee.zigbeedevice",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="zigbeedevicefield",
+            constraint=models.UniqueConstraint(
+                fields=("zigbee_device", "name"), name="zigbee_device_field"
+            ),
+        ),
+        migrations.RunSQL(BUILD_FIELDS, migrations.RunSQL.noop),
+    ]
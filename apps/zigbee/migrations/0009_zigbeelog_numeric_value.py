@@ -0,0 +1,70 @@
+# Generated by Django 3.2.5 on 2026-10-17 18:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Max, Min
+
+# logs updated per statement - each batch is committed on its own
+BATCH_SIZE = 10000
+
+# copy the values of existing logs which are JSON numbers, with their message's device and
+# received time - only these logs are read as time series
+SET_NUMERIC_VALUES = """
+UPDATE zigbee_zigbeelog log
+SET
+    numeric_value = (log.metadata_value #>> '{}')::double precision,
+    zigbee_device_id = message.zigbee_device_id,
+    received_at = message.created_at
+FROM zigbee_zigbeemessage message
+WHERE message.id = log.broker_message_id
+    AND jsonb_typeof(log.metadata_value) = 'number'
+    AND log.id >= %s AND log.id < %s
+"""
+
+
+def set_numeric_values(apps, schema_editor):
+    """Backfill the new fields a range of log ids at a time - so that no long transaction
+    holds row locks on zigbee_zigbeelog while it runs"""
+    zigbee_log = apps.get_model("zigbee", "ZigbeeLog")
+    bounds = zigbee_log.objects.aggregate(first=Min("pk"), last=Max("pk"))
+    if bounds["first"] is None:
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        for start in range(bounds["first"], bounds["last"] + 1, BATCH_SIZE):
+            cursor.execute(SET_NUMERIC_VALUES, [start, start + BATCH_SIZE])
+
+
+class Migration(migrations.Migration):
+    # the logs are backfilled in batches, each in its own transaction
+    atomic = False
+
+    dependencies = [
+        ("zigbee", "0008_zigbeedevicefield"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="zigbeelog",
+            name="numeric_value",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="zigbeelog",
+            name="zigbee_device",
+            field=models.ForeignKey(
+                blank=True,
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.DO_NOTHING,
+                related_name="+",
+                to="zigbee.zigbeedevice",
+            ),
+        ),
+        migrations.AddField(
+            model_name="zigbeelog",
+            name="received_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(set_numeric_values, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.2.5 on 2026-10-17 18:25
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # the index is built without blocking writes to zigbee_zigbeelog
+    atomic = False
+
+    dependencies = [
+        ("zigbee", "0009_zigbeelog_numeric_value"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="zigbeelog",
+            index=models.Index(
+                condition=models.Q(numeric_value__isnull=False),
+                fields=["zigbee_device", "metadata_type", "received_at"],
+                include=["numeric_value"],
+                name="zigbeelog_series",
+            ),
+        ),
+    ]
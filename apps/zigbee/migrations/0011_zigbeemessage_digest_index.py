@@ -0,0 +1,43 @@
+# Generated by Django 3.2.5 on 2026-10-17 19:10
+
+from django.db import migrations, models
+
+# the unique index is built without blocking writes to zigbee_zigbeemessage, then
+# attached as the constraint (which only needs a brief lock)
+CREATE_INDEX = """
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS zigbeemessage_digest
+ON zigbee_zigbeemessage (message_digest)
+"""
+ADD_CONSTRAINT = """
+ALTER TABLE zigbee_zigbeemessage
+ADD CONSTRAINT zigbeemessage_digest UNIQUE USING INDEX zigbeemessage_digest
+"""
+DROP_CONSTRAINT = """
+ALTER TABLE zigbee_zigbeemessage DROP CONSTRAINT IF EXISTS zigbeemessage_digest
+"""
+DROP_INDEX = "DROP INDEX CONCURRENTLY IF EXISTS zigbeemessage_digest"
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("zigbee", "0010_zigbeelog_series_index"),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(CREATE_INDEX, DROP_INDEX),
+                migrations.RunSQL(ADD_CONSTRAINT, DROP_CONSTRAINT),
+            ],
+            state_operations=[
+                migrations.AddConstraint(
+                    model_name="zigbeemessage",
+                    constraint=models.UniqueConstraint(
+                        fields=("message_digest",), name="zigbeemessage_digest"
+                    ),
+                ),
+            ],
+        ),
+    ]
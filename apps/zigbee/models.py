@@ -1,19 +1,27 @@
 """Specifies data models for creating and storing information from zigbee devices"""
+import datetime
+import hashlib
 import json
 import logging
-from json.decoder import JSONDecodeError
-from typing import TYPE_CHECKING, Tuple, Union
+import math
+from typing import TYPE_CHECKING, List, Tuple, Union
 
 from django.apps import apps
 from django.contrib.auth import get_user_model
 from django.contrib.contenttypes.fields import GenericRelation
-from django.db import models
+from django.db import connection, models
+from django.db.models.constraints import UniqueConstraint
+from django.db.models.functions import Extract
 from django.db.models.query_utils import Q
+from django.utils.translation import gettext_lazy as _
 
 from ..devices.models import DeviceProtocol
+from ..events.index import event_trigger_index
 from ..models import BaseAbstractModel
+from ..mqtt import codec
 from ..mqtt.publish import send_messages
-from ..notifications.models import NotificationMedium
+from ..notifications.models import NotificationOutbox
+from .index import device_topic_index
 
 if TYPE_CHECKING:
     from ..devices.models import Device
@@ -22,18 +30,17 @@ if TYPE_CHECKING:
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
-METADATA_TYPE_FIELD = "zigbeemessage__zigbeelog__metadata_type"
-
 
 class ZigbeeDeviceQuerySet(models.QuerySet):
     """Custom queries"""
 
     def get_metadata_fields(self, device) -> models.QuerySet:
-        """Return list of unique metadata values for the specified device"""
+        """Return list of unique metadata values for the specified device - read from the
+        field catalog (ZigbeeDeviceField) rather than the device's logs"""
         return (
-            self.filter(device=device)
-            .order_by(METADATA_TYPE_FIELD)
-            .values_list(METADATA_TYPE_FIELD, flat=True)
+            ZigbeeDeviceField.objects.filter(zigbee_device__device=device)
+            .order_by("name")
+            .values_list("name", flat=True)
             .distinct()
         )
 
@@ -80,6 +87,8 @@ class ZigbeeDevice(BaseAbstractModel):
     model_id = models.CharField(max_length=100, blank=True, null=True)
     power_source = models.CharField(max_length=100, blank=True, null=True)
     is_controllable = models.BooleanField(default=False)
+    # when the device last sent a message - updated at most once a minute (see seen.py)
+    last_seen_at = models.DateTimeField(blank=True, null=True)
 
     def __init__(self, *args, **kwargs) -> None:
         super().__init__(*args, **kwargs)
@@ -219,6 +228,23 @@ class ZigbeeMessage(BaseAbstractModel):
     )
     raw_message = models.JSONField()
     topic = models.CharField(max_length=255)
+    # hash of topic and canonical payload - unique, so duplicates are found by index
+    message_digest = models.CharField(
+        max_length=64, null=True, blank=True, editable=False
+    )
+
+    class Meta(BaseAbstractModel.Meta):
+        # keys of the cursor pagination of device logs and the admin (see apps.pagination)
+        indexes = [
+            models.Index(
+                fields=["zigbee_device", "created_at", "id"],
+                name="zigbeemessage_device_keyset",
+            ),
+            models.Index(fields=["created_at", "id"], name="zigbeemessage_keyset"),
+        ]
+        constraints = [
+            UniqueConstraint(fields=["message_digest"], name="zigbeemessage_digest")
+        ]
 
     def __init__(self, *args, **kwargs) -> None:
         super().__init__(*args, **kwargs)
@@ -226,6 +252,26 @@ class ZigbeeMessage(BaseAbstractModel):
         self.user_device = None
         self.message = None
 
+    @staticmethod
+    def get_digest(topic: str, payload) -> str:
+        """Return sha256 digest of the topic and payload. The payload is serialised with sorted
+        keys so that messages with the same content produce the same digest. Stored digests
+        are compared with new ones, so the serialisation is fixed (the standard library's
+        compact, ASCII-escaped JSON) rather than that of the configured codec."""
+        if isinstance(payload, (str, bytes)):
+            try:
+                payload = codec.loads(payload)
+            except codec.DecodeError:
+                pass
+
+        canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(f"{topic}\n{canonical}".encode("utf-8")).hexdigest()
+
+    @classmethod
+    def is_duplicate(cls, digest: str) -> bool:
+        """Returns True if a message with the same digest has already been stored"""
+        return cls.objects.filter(message_digest=digest).exists()
+
     def link_to_zigbee_device(self) -> None:
         """Attempts to match object to a ZigbeeDevice, if matched the zigbee_device field is set
         and the object is saved. IMPORTANT - this method is called from obj.save() - do NOT call
@@ -233,12 +279,19 @@ class ZigbeeMessage(BaseAbstractModel):
 
         Matching messages to devices is conducted by by matching MQTT topic to user device
          device_identifier. If no match is found, an attempt is made using the device
-         friendly_name."""
+         friendly_name.
+
+        When the device topic index has been warmed (MQTT ingest process) the match is a dict
+         lookup rather than a query, and zigbee_device is set to the indexed device."""
         try:
             topic_beginning = self.topic.rfind("/") + 1
             usable_topic = self.topic[topic_beginning:].strip()
             usable_topic = str(usable_topic).lower()
 
+            if device_topic_index.is_warm:
+                self.zigbee_device = device_topic_index.resolve_device(usable_topic)
+                return
+
             zigbee_device = ZigbeeDevice.objects.filter(
                 Q(ieee_address=usable_topic) | Q(friendly_name=usable_topic)
             ).first()
@@ -250,11 +303,21 @@ class ZigbeeMessage(BaseAbstractModel):
     def __str__(self):
         return str(self.topic)
 
-    def save(self, *args, check_triggers=None, last_message=None, **kwargs) -> None:
+    def save(
+        self,
+        *args,
+        check_triggers=None,
+        last_message=None,
+        parsed_message=None,
+        **kwargs,
+    ) -> None:
         """
         Parameters:
             check_triggers - when True will perform event trigger checks & invoke event
              response(s) if necessary
+            last_message - previous message for the device (dict or raw JSON), used to skip
+             triggers when the field value has not changed
+            parsed_message - raw_message already parsed by the caller, avoids parsing it again
 
         Provides additional logic for:
         1) Linking ZigbeeMessage (self) to ZigbeeDevice via link_to_zigbee_device()
@@ -262,17 +325,31 @@ class ZigbeeMessage(BaseAbstractModel):
         """
         # methods modifying object that need to be performed pre-save
         self.link_to_zigbee_device()
+
+        if not self.message_digest:
+            self.message_digest = self.get_digest(
+                topic=self.topic,
+                payload=self.raw_message if parsed_message is None else parsed_message,
+            )
+
         super().save(*args, **kwargs)
 
         # methods accessing object attributes that need to be perform post-save
         if check_triggers:
             logger.info("%s - Checking event triggers...", __name__)
-            self.check_event_triggers(last_message=last_message)
+            self.check_event_triggers(
+                last_message=last_message, parsed_message=parsed_message
+            )
             logger.info("%s - End of event trigger checks.", __name__)
 
-    def check_event_triggers(self, last_message=None) -> None:
+    def check_event_triggers(self, last_message=None, parsed_message=None) -> None:
         """Checks if linked device is attached to event trigger - if so, values check and event
-        triggered if necessary"""
+        triggered if necessary.
+
+        The current and last messages are each parsed at most once here (not at all when the
+        caller passes dicts) and then shared by every trigger. Triggers come from the event
+        trigger index, grouped by field, so only triggers for fields in the message are
+        evaluated."""
 
         self.user_device = getattr(self.zigbee_device, "user_device", False)
 
@@ -281,8 +358,8 @@ class ZigbeeMessage(BaseAbstractModel):
 
         self.user = getattr(self.user_device, "user", None)
 
-        # only returns enabled triggers
-        triggers = self.user_device.get_event_triggers()
+        # only returns enabled triggers (of enabled events)
+        triggers = event_trigger_index.get_triggers(self.user_device.pk)
 
         if not triggers:
             logger.info(
@@ -292,29 +369,37 @@ class ZigbeeMessage(BaseAbstractModel):
             return
 
         try:
-            parsed_message = json.loads(self.raw_message)
-        except JSONDecodeError as ex:
+            if parsed_message is None:
+                parsed_message = codec.loads(self.raw_message)
+            if isinstance(last_message, (str, bytes)) and last_message:
+                last_message = codec.loads(last_message)
+        except codec.DecodeError as ex:
             logger.info("%s - ZigbeeMessage - check_event_triggers - %s", __name__, ex)
             return
 
+        if isinstance(parsed_message, list) and len(parsed_message) > 0:
+            parsed_message = parsed_message[0]
+
+        if not isinstance(parsed_message, dict):
+            return
+
         processed_notifications = []
-        for trigger in triggers:
-            if not trigger.event.is_enabled or not trigger.is_enabled:
-                # skip disabled events and triggers
-                continue
-
-            # check to see if event notifications have already been processed
-            process_notifications = trigger.event.uuid not in processed_notifications
-
-            _, notifications_invoked = self.process_event_trigger(
-                parsed_message=parsed_message,
-                trigger=trigger,
-                cached_message=last_message,
-                process_notifications=process_notifications,
-            )
+        for field in parsed_message:
+            for trigger in triggers.get(field, ()):
+                # check to see if event notifications have already been processed
+                process_notifications = (
+                    trigger.event.uuid not in processed_notifications
+                )
+
+                _, notifications_invoked = self.process_event_trigger(
+                    parsed_message=parsed_message,
+                    trigger=trigger,
+                    cached_message=last_message,
+                    process_notifications=process_notifications,
+                )
 
-            if notifications_invoked:
-                processed_notifications.append(trigger.event.uuid)
+                if notifications_invoked:
+                    processed_notifications.append(trigger.event.uuid)
 
     def process_event_trigger(
         self,
@@ -323,9 +408,10 @@ class ZigbeeMessage(BaseAbstractModel):
         cached_message=None,
         process_notifications=True,
     ) -> Tuple[bool, bool]:
-        """Processes event triggers and invokes notifications/event responses if criteria met.
+        """Processes event triggers and queues event responses/notifications if criteria met.
+        They are run by the handle_event_trigger task, not on the calling (ingest) thread.
 
-        Returns a tuple = response_invoked, notifications_invoked"""
+        Returns a tuple = response_invoked, notifications_invoked (i.e. queued)"""
         logger.info("%s - process_event_trigger - start", __name__)
 
         response_invoked = False
@@ -354,31 +440,43 @@ class ZigbeeMessage(BaseAbstractModel):
                 f"Device value={device_value}"
             )
 
-            trigger_log = self.invoke_event_response(triggered_by=trigger)
-            response_invoked = trigger_log is not None
+            send_notifications = bool(
+                process_notifications and event.send_notification
+            )
+
+            # responses and notifications are run by a celery worker - the ingest process only
+            # enqueues them (see tasks.py)
+            from .tasks import handle_event_trigger
 
-            if process_notifications and event.send_notification:
-                notifications_invoked = True
-                self.invoke_notifications(
-                    topic=event.notification_topic,
-                    message=message,
-                    triggered_by=trigger,
-                    trigger_log=trigger_log,
+            try:
+                handle_event_trigger.delay(
+                    message_id=self.pk,
+                    trigger_id=trigger.pk,
+                    notification_message=message,
+                    send_notifications=send_notifications,
+                )
+                response_invoked = True
+                notifications_invoked = send_notifications
+            except Exception as ex:
+                logger.error(
+                    "%s - could not enqueue event trigger %s - %s",
+                    __name__,
+                    trigger,
+                    ex,
                 )
 
         logger.info("process_event_trigger end")
         return response_invoked, notifications_invoked
 
     def device_value_changed(
-        self, cached_message: str, field: str, device_value: str
+        self, cached_message: Union[dict, None], field: str, device_value: str
     ) -> bool:
-        """Compare device value to cached value.
+        """Compare device value to the value in the (parsed) cached message.
 
         Return true if values are different - i.e. have changed."""
         # only check if a previous message exists
-        if not cached_message:
+        if not isinstance(cached_message, dict):
             return True
-        cached_message = json.loads(cached_message)
         cached_value = str(cached_message.get(field, None)).lower()
 
         if device_value == cached_value:
@@ -394,10 +492,15 @@ class ZigbeeMessage(BaseAbstractModel):
 
     def invoke_event_response(
         self, triggered_by: "EventTrigger"
-    ) -> Union["EventTriggerLog", None]:
-        """Invokes all EventResponse objects for a triggered Event.
-
-        An event response essentially maps an event to a device state."""
+    ) -> Union[List[dict], None]:
+        """Publishes the commands of all EventResponse objects for a triggered Event - returns
+        the commands published, or None if the event's responses could not be invoked.
+
+        An event response essentially maps an event to a device state. The commands for an
+        event (its response plan) come from the event trigger index, which loads responses,
+        device states and devices in a fixed number of queries. Nothing is written here - a
+        publish error (MQTTPublishError) is raised, so the caller can retry, and the published
+        commands are recorded with log_event_response()."""
         if not self.user:
             logger.info("invoke_event_response: no user object - cannot proceed")
             return
@@ -410,59 +513,33 @@ class ZigbeeMessage(BaseAbstractModel):
             )
             return
 
-        event_responses = getattr(event, "eventresponse_set", None)
-        if not event_responses:
-            logger.error(
-                "invoke_event_response: no event responses attached to event - %s",
+        # commands are resolved once per event and held by the trigger index
+        response_plan = event_trigger_index.get_response_plan(event.pk)
+        if response_plan is None:
+            logger.info(
+                "invoke_event_response: event responses could not be resolved - %s",
                 event,
             )
             return
 
-        enabled_event_responses = event_responses.filter(is_enabled=True)
-
-        cmd_list = []
-
-        for response in enabled_event_responses:
-            # invoke device states
-            state = getattr(response, "device_state")
-            cmd = getattr(state, "command")
-            val = getattr(state, "command_value")
-            device = getattr(state, "content_object")
-
-            if not cmd or not val:
-                logger.info(
-                    "invoke_event_response: no command and/or value - cmd: %s - val: %s",
-                    cmd,
-                    val,
-                )
-                return
-
-            cmd_dict = {
-                "mqtt_topic": device.friendly_name,
-                "command": cmd,
-                "command_value": val,
-            }
-            cmd_list.append(cmd_dict)
+        cmd_list = [command._asdict() for command in response_plan]
 
         # cmd list is built and sent to MQTT broker
-        try:
-            logger.info(
-                "%s - publishing messages to MQTT broker - %s", __name__, cmd_list
-            )
-            send_messages(cmd_list)
-
-            trigger_log = apps.get_model("events", "EventTriggerLog")
-
-            log = trigger_log.objects.create(
-                event=event, triggered_by=triggered_by, response_command=cmd_list
-            )
-
-            return log
-        except Exception:
-            logger.error(
-                "%s - there was an error publishing to MQTT broker - operation failed",
-                __name__,
-            )
+        logger.info("%s - publishing messages to MQTT broker - %s", __name__, cmd_list)
+        send_messages(cmd_list)
+        return cmd_list
+
+    def log_event_response(
+        self, triggered_by: "EventTrigger", commands: List[dict]
+    ) -> "EventTriggerLog":
+        """Record the commands published for a triggered Event"""
+        trigger_log = apps.get_model("events", "EventTriggerLog")
+
+        return trigger_log.objects.create(
+            event=triggered_by.event,
+            triggered_by=triggered_by,
+            response_command=commands,
+        )
 
     def invoke_notifications(
         self,
@@ -471,9 +548,12 @@ class ZigbeeMessage(BaseAbstractModel):
         triggered_by: "EventTrigger",
         trigger_log: "EventTriggerLog" = None,
     ) -> int:
-        """Invoke all of user's enabled notifications.
+        """Invoke all of user's enabled notifications - they are queued in the notification
+        outbox, which is sent by the notification worker (see notifications/outbox.py). Call
+        in the same transaction as the trigger log, so notifications are only queued for
+        triggers that were recorded.
 
-        Returns the number of notifications sent"""
+        Returns the number of notifications queued by this call"""
         notifications_sent = 0
 
         if not self.user:
@@ -489,32 +569,217 @@ class ZigbeeMessage(BaseAbstractModel):
 
         logger.info("Invoking notifications...")
 
-        for notification in user_notifications:
-            notification_data = {
-                "topic": topic,
-                "message": message,
-                "triggered_by": triggered_by,
-                "notification_obj": notification,
-                "trigger_log": trigger_log,
-            }
-
-            if notification.notification_medium == NotificationMedium.PUSHBULLET:
-                notification.pushbulletnotification.send(**notification_data)
-            elif notification.notification_medium == NotificationMedium.EMAIL:
-                notification.emailnotification.send(**notification_data)
-            notifications_sent += 1
+        # a medium is only queued once per message and trigger, so a redelivered task does not
+        # notify twice
+        idempotency_key = f"{self.pk}:{getattr(triggered_by, 'pk', None)}"
+        outbox = [
+            NotificationOutbox(
+                medium=notification,
+                topic=topic,
+                message=message,
+                triggered_by=str(triggered_by),
+                trigger_log=trigger_log,
+                event_id=getattr(triggered_by, "event_id", None),
+                idempotency_key=idempotency_key,
+            )
+            for notification in user_notifications
+        ]
+        notifications_sent = NotificationOutbox.objects.enqueue(outbox)
 
         logger.info("Notification invocation complete.")
 
         return notifications_sent
 
 
+class ZigbeeLogQuerySet(models.QuerySet):
+    """Custom queries"""
+
+    def get_series(self, field: str) -> models.QuerySet:
+        """Return (timestamp, value) rows for the numeric values of field, oldest first - the
+        timestamp is when the message was received, in milliseconds since the epoch"""
+        return (
+            self.filter(metadata_type=field, numeric_value__isnull=False)
+            .annotate(
+                timestamp=Extract(
+                    "received_at",
+                    "epoch",
+                    tzinfo=datetime.timezone.utc,
+                    output_field=models.FloatField(),
+                )
+                * 1000
+            )
+            .order_by("received_at")
+            .values_list("timestamp", "numeric_value")
+        )
+
+
+class ZigbeeLogManager(models.Manager.from_queryset(ZigbeeLogQuerySet)):
+    """Custom manager"""
+
+
 class ZigbeeLog(BaseAbstractModel):
-    """Captures metadata from MQTT subscription messages"""
+    """Captures metadata from MQTT subscription messages. Numbers are also stored in
+    numeric_value, and the message's device and received time are copied to the log, so time
+    series are read from one index without casting the JSON values or joining the messages"""
+
+    objects = ZigbeeLogManager()
 
     broker_message = models.ForeignKey(ZigbeeMessage, on_delete=models.CASCADE)
     metadata_type = models.CharField(max_length=100)
     metadata_value = models.JSONField(max_length=100)
+    numeric_value = models.FloatField(null=True, blank=True)
+    # copies of broker_message.zigbee_device/created_at - logs are deleted with their message,
+    # so the device's logs are not collected (or indexed) through this key
+    zigbee_device = models.ForeignKey(
+        ZigbeeDevice,
+        on_delete=models.DO_NOTHING,
+        null=True,
+        blank=True,
+        db_index=False,
+        related_name="+",
+    )
+    received_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta(BaseAbstractModel.Meta):
+        indexes = [
+            models.Index(fields=["created_at", "id"], name="zigbeelog_keyset"),
+            # time series of a device's numeric field (see ZigbeeLogQuerySet.get_series)
+            models.Index(
+                fields=["zigbee_device", "metadata_type", "received_at"],
+                include=["numeric_value"],
+                condition=Q(numeric_value__isnull=False),
+                name="zigbeelog_series",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.metadata_type}={self.metadata_value}"
+
+    @staticmethod
+    def get_numeric_value(value) -> Union[float, None]:
+        """Return value as a float if it is a (finite) number - booleans are not numbers"""
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return None
+        try:
+            value = float(value)
+        except OverflowError:
+            return None
+        return value if math.isfinite(value) else None
+
+
+class DeviceLatestStateQuerySet(models.QuerySet):
+    """Custom queries"""
+
+    def upsert(self, message: ZigbeeMessage, payload: dict) -> None:
+        """Merge the fields in payload into the message's device state with one statement.
+        Fields not in the payload keep their last value. A message older than the state (e.g.
+        processed late by another ingest worker) does not overwrite it."""
+        if not message.zigbee_device_id or not isinstance(payload, dict):
+            return
+
+        received_at = message.created_at
+        state = {
+            field: {"value": value, "updated_at": received_at.isoformat()}
+            for field, value in payload.items()
+            if len(str(value)) > 0
+        }
+        table = connection.ops.quote_name(self.model._meta.db_table)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {table}
+                    (zigbee_device_id, state, last_message_id, last_message_at)
+                VALUES (%s, %s::jsonb, %s, %s)
+                ON CONFLICT (zigbee_device_id) DO UPDATE SET
+                    state = {table}.state || EXCLUDED.state,
+                    last_message_id = EXCLUDED.last_message_id,
+                    last_message_at = EXCLUDED.last_message_at
+                WHERE {table}.last_message_at <= EXCLUDED.last_message_at
+                """,
+                [message.zigbee_device_id, codec.dumps(state), message.pk, received_at],
+            )
+
+
+class DeviceLatestStateManager(
+    models.Manager.from_queryset(DeviceLatestStateQuerySet)
+):
+    """Custom manager"""
+
+
+class DeviceLatestState(models.Model):
+    """The newest value of each field reported by a zigbee device - one row per device, kept
+    up to date by the MQTT ingest process (see DeviceLatestState.objects.upsert()), so that
+    the current state is read without scanning the device's message history.
+
+    state holds {field: {"value": ..., "updated_at": ISO timestamp}}"""
+
+    objects = DeviceLatestStateManager()
+
+    zigbee_device = models.OneToOneField(
+        ZigbeeDevice,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="latest_state",
+    )
+    state = models.JSONField(default=dict)
+    last_message = models.ForeignKey(
+        ZigbeeMessage, on_delete=models.SET_NULL, null=True, blank=True
+    )
+    last_message_at = models.DateTimeField()
+
+    def __str__(self) -> str:
+        return f"{self.zigbee_device} @ {self.last_message_at}"
+
+    def get_fields(self) -> List[Tuple[str, object, str]]:
+        """Return (field, value, updated at) for each field, ordered by field name"""
+        return [
+            (field, data.get("value"), data.get("updated_at"))
+            for field, data in sorted(self.state.items())
+        ]
+
+
+class FieldType(models.TextChoices):
+    """Type of the values reported for a device field"""
+
+    BOOLEAN = "boolean", _("Boolean")
+    NUMBER = "number", _("Number")
+    TEXT = "text", _("Text")
+    OBJECT = "object", _("Object")
+
+
+class ZigbeeDeviceField(models.Model):
+    """A field reported by a zigbee device (e.g. temperature) - the catalog is added to by the
+    MQTT ingest process when a device reports a field for the first time (see fields.py), so
+    the fields of a device are listed without scanning its logs"""
+
+    zigbee_device = models.ForeignKey(
+        ZigbeeDevice, on_delete=models.CASCADE, related_name="fields"
+    )
+    name = models.CharField(max_length=100)
+    value_type = models.CharField(
+        max_length=10, choices=FieldType.choices, default=FieldType.TEXT
+    )
+    first_seen_at = models.DateTimeField()
+    last_seen_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(
+                fields=["zigbee_device", "name"], name="zigbee_device_field"
+            )
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.zigbee_device} - {self.name}"
+
+    @staticmethod
+    def get_value_type(value) -> str:
+        """Return the FieldType of value"""
+        if isinstance(value, bool):
+            return FieldType.BOOLEAN
+        if isinstance(value, (int, float)):
+            return FieldType.NUMBER
+        if isinstance(value, (dict, list)):
+            return FieldType.OBJECT
+        return FieldType.TEXT
@@ -0,0 +1,58 @@
+"""Records when zigbee devices were last heard from.
+
+Writing ZigbeeDevice.last_seen_at for every message would add an UPDATE per message for chatty
+sensors, so the MQTT ingest process writes it at most once per interval seconds for each
+device. Pages showing when a device last communicated read the column rather than the
+device's message history."""
+import datetime
+import logging
+import threading
+import time
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+
+class LastSeenRecorder:
+    """Throttled writer of ZigbeeDevice.last_seen_at - see module docstring"""
+
+    def __init__(self, interval: float = 60) -> None:
+        self.interval = float(interval)
+
+        # device id -> time.monotonic() of the last write
+        self._written: Dict[int, float] = {}
+        self._lock = threading.Lock()
+
+    def record(self, zigbee_device_id: int, seen_at: datetime.datetime) -> bool:
+        """Update the device's last_seen_at unless it was updated within the interval -
+        returns True if the device was updated"""
+        if not zigbee_device_id:
+            return False
+
+        now = time.monotonic()
+        with self._lock:
+            written_at = self._written.get(zigbee_device_id)
+            if written_at is not None and now - written_at < self.interval:
+                return False
+            self._written[zigbee_device_id] = now
+
+        # pylint: disable=import-outside-toplevel
+        from .models import ZigbeeDevice
+
+        try:
+            ZigbeeDevice.objects.filter(pk=zigbee_device_id).update(
+                last_seen_at=seen_at
+            )
+        except Exception as ex:  # pylint: disable=broad-except
+            logger.error(
+                "Could not update last_seen_at - %s - %s", zigbee_device_id, ex
+            )
+            with self._lock:
+                self._written.pop(zigbee_device_id, None)
+            return False
+        return True
+
+    def clear(self) -> None:
+        """Forget when devices were written - the next message for each device is written"""
+        with self._lock:
+            self._written = {}
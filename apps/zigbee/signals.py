@@ -0,0 +1,30 @@
+"""Keeps in-process indexes current when zigbee models change. Indexes are updated once the
+change is committed - otherwise another process could rebuild from the old rows on seeing the
+new generation, and keep the stale index"""
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .index import device_topic_index
+from .models import ZigbeeDevice
+
+
+@receiver(post_save, sender=ZigbeeDevice)
+def zigbee_device_saved(sender, instance, **kwargs):
+    """New or renamed devices are added to the topic index"""
+    transaction.on_commit(partial(device_topic_index.update, instance))
+
+
+@receiver(post_delete, sender=ZigbeeDevice)
+def zigbee_device_deleted(sender, instance, **kwargs):
+    """Deleted devices are removed from the topic index"""
+    transaction.on_commit(partial(device_topic_index.remove, instance.pk))
+
+
+@receiver(post_delete, sender="devices.Device")
+def user_device_deleted(sender, instance, **kwargs):
+    """Zigbee devices are unlinked from a deleted user device by an UPDATE (SET_NULL), which
+    sends no signals - the topic index is rebuilt so it does not keep the old link"""
+    transaction.on_commit(device_topic_index.invalidate)
@@ -0,0 +1,117 @@
+"""Celery tasks run in response to zigbee messages. Tasks are idempotent - the steps a task has
+completed are recorded (see utils.TaskProgress), so a task redelivered by the broker (tasks are
+acknowledged late) or retried does not publish commands or send notifications again, and
+resumes with the steps that were not done. A task whose commands could not be published, or
+whose results could not be written, is retried with backoff."""
+import logging
+
+from django.db import DatabaseError, transaction
+
+from celery import shared_task
+
+from smarthub.settings import EVENT_RESPONSE_MAX_RETRIES, TASK_CLAIM_TTL
+
+from ..events.models import EventTrigger
+from ..mqtt.publish import MQTTPublishError
+from ..utils import TaskInProgress, TaskProgress
+from .models import ZigbeeMessage
+
+logger = logging.getLogger(__name__)
+
+# steps of handle_event_trigger
+PUBLISHED = "published"
+RECORDED = "recorded"
+
+
+@shared_task(
+    bind=True,
+    ignore_result=True,
+    autoretry_for=(MQTTPublishError, DatabaseError),
+    retry_backoff=True,
+    max_retries=EVENT_RESPONSE_MAX_RETRIES,
+)
+def handle_event_trigger(
+    self,
+    message_id: int,
+    trigger_id: int,
+    notification_message: str,
+    send_notifications: bool,
+) -> None:
+    """Invoke the event responses (and notifications) for a trigger matched by a message"""
+    try:
+        with TaskProgress(f"event-trigger:{message_id}:{trigger_id}") as progress:
+            run_event_trigger(
+                progress,
+                message_id,
+                trigger_id,
+                notification_message,
+                send_notifications,
+            )
+    except TaskInProgress as ex:
+        # another run is handling it - or its worker died, and the claim has to expire
+        raise self.retry(exc=ex, countdown=TASK_CLAIM_TTL)
+
+
+def run_event_trigger(
+    progress: TaskProgress,
+    message_id: int,
+    trigger_id: int,
+    notification_message: str,
+    send_notifications: bool,
+) -> None:
+    """handle_event_trigger - skipping the steps recorded in progress"""
+    if progress.is_done(RECORDED):
+        logger.info(
+            "handle_event_trigger - already handled (message=%s, trigger=%s)",
+            message_id,
+            trigger_id,
+        )
+        return
+
+    message = (
+        ZigbeeMessage.objects.select_related("zigbee_device__device__user")
+        .filter(pk=message_id)
+        .first()
+    )
+    trigger = (
+        EventTrigger.objects.select_related("event", "device")
+        .filter(pk=trigger_id)
+        .first()
+    )
+    if not message or not trigger:
+        logger.info(
+            "handle_event_trigger - message or trigger no longer exists "
+            "(message=%s, trigger=%s)",
+            message_id,
+            trigger_id,
+        )
+        return
+
+    message.user_device = getattr(message.zigbee_device, "user_device", None)
+    message.user = getattr(message.user_device, "user", None)
+
+    # commands are published before anything is written, so no transaction is held open
+    # while waiting for the broker. Once published they are not published again - a retry
+    # (e.g. after a database error) only writes the trigger log and notifications
+    if progress.is_done(PUBLISHED):
+        commands = progress.get(PUBLISHED)
+    else:
+        commands = message.invoke_event_response(triggered_by=trigger)
+        progress.record(PUBLISHED, commands)
+
+    # notifications are queued in the same transaction as the trigger log
+    with transaction.atomic():
+        trigger_log = None
+        if commands is not None:
+            trigger_log = message.log_event_response(
+                triggered_by=trigger, commands=commands
+            )
+
+        if send_notifications:
+            message.invoke_notifications(
+                topic=trigger.event.notification_topic,
+                message=notification_message,
+                triggered_by=trigger,
+                trigger_log=trigger_log,
+            )
+    progress.record(RECORDED)
@@ -1,3 +1,5 @@
+import datetime
+
 from django.db.models.signals import post_save
 
 import factory
@@ -66,3 +68,19 @@ class ZigbeeLogFactory(factory.django.DjangoModelFactory):
             "0",
         ]
     )
+    numeric_value = factory.LazyAttribute(
+        lambda log: models.ZigbeeLog.get_numeric_value(log.metadata_value)
+    )
+    zigbee_device = factory.LazyAttribute(lambda log: log.broker_message.zigbee_device)
+    received_at = factory.LazyAttribute(lambda log: log.broker_message.created_at)
+
+
+class ZigbeeDeviceFieldFactory(factory.django.DjangoModelFactory):
+    class Meta:
+        model = models.ZigbeeDeviceField
+
+    zigbee_device = factory.SubFactory(ZigbeeDeviceFactory)
+    name = fuzzy.FuzzyChoice(["linkquality", "state", "temperature", "humidity"])
+    value_type = models.FieldType.TEXT
+    first_seen_at = factory.Faker("date_time", tzinfo=datetime.timezone.utc)
+    last_seen_at = factory.SelfAttribute("first_seen_at")
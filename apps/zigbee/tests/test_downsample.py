@@ -0,0 +1,76 @@
+import math
+from unittest import mock, skipUnless
+
+from django.test import SimpleTestCase
+
+from .. import downsample
+
+
+class TestDownsample(SimpleTestCase):
+    def setUp(self) -> None:
+        self.times = [float(second * 1000) for second in range(2000)]
+        self.values = [
+            math.sin(second / 50) + (5 if second == 1234 else 0)
+            for second in range(2000)
+        ]
+
+    def test_short_series_are_returned_as_they_are(self):
+        points = downsample.downsample(self.times[:10], self.values[:10], 10)
+
+        self.assertEqual(points, list(zip(self.times[:10], self.values[:10])))
+
+    def test_series_is_reduced_to_threshold_points(self):
+        for method in downsample.METHODS:
+            with self.subTest(method=method):
+                points = downsample.downsample(self.times, self.values, 100, method)
+
+                self.assertLessEqual(len(points), 100)
+                self.assertEqual(points[0], (self.times[0], self.values[0]))
+                self.assertEqual(points[-1], (self.times[-1], self.values[-1]))
+                self.assertEqual(points, sorted(points))
+                # the spike is kept
+                self.assertIn((self.times[1234], self.values[1234]), points)
+
+    def test_lttb_returns_exactly_threshold_points(self):
+        points = downsample.downsample(self.times, self.values, 100, "lttb")
+
+        self.assertEqual(len(points), 100)
+
+    @skipUnless(downsample.numpy, "numpy is not installed")
+    def test_numpy_and_python_implementations_match(self):
+        for method in downsample.METHODS:
+            for threshold in (4, 7, 100, 1999):
+                with self.subTest(method=method, threshold=threshold):
+                    self.assertEqual(
+                        downsample.downsample(
+                            self.times, self.values, threshold, method
+                        ),
+                        downsample.downsample(
+                            self.times, self.values, threshold, method, False
+                        ),
+                    )
+
+    def test_read_series_without_numpy(self):
+        rows = iter([(1000.0, 1.5), (2000.0, 2.5)])
+
+        with mock.patch.object(downsample, "numpy", None):
+            times, values = downsample.read_series(rows)
+
+        self.assertEqual(list(times), [1000.0, 2000.0])
+        self.assertEqual(list(values), [1.5, 2.5])
+
+    @skipUnless(downsample.numpy, "numpy is not installed")
+    def test_read_series_with_numpy(self):
+        times, values = downsample.read_series(iter([(1000.0, 1.5), (2000.0, 2.5)]))
+
+        self.assertEqual(times.tolist(), [1000.0, 2000.0])
+        self.assertEqual(values.tolist(), [1.5, 2.5])
+
+        times, values = downsample.read_series(iter([]))
+        self.assertEqual(len(times), 0)
+
+    def test_invalid_options_raise_value_error(self):
+        with self.assertRaises(ValueError):
+            downsample.downsample(self.times, self.values, 100, "average")
+        with self.assertRaises(ValueError):
+            downsample.downsample(self.times, self.values, 3)
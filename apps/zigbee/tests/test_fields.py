@@ -0,0 +1,79 @@
+import datetime
+
+from django.test import TestCase
+from django.utils import timezone
+
+from ..fields import FieldCatalog
+from ..models import FieldType, ZigbeeDeviceField
+from .factories import ZigbeeDeviceFactory
+
+
+class TestFieldCatalog(TestCase):
+    def setUp(self) -> None:
+        self.zb_device = ZigbeeDeviceFactory()
+        self.catalog = FieldCatalog(interval=60)
+        self.payload = {"temperature": 21.5, "state": "ON", "battery_low": False}
+
+    def get_fields(self):
+        return {
+            field.name: field
+            for field in ZigbeeDeviceField.objects.filter(zigbee_device=self.zb_device)
+        }
+
+    def test_new_fields_are_catalogued_with_their_type(self):
+        seen_at = timezone.now()
+        total = self.catalog.record(self.zb_device.pk, self.payload, seen_at)
+
+        self.assertEqual(total, 3)
+
+        fields = self.get_fields()
+        self.assertEqual(fields["temperature"].value_type, FieldType.NUMBER)
+        self.assertEqual(fields["state"].value_type, FieldType.TEXT)
+        self.assertEqual(fields["battery_low"].value_type, FieldType.BOOLEAN)
+        self.assertEqual(fields["state"].first_seen_at, seen_at)
+
+    def test_known_fields_are_not_written_again(self):
+        self.catalog.record(self.zb_device.pk, self.payload, timezone.now())
+
+        with self.assertNumQueries(0):
+            self.catalog.record(self.zb_device.pk, self.payload, timezone.now())
+
+        # only the new field is written
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                self.catalog.record(
+                    self.zb_device.pk, {"state": "OFF", "humidity": 60}, timezone.now()
+                ),
+                1,
+            )
+        self.assertIn("humidity", self.get_fields())
+
+    def test_fields_catalogued_by_another_process_are_kept(self):
+        first_seen = timezone.now() - datetime.timedelta(days=1)
+        FieldCatalog().record(self.zb_device.pk, {"state": "ON"}, first_seen)
+
+        self.catalog.record(self.zb_device.pk, self.payload, timezone.now())
+
+        fields = self.get_fields()
+        self.assertEqual(len(fields), 3)
+        self.assertEqual(fields["state"].first_seen_at, first_seen)
+
+    def test_last_seen_at_is_updated_once_per_interval(self):
+        first_seen = timezone.now()
+        self.catalog.record(self.zb_device.pk, self.payload, first_seen)
+        self.catalog.record(
+            self.zb_device.pk, self.payload, first_seen + datetime.timedelta(seconds=1)
+        )
+
+        self.assertEqual(self.get_fields()["state"].last_seen_at, first_seen)
+
+        self.catalog.interval = 0
+        last_seen = first_seen + datetime.timedelta(seconds=2)
+        self.catalog.record(self.zb_device.pk, self.payload, last_seen)
+
+        self.assertEqual(self.get_fields()["state"].last_seen_at, last_seen)
+        self.assertEqual(self.get_fields()["state"].first_seen_at, first_seen)
+
+    def test_messages_without_a_device_are_ignored(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(self.catalog.record(None, self.payload, timezone.now()), 0)
@@ -0,0 +1,93 @@
+from django.core.cache import cache
+from django.test import TestCase
+
+from ...devices.tests.factories import DeviceFactory
+from ..index import DeviceTopicIndex, device_topic_index
+from ..models import ZigbeeDevice, ZigbeeMessage
+
+
+class TestDeviceTopicIndex(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.device = ZigbeeDevice.objects.create(
+            ieee_address="0x00158d0001", friendly_name="Kitchen Sensor"
+        )
+        self.index = DeviceTopicIndex(check_interval=0).warm()
+
+    def tearDown(self):
+        device_topic_index.clear()
+
+    def test_device_resolved_by_ieee_address_and_friendly_name(self):
+        self.assertEqual(self.index.resolve("0x00158d0001"), self.device.pk)
+        self.assertEqual(self.index.resolve("kitchen sensor"), self.device.pk)
+        self.assertIsNone(self.index.resolve("unknown"))
+
+    def test_resolve_does_not_query_db(self):
+        with self.assertNumQueries(0):
+            self.index.resolve("kitchen sensor")
+
+    def test_most_recently_created_device_wins(self):
+        newer_device = ZigbeeDevice.objects.create(friendly_name="0x00158d0001")
+        self.index.warm()
+
+        self.assertEqual(self.index.resolve("0x00158d0001"), newer_device.pk)
+
+    def test_renamed_device_is_updated(self):
+        self.device.friendly_name = "pantry sensor"
+        self.device.save()
+        self.index.update(self.device)
+
+        self.assertIsNone(self.index.resolve("kitchen sensor"))
+        self.assertEqual(self.index.resolve("pantry sensor"), self.device.pk)
+
+    def test_deleted_device_is_removed(self):
+        self.index.remove(self.device.pk)
+
+        self.assertIsNone(self.index.resolve("kitchen sensor"))
+
+    def test_index_rebuilt_when_changed_by_another_process(self):
+        # device saved without signals (i.e. by another process) - only the generation changes
+        ZigbeeDevice.objects.filter(pk=self.device.pk).update(friendly_name="hallway")
+        self.index.generation.bump()
+
+        self.assertEqual(self.index.resolve("hallway"), self.device.pk)
+
+    def test_signals_keep_shared_index_current(self):
+        device_topic_index.warm()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            device = ZigbeeDevice.objects.create(friendly_name="new device")
+            # the index is not updated until the change is committed
+            self.assertIsNone(device_topic_index.resolve("new device"))
+        self.assertEqual(device_topic_index.resolve("new device"), device.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            device.delete()
+        self.assertIsNone(device_topic_index.resolve("new device"))
+
+    def test_zigbee_message_linked_without_query_when_index_warm(self):
+        device_topic_index.warm()
+        message = ZigbeeMessage(topic="zigbee2mqtt/kitchen sensor", raw_message="{}")
+
+        with self.assertNumQueries(0):
+            message.link_to_zigbee_device()
+            self.assertEqual(message.zigbee_device, self.device)
+            self.assertEqual(message.zigbee_device.friendly_name, "kitchen sensor")
+
+        self.assertEqual(message.zigbee_device_id, self.device.pk)
+
+    def test_resolved_devices_are_not_shared(self):
+        device = self.index.resolve_device("kitchen sensor")
+
+        self.assertEqual(device, self.device)
+        self.assertIsNot(device, self.index.resolve_device("kitchen sensor"))
+        self.assertIsNone(self.index.resolve_device("unknown"))
+
+    def test_deleted_user_device_invalidates_index(self):
+        generation = self.index.generation.current()
+        user_device = DeviceFactory()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            user_device.delete()
+
+        self.assertEqual(self.index.generation.current(), generation + 1)
@@ -1,3 +1,4 @@
+import datetime
 import json
 from unittest import mock
 
@@ -11,14 +12,16 @@ from ...events.tests.factories import (
     EventResponseFactory,
     EventTriggerFactory,
 )
+from ...mqtt import codec
 from ...notifications.models import NotificationMedium
+from ...notifications.outbox import OutboxWorker
 from ...notifications.tests.factories import (
     EmailNotificationFactory,
     NotificationSettingFactory,
     PushbulletNotificationFactory,
 )
 from ...users.tests.factories import UserFactory
-from ..models import ZigbeeDevice, ZigbeeMessage
+from ..models import DeviceLatestState, ZigbeeDevice, ZigbeeMessage
 from .factories import ZigbeeDeviceFactory, ZigbeeLogFactory, ZigbeeMessageFactory
 
 
@@ -160,11 +163,17 @@ class TestZigbeeDevice(TestCase):
 
 class TestZigbeeMessage(TestCase):
     def setUp(self) -> None:
+        # triggers are only evaluated for fields in the message - include every field that
+        # EventTriggerFactory can use
         raw_msg = json.dumps(
             {
-                "something-field1": "something-value",
-                "something-field2": "something-value",
-                "something-field3": "something-value",
+                "linkquality": "something-value",
+                "state": "something-value",
+                "temperature": "something-value",
+                "humidity": "something-value",
+                "battery_low": "something-value",
+                "battery": "something-value",
+                "occupancy": "something-value",
             }
         )
 
@@ -319,6 +328,48 @@ class TestZigbeeMessage(TestCase):
 
         self.assertEqual(total_trigger_calls, 0)
 
+    @mock.patch(
+        "apps.zigbee.models.ZigbeeMessage.process_event_trigger",
+        return_value=(False, False),
+    )
+    def test_only_triggers_for_fields_in_message_are_processed(self, mock_value):
+        EventTriggerFactory(
+            event=self.event,
+            device=self.device,
+            is_enabled=True,
+            metadata_field="state",
+        )
+        EventTriggerFactory(
+            event=self.event,
+            device=self.device,
+            is_enabled=True,
+            metadata_field="not-in-message",
+        )
+
+        self.zb_msg.check_event_triggers()
+
+        self.assertEqual(mock_value.call_count, 1)
+        self.assertEqual(mock_value.call_args.kwargs["trigger"].metadata_field, "state")
+
+    def test_device_value_changed_compares_against_parsed_message(self):
+        cached_message = {"state": "ON"}
+
+        self.assertFalse(
+            self.zb_msg.device_value_changed(
+                cached_message=cached_message, field="state", device_value="on"
+            )
+        )
+        self.assertTrue(
+            self.zb_msg.device_value_changed(
+                cached_message=cached_message, field="state", device_value="off"
+            )
+        )
+        self.assertTrue(
+            self.zb_msg.device_value_changed(
+                cached_message=None, field="state", device_value="on"
+            )
+        )
+
     @mock.patch("apps.mqtt.publish.send_message")
     @mock.patch("apps.events.models.EventTrigger.is_triggered", return_value=True)
     @mock.patch("apps.events.models.Event.is_enabled", return_value=True)
@@ -339,11 +390,18 @@ class TestZigbeeMessage(TestCase):
 
         self.assertEqual(total_log_calls, 1)
 
+    @mock.patch("apps.zigbee.models.send_messages")
     @mock.patch("apps.events.models.EventTrigger.is_triggered", return_value=True)
-    @mock.patch("apps.notifications.models.PushbulletNotification.send")
-    @mock.patch("apps.notifications.models.EmailNotification.send")
+    @mock.patch(
+        "apps.notifications.dispatch.NotificationDispatcher.send_pushbullet",
+        return_value=True,
+    )
+    @mock.patch(
+        "apps.notifications.dispatch.NotificationDispatcher.send_email",
+        return_value=True,
+    )
     def test_process_event_trigger_sends_notifications_when_enabled(
-        self, mock_email, mock_pushbullet, mock_triggered
+        self, mock_email, mock_pushbullet, mock_triggered, mock_publish
     ):
         triggers = [
             EventTriggerFactory(event=self.event, device=self.device, is_enabled=True),
@@ -364,16 +422,21 @@ class TestZigbeeMessage(TestCase):
         email = EmailNotificationFactory(notification=em_notification)
 
         self.zb_msg.check_event_triggers()
+        OutboxWorker().process_batch()
         total_em = mock_email.call_count
         total_pb = mock_pushbullet.call_count
 
         self.assertEqual(total_em, 1)
         self.assertEqual(total_pb, 1)
 
+    @mock.patch("apps.zigbee.models.send_messages")
     @mock.patch("apps.events.models.EventTrigger.is_triggered", return_value=True)
-    @mock.patch("apps.notifications.models.PushbulletNotification.send")
+    @mock.patch(
+        "apps.notifications.dispatch.NotificationDispatcher.send_pushbullet",
+        return_value=True,
+    )
     def test_process_event_trigger_sends_notifications_for_each_event(
-        self, mock_pushbullet, mock_triggered
+        self, mock_pushbullet, mock_triggered, mock_publish
     ):
         second_event = EventFactory(
             user=self.user, is_enabled=True, send_notification=True
@@ -394,15 +457,23 @@ class TestZigbeeMessage(TestCase):
         pushbullet = PushbulletNotificationFactory(notification=pb_notification)
 
         self.zb_msg.check_event_triggers()
+        OutboxWorker().process_batch()
         total_pb = mock_pushbullet.call_count
 
         self.assertEqual(total_pb, 2)
 
+    @mock.patch("apps.zigbee.models.send_messages")
     @mock.patch("apps.events.models.EventTrigger.is_triggered", return_value=True)
-    @mock.patch("apps.notifications.models.PushbulletNotification.send")
-    @mock.patch("apps.notifications.models.EmailNotification.send")
+    @mock.patch(
+        "apps.notifications.dispatch.NotificationDispatcher.send_pushbullet",
+        return_value=True,
+    )
+    @mock.patch(
+        "apps.notifications.dispatch.NotificationDispatcher.send_email",
+        return_value=True,
+    )
     def test_process_event_trigger_does_not_send_notifications_when_disabled(
-        self, mock_email, mock_pushbullet, mock_triggered
+        self, mock_email, mock_pushbullet, mock_triggered, mock_publish
     ):
         EventTriggerFactory(event=self.event, device=self.device, is_enabled=True),
 
@@ -420,6 +491,7 @@ class TestZigbeeMessage(TestCase):
         email = EmailNotificationFactory(notification=em_notification)
 
         self.zb_msg.check_event_triggers()
+        OutboxWorker().process_batch()
 
         total_em = mock_email.call_count
         total_pb = mock_pushbullet.call_count
@@ -445,8 +517,93 @@ class TestZigbeeMessage(TestCase):
         self.assertEqual(total_calls, 3)
 
 
+class TestZigbeeMessageDigest(TestCase):
+    def test_digest_ignores_payload_key_order(self):
+        digest_1 = ZigbeeMessage.get_digest(
+            topic="topic", payload=json.dumps({"a": 1, "b": 2})
+        )
+        digest_2 = ZigbeeMessage.get_digest(topic="topic", payload={"b": 2, "a": 1})
+
+        self.assertEqual(digest_1, digest_2)
+
+    def test_digest_includes_topic(self):
+        payload = {"a": 1}
+
+        self.assertNotEqual(
+            ZigbeeMessage.get_digest(topic="topic-1", payload=payload),
+            ZigbeeMessage.get_digest(topic="topic-2", payload=payload),
+        )
+
+    def test_digest_does_not_depend_on_configured_codec(self):
+        # digests already stored must match those of new messages
+        expected = "1e6fbf6ab211b4ba68d0c2e1c33c3e2124db57b42d8e3234a6d0823528a2dc6b"
+
+        for name in ("json", "orjson", "ujson"):
+            with self.subTest(codec=name):
+                with mock.patch("apps.mqtt.codec._codec", codec.get_codec(name)):
+                    self.assertEqual(
+                        ZigbeeMessage.get_digest(
+                            topic="topic", payload='{"b": "\u00e9", "a": 1.5}'
+                        ),
+                        expected,
+                    )
+
+    def test_digest_is_populated_on_save(self):
+        zb_msg = ZigbeeMessageFactory(raw_message=json.dumps({"a": 1}))
+
+        self.assertEqual(
+            zb_msg.message_digest,
+            ZigbeeMessage.get_digest(topic=zb_msg.topic, payload={"a": 1}),
+        )
+        self.assertTrue(ZigbeeMessage.is_duplicate(zb_msg.message_digest))
+
+
 class TestZigbeeLog(TestCase):
     def test_string_output(self):
         log = ZigbeeLogFactory()
 
         self.assertEqual(str(log), f"{log.metadata_type}={log.metadata_value}")
+
+
+class TestDeviceLatestState(TestCase):
+    def setUp(self) -> None:
+        self.zb_device = ZigbeeDeviceFactory()
+
+    def upsert(self, payload, created_at=None):
+        message = ZigbeeMessageFactory(zigbee_device=self.zb_device)
+        if created_at:
+            message.created_at = created_at
+        DeviceLatestState.objects.upsert(message, payload)
+        return message
+
+    def test_fields_are_merged_with_newest_values(self):
+        self.upsert({"state": "ON", "temperature": 20})
+        message = self.upsert({"temperature": 21, "battery": 90, "empty": ""})
+
+        latest_state = DeviceLatestState.objects.get(pk=self.zb_device.pk)
+
+        self.assertEqual(
+            [(field, value) for field, value, _ in latest_state.get_fields()],
+            [("battery", 90), ("state", "ON"), ("temperature", 21)],
+        )
+        self.assertEqual(latest_state.last_message, message)
+        self.assertEqual(latest_state.last_message_at, message.created_at)
+
+    def test_older_message_does_not_overwrite_state(self):
+        message = self.upsert({"state": "ON"})
+        self.upsert(
+            {"state": "OFF"},
+            created_at=message.created_at - datetime.timedelta(seconds=5),
+        )
+
+        latest_state = DeviceLatestState.objects.get(pk=self.zb_device.pk)
+
+        self.assertEqual(latest_state.state["state"]["value"], "ON")
+        self.assertEqual(latest_state.last_message, message)
+
+    def test_message_without_device_is_ignored(self):
+        message = ZigbeeMessageFactory(zigbee_device=None, topic="unknown")
+
+        DeviceLatestState.objects.upsert(message, {"state": "ON"})
+
+        self.assertFalse(DeviceLatestState.objects.exists())
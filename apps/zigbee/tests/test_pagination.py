@@ -0,0 +1,110 @@
+from django.core.paginator import InvalidPage
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from ...pagination import CursorPaginator
+from ...users.tests.factories import UserFactory
+from ..models import ZigbeeMessage
+from .factories import ZigbeeDeviceFactory, ZigbeeMessageFactory
+
+
+class TestCursorPaginator(TestCase):
+    def setUp(self) -> None:
+        zb_device = ZigbeeDeviceFactory()
+        for _ in range(7):
+            ZigbeeMessageFactory(zigbee_device=zb_device)
+
+        # messages received at the same time are ordered by pk
+        ZigbeeMessage.objects.update(created_at=timezone.now())
+        self.queryset = ZigbeeMessage.objects.all()
+        self.newest_first = list(self.queryset.order_by("-created_at", "-pk"))
+
+    def test_pages_follow_key_order(self):
+        paginator = CursorPaginator(self.queryset, per_page=3)
+
+        first = paginator.page()
+        second = paginator.page(first.next_cursor)
+        third = paginator.page(second.next_cursor)
+
+        self.assertEqual([*first, *second, *third], self.newest_first)
+        self.assertTrue(second.has_previous() and second.has_next())
+        self.assertFalse(third.has_next())
+        self.assertIsNone(third.next_cursor)
+
+    def test_previous_cursor_returns_page_before(self):
+        paginator = CursorPaginator(self.queryset, per_page=3)
+        first = paginator.page()
+        second = paginator.page(first.next_cursor)
+
+        previous = paginator.page(second.previous_cursor)
+
+        self.assertEqual(list(previous), list(first))
+        self.assertFalse(previous.has_previous())
+        self.assertTrue(previous.has_next())
+
+    def test_ascending_order(self):
+        paginator = CursorPaginator(self.queryset, per_page=4, descending=False)
+
+        first = paginator.page()
+        second = paginator.page(first.next_cursor)
+
+        self.assertEqual([*first, *second], self.newest_first[::-1])
+
+    def test_invalid_cursor_raises_invalid_page(self):
+        paginator = CursorPaginator(self.queryset, per_page=3)
+
+        for cursor in ("invalid", "WyJ4IiwgMV0="):
+            with self.assertRaises(InvalidPage):
+                paginator.page(cursor)
+
+    def test_total_is_only_counted_when_estimated(self):
+        self.assertIsNone(CursorPaginator(self.queryset, per_page=3).count)
+        self.assertEqual(
+            CursorPaginator(self.queryset, per_page=3, estimate_total=True).count, 7
+        )
+
+    def test_pages_are_fetched_with_one_query(self):
+        paginator = CursorPaginator(self.queryset, per_page=3)
+        cursor = paginator.page().next_cursor
+
+        with self.assertNumQueries(1):
+            paginator.page(cursor)
+
+
+class TestZigbeeMessageAdmin(TestCase):
+    def setUp(self) -> None:
+        self.user = UserFactory(is_staff=True, is_superuser=True)
+        self.client.force_login(user=self.user)
+        self.url = reverse("admin:zigbee_zigbeemessage_changelist")
+
+        zb_device = ZigbeeDeviceFactory()
+        for _ in range(3):
+            ZigbeeMessageFactory(zigbee_device=zb_device)
+
+    def get_total_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_change_list_is_paged_by_cursor(self):
+        _, response = self.get_total_queries(self.url)
+        change_list = response.context["cl"]
+
+        self.assertEqual(change_list.result_count, 3)
+        self.assertFalse(change_list.page.has_next())
+        self.assertNotContains(response, "?cursor=")
+
+    def test_later_pages_run_the_same_queries(self):
+        for _ in range(150):
+            ZigbeeMessageFactory()
+
+        first_queries, response = self.get_total_queries(self.url)
+        next_page_url = response.context["cl"].next_page_url
+        next_queries, response = self.get_total_queries(f"{self.url}{next_page_url}")
+
+        self.assertTrue(response.context["cl"].page.has_previous())
+        self.assertEqual(next_queries, first_queries)
@@ -0,0 +1,44 @@
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+
+from ..seen import LastSeenRecorder
+from .factories import ZigbeeDeviceFactory
+
+
+class TestLastSeenRecorder(TestCase):
+    def setUp(self) -> None:
+        self.zb_device = ZigbeeDeviceFactory()
+        self.recorder = LastSeenRecorder(interval=60)
+
+    def test_first_message_updates_last_seen_at(self):
+        seen_at = timezone.now()
+
+        self.assertTrue(self.recorder.record(self.zb_device.pk, seen_at))
+
+        self.zb_device.refresh_from_db()
+        self.assertEqual(self.zb_device.last_seen_at, seen_at)
+
+    def test_updates_are_throttled_per_device(self):
+        other_device = ZigbeeDeviceFactory()
+        first_seen = timezone.now()
+
+        self.recorder.record(self.zb_device.pk, first_seen)
+        with self.assertNumQueries(1):
+            self.assertFalse(self.recorder.record(self.zb_device.pk, timezone.now()))
+            self.assertTrue(self.recorder.record(other_device.pk, timezone.now()))
+
+        self.zb_device.refresh_from_db()
+        self.assertEqual(self.zb_device.last_seen_at, first_seen)
+
+    @mock.patch("apps.zigbee.seen.time.monotonic")
+    def test_device_is_updated_again_after_interval(self, mock_monotonic):
+        mock_monotonic.side_effect = [100, 161]
+        last_seen = timezone.now()
+
+        self.recorder.record(self.zb_device.pk, timezone.now())
+        self.assertTrue(self.recorder.record(self.zb_device.pk, last_seen))
+
+        self.zb_device.refresh_from_db()
+        self.assertEqual(self.zb_device.last_seen_at, last_seen)
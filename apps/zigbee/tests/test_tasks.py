@@ -0,0 +1,196 @@
+import json
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import DatabaseError
+from django.test import TestCase
+
+from ...devices.tests.factories import DeviceFactory
+from ...events.models import EventTriggerLog
+from ...events.tests.factories import (
+    EventFactory,
+    EventResponseFactory,
+    EventTriggerFactory,
+)
+from ...mqtt.publish import MQTTPublishError
+from ...notifications.models import NotificationOutbox, OutboxStatus
+from ...notifications.tests.factories import NotificationSettingFactory
+from ...users.tests.factories import UserFactory
+from ...utils import TaskInProgress, TaskProgress
+from ..tasks import PUBLISHED, handle_event_trigger
+from .factories import ZigbeeDeviceFactory, ZigbeeMessageFactory
+
+
+class TestHandleEventTrigger(TestCase):
+    def setUp(self) -> None:
+        self.user = UserFactory()
+        self.device = DeviceFactory(user=self.user)
+        self.zb_device = ZigbeeDeviceFactory(device=self.device)
+        self.zb_msg = ZigbeeMessageFactory(
+            zigbee_device=self.zb_device, raw_message=json.dumps({"state": "on"})
+        )
+        self.event = EventFactory(
+            user=self.user, is_enabled=True, send_notification=True
+        )
+        self.trigger = EventTriggerFactory(
+            event=self.event,
+            device=self.device,
+            is_enabled=True,
+            metadata_field="state",
+        )
+
+    def get_progress(self):
+        return TaskProgress(f"event-trigger:{self.zb_msg.pk}:{self.trigger.pk}")
+
+    def run_task(self, send_notifications=True):
+        handle_event_trigger(
+            message_id=self.zb_msg.pk,
+            trigger_id=self.trigger.pk,
+            notification_message="message",
+            send_notifications=send_notifications,
+        )
+
+    @mock.patch("apps.zigbee.models.ZigbeeMessage.invoke_notifications")
+    @mock.patch("apps.zigbee.models.ZigbeeMessage.log_event_response")
+    @mock.patch("apps.zigbee.models.ZigbeeMessage.invoke_event_response", autospec=True)
+    def test_task_invokes_responses_and_notifications_for_message_user(
+        self, mock_response, mock_log, mock_notifications
+    ):
+        self.run_task()
+
+        message = mock_response.call_args.args[0]
+        self.assertEqual(message.user, self.user)
+        self.assertEqual(mock_response.call_args.kwargs["triggered_by"], self.trigger)
+        mock_log.assert_called_once_with(
+            triggered_by=self.trigger, commands=mock_response.return_value
+        )
+        mock_notifications.assert_called_once_with(
+            topic=self.event.notification_topic,
+            message="message",
+            triggered_by=self.trigger,
+            trigger_log=mock_log.return_value,
+        )
+
+    @mock.patch("apps.zigbee.models.ZigbeeMessage.invoke_notifications")
+    @mock.patch("apps.zigbee.models.ZigbeeMessage.invoke_event_response")
+    def test_task_is_idempotent(self, mock_response, mock_notifications):
+        self.run_task()
+        self.run_task()
+
+        self.assertEqual(mock_response.call_count, 1)
+        self.assertEqual(mock_notifications.call_count, 1)
+
+    @mock.patch("apps.zigbee.models.send_messages")
+    def test_notifications_are_queued_with_trigger_log(self, mock_publish):
+        notification = NotificationSettingFactory(user=self.user, is_enabled=True)
+        EventResponseFactory(event=self.event, is_enabled=True)
+
+        self.run_task()
+
+        entry = NotificationOutbox.objects.get()
+        self.assertEqual(entry.medium, notification)
+        self.assertEqual(entry.status, OutboxStatus.PENDING)
+        self.assertEqual(entry.trigger_log, EventTriggerLog.objects.get())
+        self.assertEqual(entry.event, self.event)
+
+    @mock.patch("apps.zigbee.models.send_messages")
+    def test_nothing_is_written_when_commands_cannot_be_published(self, mock_publish):
+        NotificationSettingFactory(user=self.user, is_enabled=True)
+        EventResponseFactory(event=self.event, is_enabled=True)
+        mock_publish.side_effect = [MQTTPublishError("broker down"), None]
+
+        with self.assertRaises(MQTTPublishError):
+            self.run_task()
+
+        self.assertFalse(EventTriggerLog.objects.exists())
+        self.assertFalse(NotificationOutbox.objects.exists())
+
+        # the claim is released, so the retry publishes and records the response
+        self.run_task()
+
+        self.assertEqual(mock_publish.call_count, 2)
+        self.assertEqual(
+            NotificationOutbox.objects.get().trigger_log, EventTriggerLog.objects.get()
+        )
+
+    @mock.patch("apps.zigbee.models.send_messages")
+    def test_commands_are_not_published_again_after_database_error(self, mock_publish):
+        EventResponseFactory(event=self.event, is_enabled=True)
+
+        with mock.patch(
+            "apps.zigbee.models.ZigbeeMessage.log_event_response",
+            side_effect=DatabaseError("database down"),
+        ):
+            with self.assertRaises(DatabaseError):
+                self.run_task()
+        self.run_task()
+
+        self.assertEqual(mock_publish.call_count, 1)
+        self.assertTrue(EventTriggerLog.objects.exists())
+
+    @mock.patch("apps.zigbee.models.send_messages")
+    def test_task_resumes_after_worker_died_before_recording(self, mock_publish):
+        NotificationSettingFactory(user=self.user, is_enabled=True)
+        commands = [{"topic": "zigbee2mqtt/device/set", "payload": {"state": "ON"}}]
+        # the commands were published, then the worker died - its claim has expired
+        self.get_progress().record(PUBLISHED, commands)
+
+        self.run_task()
+
+        mock_publish.assert_not_called()
+        trigger_log = EventTriggerLog.objects.get()
+        self.assertEqual(trigger_log.response_command, str(commands))
+        self.assertEqual(NotificationOutbox.objects.get().trigger_log, trigger_log)
+
+    @mock.patch("apps.zigbee.models.ZigbeeMessage.invoke_event_response")
+    def test_task_is_retried_while_another_run_holds_the_claim(self, mock_response):
+        progress = self.get_progress()
+        cache.add(progress.claim_key, True)
+        self.addCleanup(cache.delete, progress.claim_key)
+
+        with self.assertRaises(TaskInProgress):
+            self.run_task()
+
+        mock_response.assert_not_called()
+
+    def test_task_retries_publish_and_database_errors(self):
+        self.assertIn(MQTTPublishError, handle_event_trigger.autoretry_for)
+        self.assertIn(DatabaseError, handle_event_trigger.autoretry_for)
+
+    def test_notifications_are_queued_once_per_message_and_trigger(self):
+        NotificationSettingFactory(user=self.user, is_enabled=True)
+        self.zb_msg.user = self.user
+
+        queued = [
+            self.zb_msg.invoke_notifications(
+                topic="topic", message="message", triggered_by=self.trigger
+            )
+            for _ in range(2)
+        ]
+
+        self.assertEqual(queued, [1, 0])
+        self.assertEqual(NotificationOutbox.objects.count(), 1)
+
+    @mock.patch("apps.zigbee.models.ZigbeeMessage.invoke_event_response")
+    def test_task_can_be_retried_after_failure(self, mock_response):
+        mock_response.side_effect = [RuntimeError("broker down"), None]
+
+        with self.assertRaises(RuntimeError):
+            self.run_task(send_notifications=False)
+        self.run_task(send_notifications=False)
+
+        self.assertEqual(mock_response.call_count, 2)
+
+    @mock.patch("apps.events.models.EventTrigger.is_triggered", return_value=True)
+    @mock.patch("apps.zigbee.tasks.handle_event_trigger.delay")
+    @mock.patch("apps.zigbee.models.ZigbeeMessage.invoke_event_response")
+    def test_check_event_triggers_only_enqueues_task(
+        self, mock_response, mock_delay, mock_triggered
+    ):
+        self.zb_msg.check_event_triggers()
+
+        mock_response.assert_not_called()
+        mock_delay.assert_called_once()
+        self.assertEqual(mock_delay.call_args.kwargs["message_id"], self.zb_msg.pk)
+        self.assertEqual(mock_delay.call_args.kwargs["trigger_id"], self.trigger.pk)
+        self.assertTrue(mock_delay.call_args.kwargs["send_notifications"])
@@ -0,0 +1,166 @@
+"""Times the device time series endpoint - reading a field's values from the database and
+downsampling them for a chart.
+
+A device with a temperature sensor reporting every 10 seconds (with noise, the odd spike and
+a text field alongside) is written to a test database created for the run, and dropped after
+it. The series is then read the way DeviceSeriesJson reads it - ZigbeeLog.objects.get_series()
+streamed into arrays by downsample.read_series() - and reduced to the default number of
+points with each method in zigbee/downsample.py, with NumPy when it is installed and with the
+pure Python fallback. The query plan is printed so the index used can be checked.
+
+Needs the project database settings (DATABASE_URL) - run from the project root:
+    python benchmarks/bench_downsample.py [--rows 10000 100000 1000000] [--points 1000]
+"""
+import argparse
+import datetime
+import os
+import sys
+import time
+from unittest import mock
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "smarthub.settings")
+
+START = datetime.datetime(2021, 9, 1, tzinfo=datetime.timezone.utc)
+FIELD = "temperature"
+CHUNK_SIZE = 10000
+
+INSERT_MESSAGES = """
+INSERT INTO zigbee_zigbeemessage
+    (uuid, created_at, updated_at, zigbee_device_id, raw_message, topic)
+SELECT
+    md5('message' || number)::uuid,
+    %(start)s + number * interval '10 seconds',
+    %(start)s + number * interval '10 seconds',
+    %(zigbee_device_id)s,
+    jsonb_build_object(
+        'temperature',
+        round((20 + 5 * sin(number / 8640.0) + random() * 0.4
+            + CASE WHEN random() < 0.0001 THEN 15 ELSE 0 END)::numeric, 2),
+        'state',
+        'ON'
+    ),
+    'zigbee2mqtt/bench-sensor'
+FROM generate_series(0, %(total)s - 1) number
+"""
+
+# the logs the ingest process writes for each message - see MQTTMessage.parse_message
+INSERT_LOGS = """
+INSERT INTO zigbee_zigbeelog
+    (uuid, created_at, updated_at, broker_message_id, metadata_type, metadata_value,
+     numeric_value, zigbee_device_id, received_at)
+SELECT
+    md5('log' || message.id || field.key)::uuid,
+    message.created_at,
+    message.created_at,
+    message.id,
+    field.key,
+    field.value,
+    CASE WHEN jsonb_typeof(field.value) = 'number'
+        THEN (field.value #>> '{}')::double precision END,
+    message.zigbee_device_id,
+    message.created_at
+FROM zigbee_zigbeemessage message, jsonb_each(message.raw_message) field
+WHERE message.zigbee_device_id = %(zigbee_device_id)s
+"""
+
+
+def populate(zigbee_device_id: int, total: int) -> None:
+    """Replace the device's messages with total messages (and their logs)"""
+    # pylint: disable=import-outside-toplevel
+    from django.db import connection
+
+    params = {"start": START, "zigbee_device_id": zigbee_device_id, "total": total}
+    with connection.cursor() as cursor:
+        cursor.execute("TRUNCATE zigbee_zigbeelog, zigbee_zigbeemessage CASCADE")
+        cursor.execute(INSERT_MESSAGES, params)
+        cursor.execute(INSERT_LOGS, params)
+        cursor.execute("ANALYZE zigbee_zigbeemessage, zigbee_zigbeelog")
+
+
+def get_series(device):
+    """The series query of DeviceSeriesJson, for the whole range"""
+    # pylint: disable=import-outside-toplevel
+    from apps.zigbee.models import ZigbeeLog
+
+    return (
+        ZigbeeLog.objects.filter(zigbee_device__device=device)
+        .filter(received_at__gte=START)
+        .get_series(FIELD)
+    )
+
+
+def measure(device, points: int, method: str, use_numpy: bool):
+    """Return the seconds taken to read and downsample the series, and the points returned"""
+    # pylint: disable=import-outside-toplevel
+    from apps.zigbee import downsample
+
+    numpy = downsample.numpy if use_numpy else None
+    with mock.patch.object(downsample, "numpy", numpy):
+        start = time.perf_counter()
+        times, values = downsample.read_series(
+            get_series(device).iterator(chunk_size=CHUNK_SIZE)
+        )
+        read = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result = downsample.downsample(times, values, points, method)
+        reduced = time.perf_counter() - start
+
+    return read, reduced, len(result)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--points", type=int, default=1000)
+    args = parser.parse_args()
+
+    django.setup()
+
+    # pylint: disable=import-outside-toplevel
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+
+    from apps.devices.tests.factories import DeviceFactory
+    from apps.zigbee import downsample
+    from apps.zigbee.tests.factories import ZigbeeDeviceFactory
+
+    setup_test_environment()
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        device = DeviceFactory()
+        zigbee_device = ZigbeeDeviceFactory(device=device)
+
+        implementations = [("python", False)]
+        if downsample.numpy is not None:
+            implementations.insert(0, ("numpy", True))
+
+        print(f"Reading and downsampling to {args.points} points - time by series rows")
+        for total in args.rows:
+            populate(zigbee_device.pk, total)
+            # the scan of zigbee_zigbeelog should use the zigbeelog_series index
+            for line in get_series(device).explain().splitlines():
+                if "zigbee_zigbeelog" in line:
+                    print(f"{total:>9} rows  plan: {line.strip()}")
+
+            for method in downsample.METHODS:
+                for label, use_numpy in implementations:
+                    read, reduced, returned = measure(
+                        device, args.points, method, use_numpy
+                    )
+                    print(
+                        f"{total:>9} rows  {method:<6} {label:<6} "
+                        f"read {read * 1000:8.1f}ms  "
+                        f"downsample {reduced * 1000:7.1f}ms  "
+                        f"total {(read + reduced) * 1000:8.1f}ms  {returned:>5} points"
+                    )
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == "__main__":
+    main()
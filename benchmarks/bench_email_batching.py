@@ -0,0 +1,95 @@
+"""Compares sending notification emails with a new SMTP connection per email (previous
+behaviour) against the EmailBatcher, which reuses one connection and sends queued emails
+together.
+
+A stand-in SMTP server (apps/notifications/tests/smtp.py) runs locally - use --latency to
+simulate the round trip for each SMTP command.
+
+Run from the project root:
+    python benchmarks/bench_email_batching.py [--emails 50] [--latency 0.005]
+"""
+import argparse
+import os
+import sys
+import time
+
+import django
+from django.conf import settings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from apps.notifications.tests.smtp import StubSMTPServer  # noqa: E402
+
+
+def configure(server: StubSMTPServer) -> None:
+    settings.configure(
+        EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend",
+        EMAIL_HOST=server.host,
+        EMAIL_PORT=server.port,
+    )
+    django.setup()
+
+
+def make_email(number: int):
+    from django.core.mail import EmailMessage
+
+    return EmailMessage(
+        subject="Motion detected",
+        body=f"Motion detected by sensor {number}",
+        from_email="hub@example.com",
+        to=[f"user-{number}@example.com"],
+    )
+
+
+def send_with_new_connection(emails) -> None:
+    """Previous behaviour - send_mail() opens (and closes) a connection per email"""
+    for email in emails:
+        email.send()
+
+
+def send_with_batcher(batcher, emails) -> None:
+    """Current behaviour - queue every email, then wait for them to be sent"""
+    futures = [batcher.send(email) for email in emails]
+    for future in futures:
+        future.result(timeout=30)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--emails", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.005)
+    args = parser.parse_args()
+
+    server = StubSMTPServer(latency=args.latency).start()
+    configure(server)
+
+    from apps.notifications.mail import EmailBatcher
+
+    batcher = EmailBatcher(window=0.01)
+    emails = [make_email(number) for number in range(args.emails)]
+
+    print(f"{args.emails} emails, SMTP latency {args.latency * 1000:.1f}ms per command")
+
+    for label, run in (
+        ("connection per email", send_with_new_connection),
+        (
+            "batched, shared connection",
+            lambda emails: send_with_batcher(batcher, emails),
+        ),
+    ):
+        connections = server.connections
+        start = time.perf_counter()
+        run(emails)
+        elapsed = time.perf_counter() - start
+        print(
+            f"{label:<28} {elapsed * 1000:9.1f}ms  {args.emails / elapsed:7.0f} emails/s  "
+            f"{server.connections - connections} connections"
+        )
+
+    batcher.close()
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Times the MQTT ingest path with each installed JSON codec, and counts the payload parses.
+
+Messages for a device with two event triggers (which are evaluated but never fire) are run
+through MQTTMessage - the handler the ingest workers call - against a test database created
+for the run, and dropped after it. Each message has a different temperature, so none of them
+is skipped as a duplicate or as unchanged. codec.loads() and codec.dumps() are wrapped (as in
+apps/mqtt/tests/test_mqtt.py) for one pass to count the calls the ingest path actually makes
+per message; the timed pass runs unwrapped.
+
+Needs the project database settings (DATABASE_URL) - run from the project root:
+    python benchmarks/bench_json_codec.py [--messages 2000]
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from unittest import mock
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "smarthub.settings")
+
+FRIENDLY_NAME = "bench sensor"
+TOPIC = f"zigbee2mqtt/{FRIENDLY_NAME}"
+TRIGGER_FIELDS = ("battery", "humidity")
+
+
+def get_payload(number: int) -> bytes:
+    """A sensor message - the temperature differs for every message number"""
+    return json.dumps(
+        {
+            "battery": 100,
+            "humidity": 57.21,
+            "linkquality": 123,
+            "pressure": 1012.5,
+            "temperature": round(20 + number * 0.01, 2),
+            "voltage": 3025,
+            "last_seen": "2021-09-01T12:00:00+01:00",
+            "update": {"state": "idle"},
+        }
+    ).encode("utf-8")
+
+
+def clear_messages() -> None:
+    """Remove the messages (and state) of the previous run so every message is ingested"""
+    # pylint: disable=import-outside-toplevel
+    from django.core.cache import cache
+    from django.db import connection
+
+    with connection.cursor() as cursor:
+        cursor.execute("TRUNCATE zigbee_zigbeelog, zigbee_zigbeemessage CASCADE")
+    cache.clear()
+
+
+def ingest(start: int, total: int) -> None:
+    """Run total messages through the ingest handler"""
+    # pylint: disable=import-outside-toplevel
+    from apps.mqtt.management.commands.mqtt import MQTTMessage
+
+    for number in range(start, start + total):
+        MQTTMessage(topic=TOPIC, payload=get_payload(number))
+
+
+def count_calls(start: int, total: int):
+    """Return the codec.loads() and codec.dumps() calls per message"""
+    # pylint: disable=import-outside-toplevel
+    from apps.mqtt import codec
+
+    with mock.patch.object(codec, "loads", wraps=codec.loads) as loads:
+        with mock.patch.object(codec, "dumps", wraps=codec.dumps) as dumps:
+            ingest(start, total)
+
+    return loads.call_count / total, dumps.call_count / total
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=2000)
+    args = parser.parse_args()
+
+    django.setup()
+
+    # pylint: disable=import-outside-toplevel
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+
+    from apps.devices.tests.factories import DeviceFactory
+    from apps.events.models import EventTriggerType
+    from apps.events.tests.factories import EventFactory, EventTriggerFactory
+    from apps.mqtt import codec
+    from apps.zigbee.tests.factories import ZigbeeDeviceFactory
+
+    logging.disable(logging.INFO)
+    setup_test_environment()
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        device = DeviceFactory()
+        ZigbeeDeviceFactory(device=device, friendly_name=FRIENDLY_NAME)
+        event = EventFactory()
+        for field in TRIGGER_FIELDS:
+            EventTriggerFactory(
+                event=event,
+                device=device,
+                metadata_field=field,
+                metadata_trigger_value="0",
+                trigger_type=EventTriggerType.LESS_THAN,
+            )
+
+        print(f"{args.messages} messages, {len(TRIGGER_FIELDS)} event triggers")
+        print(f"{'codec':<8} {'loads/msg':>9} {'dumps/msg':>9} {'us/msg':>9}")
+
+        # no trigger fires - the task is patched out in case one does
+        with mock.patch("apps.zigbee.tasks.handle_event_trigger.delay"):
+            for name in ("json", "ujson", "orjson"):
+                selected = codec.get_codec(name)
+                if selected.name != name:
+                    print(f"{name:<8} not installed")
+                    continue
+
+                with mock.patch.object(codec, "_codec", selected):
+                    clear_messages()
+                    loads, dumps = count_calls(0, min(args.messages, 100))
+
+                    clear_messages()
+                    start = time.perf_counter()
+                    ingest(0, args.messages)
+                    seconds = time.perf_counter() - start
+
+                print(
+                    f"{name:<8} {loads:>9.2f} {dumps:>9.2f} "
+                    f"{seconds / args.messages * 1_000_000:>9.1f}"
+                )
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Compares the peak memory of exporting device logs as CSV before and after streaming.
+
+The 'buffered' figures replay the previous export - every message loaded into memory and the
+whole CSV file written into one HttpResponse. The 'streamed' figures are the current export -
+rows from a generator (standing in for QuerySet.iterator()) written by exports.iter_csv and
+sent a buffer at a time. Peak memory is measured with tracemalloc; the streamed figure should
+stay flat as the number of rows grows.
+
+Run from the project root:
+    python benchmarks/bench_log_export.py [--rows 10000 100000 500000] [--gzip]
+"""
+import argparse
+import datetime
+import os
+import sys
+import time
+import tracemalloc
+
+import django
+from django.conf import settings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# imported here, so that module imports are not counted in the streamed peak
+from apps.devices import exports  # noqa: E402 pylint: disable=wrong-import-position
+
+HEADER = ["Created At", "Raw Message"]
+START = datetime.datetime(2021, 9, 1, tzinfo=datetime.timezone.utc)
+
+
+def generate_rows(total: int):
+    """Yield (created_at, raw_message) rows like those of a power meter"""
+    for number in range(total):
+        yield (
+            START + datetime.timedelta(seconds=number * 10),
+            {"power": number % 3000, "energy": number / 1000, "linkquality": 120},
+        )
+
+
+def export_buffered(total: int, compress: bool) -> int:
+    """Previous behaviour - returns the number of bytes sent"""
+    import csv
+    import gzip
+
+    from django.http import HttpResponse
+
+    rows = list(generate_rows(total))
+    response = HttpResponse(content_type="text/csv")
+    writer = csv.writer(response, dialect="excel", quoting=csv.QUOTE_ALL)
+    response.write("sep=,\r\n")
+    writer.writerow(HEADER)
+    for row in rows:
+        writer.writerow(row)
+
+    content = response.content
+    if compress:
+        content = gzip.compress(content)
+    return len(content)
+
+
+def export_streamed(total: int, compress: bool) -> int:
+    """Current behaviour - returns the number of bytes sent"""
+    response = exports.streaming_response(
+        exports.iter_csv(generate_rows(total), HEADER),
+        filename="zigbee-messages.csv",
+        content_type="text/csv",
+        compress=compress,
+    )
+    return sum(len(chunk) for chunk in response.streaming_content)
+
+
+def measure(run, total: int, compress: bool):
+    tracemalloc.start()
+    start = time.perf_counter()
+    sent = run(total, compress)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, sent
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 500000])
+    parser.add_argument("--gzip", action="store_true")
+    args = parser.parse_args()
+
+    settings.configure()
+    django.setup()
+
+    print(f"CSV export{' (gzip)' if args.gzip else ''} - peak memory by rows exported")
+    for total in args.rows:
+        for label, run in (
+            ("buffered", export_buffered),
+            ("streamed", export_streamed),
+        ):
+            elapsed, peak, sent = measure(run, total, args.gzip)
+            print(
+                f"{total:>9} rows  {label:<9} {peak / 2 ** 20:9.1f}MiB peak  "
+                f"{elapsed * 1000:9.1f}ms  {sent / 2 ** 20:8.1f}MiB sent"
+            )
+
+
+if __name__ == "__main__":
+    main()
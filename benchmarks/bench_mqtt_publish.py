@@ -0,0 +1,96 @@
+"""Compares publishing commands with a new broker connection per message (previous behaviour)
+against the shared, long-lived publisher.
+
+A stand-in broker (apps/mqtt/tests/broker.py) runs locally - use --ack-delay to simulate the
+time the broker/network takes to acknowledge each message.
+
+Run from the project root:
+    python benchmarks/bench_mqtt_publish.py [--commands 50] [--batch 20] [--ack-delay 0.005]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import paho.mqtt.client as mqtt
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from apps.mqtt.publish import MQTTPublisher, wait_for_delivery  # noqa: E402
+from apps.mqtt.tests.broker import StubBroker  # noqa: E402
+
+TOPIC = "zigbee2mqtt/device-{}/set"
+PAYLOAD = json.dumps({"state": "TOGGLE"})
+
+
+def publish_with_new_connection(broker: StubBroker, topic: str) -> None:
+    """Previous behaviour - connect, publish once, wait for ack, disconnect"""
+    client = mqtt.Client(f"bench-{time.monotonic_ns()}")
+    client.on_connect = lambda client, *args: client.publish(topic, PAYLOAD, 1)
+    client.on_publish = lambda client, *args: client.disconnect()
+    client.connect(broker.host, broker.port)
+    client.loop_forever()
+
+
+def publish_with_shared_connection(publisher: MQTTPublisher, topics) -> None:
+    """Current behaviour - all messages in flight on one connection, then wait for acks"""
+    futures = [publisher.publish(topic, PAYLOAD) for topic in topics]
+    wait_for_delivery(futures, timeout=30)
+
+
+def report(label: str, timings: list, messages: int) -> None:
+    total = sum(timings)
+    print(
+        f"{label:<34} p50={statistics.median(timings) * 1000:8.2f}ms "
+        f"max={max(timings) * 1000:8.2f}ms  {messages / total:9.0f} msg/s"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--commands", type=int, default=50)
+    parser.add_argument("--batch", type=int, default=20)
+    parser.add_argument("--ack-delay", type=float, default=0.005)
+    args = parser.parse_args()
+
+    broker = StubBroker(ack_delay=args.ack_delay).start()
+    publisher = MQTTPublisher(server=broker.host, port=broker.port)
+    publisher.connect(timeout=5)
+
+    print(
+        f"{args.commands} commands, batches of {args.batch}, "
+        f"broker ack delay {args.ack_delay * 1000:.1f}ms"
+    )
+
+    topics = [TOPIC.format(number) for number in range(args.batch)]
+    batches = max(1, args.commands // args.batch)
+
+    def per_message(batch):
+        for topic in batch:
+            publish_with_new_connection(broker, topic)
+
+    def shared(batch):
+        publish_with_shared_connection(publisher, batch)
+
+    for label, run, batch, repeat in (
+        ("single - connection per message", per_message, topics[:1], args.commands),
+        ("single - shared connection", shared, topics[:1], args.commands),
+        ("batch - connection per message", per_message, topics, batches),
+        ("batch - shared connection", shared, topics, batches),
+    ):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run(batch)
+            timings.append(time.perf_counter() - start)
+        report(label, timings, repeat * len(batch))
+
+    publisher.disconnect()
+    broker.stop()
+
+
+if __name__ == "__main__":
+    main()